@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class Overloaded(Exception):
+    """排隊人數已達上限，直接拒絕 (不要讓請求卡在資料庫等到逾時)"""
+    pass
+
+
+class WaitingRoom:
+    """
+    結帳的虛擬排隊室 (admission control)
+    - 每個場次同時最多 limit 個結帳在執行，其他人依先來後到 (FIFO) 排隊
+    - 排隊的使用者以輪詢取得目前順位與預估等待秒數；輪到時再送出一次結帳
+    - 任一場次的隊伍超過 max_queue 人時，新的結帳直接拒絕 (Overloaded)
+    - 超過 idle_timeout 秒沒有輪詢的人視為已離開，自動移出隊伍
+    注意：名額與隊伍只存在單一行程中，多個 worker 時每個 worker 各自計算
+    """
+
+    def __init__(self, limit=8, max_queue=500, idle_timeout=15):
+        if limit < 1:
+            raise ValueError("limit 至少為 1")
+        self.limit = limit
+        self.max_queue = max_queue
+        self.idle_timeout = idle_timeout
+        self._active = {}      # 場次 -> 執行中的結帳數
+        self._queues = {}      # 場次 -> OrderedDict(owner -> None)，依加入順序
+        self._waiting = {}     # owner -> {'keys', 'joined', 'last_seen'}
+        self._service_time = 1.0  # 單次結帳耗時的移動平均 (秒)，用來估算等待時間
+        self._next_purge = 0
+        self._lock = threading.Lock()
+        self._stats = {'admitted': 0, 'queued': 0, 'shed': 0, 'abandoned': 0}
+
+    # --- 內部工具 (呼叫前須持有鎖) ---
+    def _ahead(self, owner, key):
+        """排在 owner 前面的人數；owner 不在隊伍中時為整個隊伍的長度"""
+        queue = self._queues.get(key)
+        if not queue:
+            return 0
+        for count, queued in enumerate(queue):
+            if queued == owner:
+                return count
+        return len(queue)
+
+    def _position(self, owner, keys):
+        """回傳 (可放行, 順位)；順位 0 代表輪到了"""
+        worst = 0
+        ready = True
+        for key in keys:
+            ahead = self._ahead(owner, key)
+            free = self.limit - self._active.get(key, 0)
+            if ahead >= free:
+                ready = False
+            worst = max(worst, ahead - max(free, 0) + 1)
+        return ready, (0 if ready else worst)
+
+    def _leave(self, owner):
+        entry = self._waiting.pop(owner, None)
+        for key in entry['keys'] if entry else ():
+            queue = self._queues.get(key)
+            if queue is not None:
+                queue.pop(owner, None)
+                if not queue:
+                    del self._queues[key]
+
+    def _purge(self, now):
+        if now < self._next_purge:
+            return
+        self._next_purge = now + 1
+        idle = [owner for owner, entry in self._waiting.items() if now - entry['last_seen'] > self.idle_timeout]
+        for owner in idle:
+            self._leave(owner)
+        self._stats['abandoned'] += len(idle)
+
+    # --- 對外介面 ---
+    def admit(self, owner, keys):
+        """
+        嘗試取得 keys (場次) 的結帳名額：放行回傳 True，呼叫端結帳完必須呼叫 release()
+        沒有名額時排進隊伍並回傳 False；隊伍已滿時拋出 Overloaded
+        """
+        keys = tuple(sorted(set(keys)))
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            ready, _ = self._position(owner, keys)
+            if ready:
+                self._leave(owner)
+                for key in keys:
+                    self._active[key] = self._active.get(key, 0) + 1
+                self._stats['admitted'] += 1
+                return True
+
+            entry = self._waiting.get(owner)
+            if entry is None or entry['keys'] != keys:
+                self._leave(owner)
+                if any(len(self._queues.get(key, ())) >= self.max_queue for key in keys):
+                    self._stats['shed'] += 1
+                    raise Overloaded("目前購票人數過多，請稍後再試")
+                for key in keys:
+                    self._queues.setdefault(key, OrderedDict())[owner] = None
+                entry = self._waiting[owner] = {'keys': keys, 'joined': now}
+                self._stats['queued'] += 1
+            entry['last_seen'] = now
+            return False
+
+    def release(self, keys, elapsed=None):
+        keys = tuple(sorted(set(keys)))
+        with self._lock:
+            for key in keys:
+                remaining = self._active.get(key, 0) - 1
+                if remaining > 0:
+                    self._active[key] = remaining
+                else:
+                    self._active.pop(key, None)
+            if elapsed is not None:
+                self._service_time = self._service_time * 0.8 + elapsed * 0.2
+
+    def status(self, owner):
+        """
+        排隊狀態 (同時視為一次輪詢，更新最後活動時間)
+        回傳 None 表示不在隊伍中；否則為 {'ready', 'position', 'eta_seconds', 'waited_seconds'}
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            entry = self._waiting.get(owner)
+            if entry is None:
+                return None
+            entry['last_seen'] = now
+            ready, position = self._position(owner, entry['keys'])
+            return {
+                'ready': ready,
+                'position': position,
+                'eta_seconds': round(position * self._service_time / self.limit, 1),
+                'waited_seconds': round(now - entry['joined'], 1),
+            }
+
+    def leave(self, owner):
+        with self._lock:
+            self._leave(owner)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, limit=self.limit, max_queue=self.max_queue,
+                        active=sum(self._active.values()), waiting=len(self._waiting),
+                        longest_queue=max((len(q) for q in self._queues.values()), default=0),
+                        service_time=round(self._service_time, 3))
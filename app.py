@@ -1,18 +1,52 @@
-import io
+import json
 import os
 import uuid
-import qrcode
-import pyodbc
-import pymysql.cursors
-from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, send_from_directory
+import threading
+import time
+from datetime import date, datetime, timedelta
+from flask import Flask, render_template, request, redirect, url_for, session, flash, make_response, has_request_context, get_template_attribute
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from admission import Overloaded, WaitingRoom
+from catalog_cache import CatalogCache
+from db_backends import get_dialect
+from db_pool import ConnectionPool, ReplicaRouter
+from fragment_cache import FragmentCache
+from gate_cache import GateValidationCache, ScanJournal
+from http_cache import CatalogVersion, make_etag
+from image_pipeline import ImagePipeline, image_sources
+from inventory import InventoryHolds, SeatCounter
+from pagination import KeysetList, decode_cursor, encode_cursor, parse_limit
+from purge_jobs import DELETING, ExhibitionPurger
+from qr_cache import QRCodeCache
+from row_mapping import fetch_all, fetch_one
+from sales_summary import daily_sales, exhibition_totals, grand_total, record_sales, session_sales, ticket_type_sales
+from search_index import SearchIndex
+from session_store import MemoryStore, SQLiteStore, ServerSideSessionInterface
+from ticket_ids import new_ticket_id, parse_ticket_id, ticket_id_text
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)  # 請修改為隨機字串以確保安全
 app.permanent_session_lifetime = timedelta(minutes=30)  # 設定閒置 30 分鐘自動登出
 
+# Session 改存在伺服器端，cookie 只帶 session id
+# 'memory'：單一行程內的 LRU 快取；'sqlite'：本機磁碟，多個 worker 可共用
+app.config['SESSION_BACKEND'] = 'sqlite'
+app.config['SESSION_SQLITE_PATH'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'sessions.sqlite3')
+app.config['SESSION_MEMORY_MAX_ENTRIES'] = 10000
+app.config['SESSION_PURGE_INTERVAL'] = 60      # 每隔 N 秒批次清除一次過期 session
+app.config['SESSION_PURGE_BATCH_SIZE'] = 500
+
+if app.config['SESSION_BACKEND'] == 'sqlite':
+    _session_store = SQLiteStore(app.config['SESSION_SQLITE_PATH'])
+else:
+    _session_store = MemoryStore(max_entries=app.config['SESSION_MEMORY_MAX_ENTRIES'])
+app.session_interface = ServerSideSessionInterface(
+    _session_store,
+    purge_interval=app.config['SESSION_PURGE_INTERVAL'],
+    purge_batch_size=app.config['SESSION_PURGE_BATCH_SIZE'],
+)
+
 # 圖片上傳設定
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads', 'exhibitions')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
@@ -23,6 +57,16 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 限制上傳檔案大小為 16MB
 
+# QR Code 快取設定
+app.config['QR_CACHE_MAX_ENTRIES'] = 2048
+app.config['QR_CACHE_DIR'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'qrcodes')  # 設為 None 則只用記憶體快取
+app.config['QR_CACHE_DISK_MAX_FILES'] = 50000  # 磁碟快取的檔案數上限，超過時刪除最舊的
+app.config['QR_PRERENDER_ON_CHECKOUT'] = True  # 結帳完成後於背景預先產生 QR Code
+app.config['QR_INLINE_FORMAT'] = 'svg'         # 我的票券頁直接內嵌的 QR Code 格式 (svg 不經過 PIL)
+
+qr_cache = QRCodeCache(max_entries=app.config['QR_CACHE_MAX_ENTRIES'], disk_dir=app.config['QR_CACHE_DIR'],
+                       disk_max_files=app.config['QR_CACHE_DISK_MAX_FILES'])
+
 
 def allowed_file(filename):
     """檢查檔案副檔名是否允許"""
@@ -52,8 +96,9 @@ def save_exhibition_image(file, exhibition_id=None):
 
 
 def delete_old_image(image_path):
-    """刪除舊圖片檔案"""
+    """刪除舊圖片檔案 (連同所有縮圖衍生檔)"""
     if image_path and image_path.startswith('/static/uploads/exhibitions/'):
+        image_pipeline.remove(image_path)
         filename = image_path.replace('/static/uploads/exhibitions/', '')
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         if os.path.exists(filepath):
@@ -63,34 +108,477 @@ def delete_old_image(image_path):
                 print(f"刪除舊圖片失敗: {e}")
 
 
-def get_db_connection():
+# 資料庫後端設定：'mssql' (SQL Server) 或 'sqlite' (本機檔案，開發、壓測用)
+app.config['DB_BACKEND'] = os.environ.get('DB_BACKEND', 'mssql')
+app.config['DB_SQLITE_PATH'] = os.environ.get('DB_SQLITE_PATH')  # None 則使用 instance/exhibition.sqlite3
+
+db = get_dialect(app.config['DB_BACKEND'], app.config['DB_SQLITE_PATH'])
+
+# 連線池設定 (依每個 worker 的併發量調整)
+app.config['DB_POOL_MIN_SIZE'] = 2
+app.config['DB_POOL_MAX_SIZE'] = 20
+app.config['DB_POOL_TIMEOUT'] = 5            # 借用連線最多等待秒數
+app.config['DB_POOL_MAX_USES'] = 1000        # 連線借出 N 次後回收重建
+app.config['DB_POOL_MAX_AGE'] = 30 * 60      # 連線存活 N 秒後回收重建
+app.config['DB_POOL_VALIDATE_AFTER'] = 30    # 閒置超過 N 秒，借出前先檢查連線是否存活
+
+# 讀寫分離：唯讀副本列表，以 | 分隔 (SQLite 為檔案路徑，SQL Server 為連線字串)；空的則全部走主資料庫
+app.config['DB_READ_REPLICAS'] = [target for target in os.environ.get('DB_READ_REPLICAS', '').split('|') if target]
+app.config['DB_REPLICA_RETRY_AFTER'] = 30      # 副本連線失敗後暫停使用 N 秒
+app.config['DB_READ_YOUR_WRITES_WINDOW'] = 15  # 寫入後 N 秒內，同一個使用者的讀取也走主資料庫 (涵蓋副本延遲)
+
+_db_router = None
+_db_pool_lock = threading.Lock()
+
+
+def _create_pool(creator, min_size):
+    return ConnectionPool(
+        creator,
+        min_size=min_size,
+        max_size=app.config['DB_POOL_MAX_SIZE'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        max_uses=app.config['DB_POOL_MAX_USES'],
+        max_age=app.config['DB_POOL_MAX_AGE'],
+        validate_after=app.config['DB_POOL_VALIDATE_AFTER'],
+    )
+
+
+def get_db_router():
+    """延遲建立主資料庫與各唯讀副本的連線池 (第一次使用時才連線資料庫)"""
+    global _db_router
+    if _db_router is None:
+        with _db_pool_lock:
+            if _db_router is None:
+                # 副本的連線池不預先建立連線，某個副本無法連線時不會影響啟動
+                replicas = {f"replica{i + 1}": _create_pool(db.replica(target).connect, 0)
+                            for i, target in enumerate(app.config['DB_READ_REPLICAS'])}
+                _db_router = ReplicaRouter(_create_pool(db.connect, app.config['DB_POOL_MIN_SIZE']), replicas,
+                                           retry_after=app.config['DB_REPLICA_RETRY_AFTER'])
+    return _db_router
+
+
+def mark_recent_write():
+    """目前的使用者剛寫入資料：一小段時間內讀取都走主資料庫 (read-your-writes)"""
+    session['db_primary_until'] = time.time() + app.config['DB_READ_YOUR_WRITES_WINDOW']
+
+
+def reads_from_primary():
+    return has_request_context() and session.get('db_primary_until', 0) > time.time()
+
+
+def get_db_connection(read_only=False):
+    """
+    從連線池借出連線，呼叫 conn.close() 即歸還給連線池
+    read_only=True 的請求可以交給唯讀副本 (使用者剛寫入過資料時除外)
+    """
     try:
-        return pyodbc.connect(
-            r'DRIVER={ODBC Driver 17 for SQL Server};'
-            r'SERVER=localhost\SQLEXPRESS;'
-            r'DATABASE=ExhibitionTicketSystem;'
-            r'UID=root;'
-            r'PWD=wendy940704;'
-        )
-        print("資料庫連線成功！")
+        return get_db_router().acquire(read_only=read_only, pin_primary=read_only and reads_from_primary())
     except Exception as e:
         print(f"資料庫連線失敗: {e}")
         return None
 
-def to_dict(cursor, row):
-    """將 pyodbc 的 Row 轉換成 Dictionary"""
-    return dict(zip([column[0] for column in cursor.description], row))
+# 列表頁只取樣板用得到的欄位 (不取 NVARCHAR(MAX) 的 description)
+CATALOG_COLUMNS = "exhibition_id, title, location, start_date, end_date, status, image_path, image_variants"
+CATALOG_STATUSES = ('Published', 'Ended')
+
+# 分頁設定
+app.config['PAGE_SIZE'] = 12
+app.config['PAGE_SIZE_MAX'] = 100
+app.config['SEARCH_RESULT_LIMIT'] = 60
+
+
+def catalog_sort_key(ex):
+    """
+    與目錄 SQL 相同的排序：上架中在前、已結束在後，各自依開始日期新到舊，同日再依 ID 新到舊
+    即 keyset 分頁用的 (狀態分組, start_date, exhibition_id)
+    """
+    start_date = ex['start_date']
+    return (ex['status'] == 'Ended', -start_date.toordinal() if start_date else 0, -ex['exhibition_id'])
+
+
+def load_catalog():
+    """
+    載入首頁展覽目錄：所有上架中與已結束的展覽 (過期的排最後)
+    後台異動後快取會立即失效並重新載入，所以讀主資料庫，避免把副本上的舊資料快取下來
+    """
+    conn = get_db_connection()
+    if not conn: raise RuntimeError("DB Connection Error")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT {CATALOG_COLUMNS} FROM Exhibitions 
+                WHERE status IN ('Published', 'Ended') 
+                ORDER BY CASE WHEN status = 'Ended' THEN 1 ELSE 0 END, start_date DESC, exhibition_id DESC
+            """)
+            exhibitions = fetch_all(cursor)
+    finally:
+        conn.close()
+
+    # 還沒有縮圖的展覽 (舊資料或背景處理失敗) 順便排入背景產生
+    for ex in exhibitions:
+        if ex['image_path'] and not ex['image_variants']:
+            image_pipeline.submit(ex['image_path'])
+    return KeysetList(exhibitions, key=catalog_sort_key)
+
+
+def load_search_documents():
+    """載入搜尋索引用的展覽資料 (含 description)"""
+    conn = get_db_connection()
+    if not conn: raise RuntimeError("DB Connection Error")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT {CATALOG_COLUMNS}, description FROM Exhibitions 
+                WHERE status IN ('Published', 'Ended')
+            """)
+            return fetch_all(cursor)
+    finally:
+        conn.close()
+
+
+# 首頁目錄快取：後台異動展覽時主動失效，另以 TTL 作為多 worker 之間的保險
+app.config['CATALOG_CACHE_TTL'] = 300
+catalog_cache = CatalogCache(load_catalog, ttl=app.config['CATALOG_CACHE_TTL'])
+
+# 首頁搜尋用的記憶體全文索引
+app.config['SEARCH_INDEX_MAX_AGE'] = 600
+search_index = SearchIndex(load_search_documents, sort_key=catalog_sort_key, max_age=app.config['SEARCH_INDEX_MAX_AGE'])
+
+# 首頁與詳細頁的 ETag：後台異動時版本號 +1；其他 worker 的異動最晚 N 秒後反映在 ETag 上
+app.config['HTTP_ETAG_MAX_AGE'] = 60
+catalog_version = CatalogVersion(max_age=app.config['HTTP_ETAG_MAX_AGE'])
+
+
+def render_detail_fragments(exhibition_id):
+    """產生展覽詳細頁中不隨請求改變的片段 (標題、橫幅、說明、票種選項)；展覽不存在時回傳 None"""
+    conn = get_db_connection(read_only=True)
+    if not conn: raise RuntimeError("DB Connection Error")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT * FROM Exhibitions WHERE exhibition_id = ?", (exhibition_id,))
+            exhibition = fetch_one(cursor)
+            if not exhibition or exhibition['status'] == DELETING:
+                return None
+            cursor.execute("SELECT * FROM TicketTypes WHERE exhibition_id = ?", (exhibition_id,))
+            ticket_types = fetch_all(cursor)
+    finally:
+        conn.close()
+
+    def macro(name):
+        return get_template_attribute('detail_fragments.html', name)
+
+    return {
+        'exhibition_id': exhibition['exhibition_id'],
+        'end_date': exhibition['end_date'],
+        'intro': macro('intro')(exhibition),
+        'description': macro('description')(exhibition),
+        'ticket_type_options': macro('ticket_type_options')(ticket_types),
+    }
+
+
+# 展覽詳細頁的 HTML 片段，版本同 ETag (catalog_version.token(exhibition_id))
+app.config['DETAIL_FRAGMENT_MAX_ENTRIES'] = 512
+detail_fragments = FragmentCache(max_entries=app.config['DETAIL_FRAGMENT_MAX_ENTRIES'])
+
+
+def load_exhibition_sessions(exhibition_id):
+    """載入展覽的場次與剩餘座位 (讀主資料庫，座位數不能落後太多)"""
+    conn = get_db_connection()
+    if not conn: raise RuntimeError("DB Connection Error")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT session_id, session_time, capacity FROM Sessions WHERE exhibition_id = ? ORDER BY session_time",
+                           (exhibition_id,))
+            return fetch_all(cursor)
+    finally:
+        conn.close()
+
+
+# 座位保留：加入購物車時先保留座位，結帳時直接轉成票券
+app.config['INVENTORY_HOLD_SECONDS'] = 10 * 60
+app.config['INVENTORY_SWEEP_INTERVAL'] = 30       # 每隔 N 秒批次歸還過期的保留
+app.config['INVENTORY_SWEEP_BATCH_SIZE'] = 1000
+app.config['INVENTORY_MAX_HOLD_PER_SESSION'] = 10  # 每人在同一場次最多同時保留的張數
+app.config['SEAT_COUNTER_TTL'] = 5                # 詳細頁的剩餘座位最多落後其他 worker N 秒
+
+seat_counter = SeatCounter(load_exhibition_sessions, ttl=app.config['SEAT_COUNTER_TTL'])
+inventory_holds = InventoryHolds(
+    db, seat_counter,
+    hold_seconds=app.config['INVENTORY_HOLD_SECONDS'],
+    sweep_interval=app.config['INVENTORY_SWEEP_INTERVAL'],
+    sweep_batch_size=app.config['INVENTORY_SWEEP_BATCH_SIZE'],
+    max_per_owner=app.config['INVENTORY_MAX_HOLD_PER_SESSION'],
+)
+
+
+# 結帳排隊：每個場次同時執行的結帳數上限，其餘依序排隊，隊伍過長時直接拒絕
+app.config['CHECKOUT_CONCURRENCY_PER_SESSION'] = 8
+app.config['CHECKOUT_QUEUE_MAX'] = 500
+app.config['CHECKOUT_QUEUE_IDLE_TIMEOUT'] = 15    # 排隊頁超過 N 秒沒有輪詢就移出隊伍
+
+waiting_room = WaitingRoom(
+    limit=app.config['CHECKOUT_CONCURRENCY_PER_SESSION'],
+    max_queue=app.config['CHECKOUT_QUEUE_MAX'],
+    idle_timeout=app.config['CHECKOUT_QUEUE_IDLE_TIMEOUT'],
+)
+
+
+def load_gate_tickets(exhibition_id):
+    """入場核銷快取：載入一檔展覽的所有票券與核銷碼"""
+    conn = get_db_connection()
+    if not conn: raise RuntimeError("DB Connection Error")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT T.ticket_uuid, T.status, E.validation_pin
+                FROM Tickets T
+                JOIN TicketTypes TT ON T.ticket_type_id = TT.ticket_type_id
+                JOIN Exhibitions E ON TT.exhibition_id = E.exhibition_id
+                WHERE E.exhibition_id = ?
+            """, (exhibition_id,))
+            return [(ticket_id_text(row[0]), row[1], row[2]) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def lookup_gate_tickets(ticket_uuids):
+    """入場核銷快取：查詢票券所屬的展覽、狀態與核銷碼，回傳 {ticket_uuid: (exhibition_id, status, validation_pin)}"""
+    conn = get_db_connection()
+    if not conn: raise RuntimeError("DB Connection Error")
+    found = {}
+    # 格式不正確的編號不可能存在，直接當作找不到
+    ticket_ids = [ticket_id for ticket_id in map(parse_ticket_id, ticket_uuids) if ticket_id]
+    try:
+        with conn.cursor() as cursor:
+            for start in range(0, len(ticket_ids), 500):
+                chunk = ticket_ids[start:start + 500]
+                cursor.execute(f"""
+                    SELECT T.ticket_uuid, E.exhibition_id, T.status, E.validation_pin
+                    FROM Tickets T
+                    JOIN TicketTypes TT ON T.ticket_type_id = TT.ticket_type_id
+                    JOIN Exhibitions E ON TT.exhibition_id = E.exhibition_id
+                    WHERE T.ticket_uuid IN ({','.join('?' * len(chunk))})
+                """, chunk)
+                for row in cursor.fetchall():
+                    found[ticket_id_text(row[0])] = (row[1], row[2], row[3])
+        return found
+    finally:
+        conn.close()
+
+
+def write_back_gate_scans(rows):
+    """把核銷紀錄批次寫回 Tickets (只更新仍未使用的票券，重複寫回不影響結果)"""
+    conn = get_db_connection()
+    if not conn: raise RuntimeError("DB Connection Error")
+    try:
+        with conn.cursor() as cursor:
+            db.executemany(cursor, "UPDATE Tickets SET status = 'Used', used_at = ? WHERE ticket_uuid = ? AND status <> 'Used'",
+                           [(used_at, parse_ticket_id(ticket_uuid)) for ticket_uuid, used_at in rows])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# 入場核銷快取：掃描在記憶體中判斷，核銷紀錄先寫入本機日誌再批次寫回資料庫
+app.config['GATE_JOURNAL_PATH'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'gate_scans.sqlite3')
+app.config['GATE_CACHE_TTL'] = 300             # 每檔展覽的票券快取 N 秒後重新載入
+app.config['GATE_FLUSH_INTERVAL'] = 2          # 每隔 N 秒把核銷紀錄寫回資料庫
+app.config['GATE_FLUSH_BATCH_SIZE'] = 500
+app.config['GATE_SCAN_BATCH_MAX'] = 500        # 掃描機一次最多上傳幾筆
+app.config['GATE_JOURNAL_RETENTION'] = 24 * 60 * 60  # 已寫回的核銷紀錄在本機日誌保留 N 秒 (辨識掃描機重送)
+app.config['GATE_JOURNAL_PRUNE_INTERVAL'] = 5 * 60
+
+gate_cache = GateValidationCache(
+    load_gate_tickets, lookup_gate_tickets, write_back_gate_scans,
+    ScanJournal(app.config['GATE_JOURNAL_PATH'], retention=app.config['GATE_JOURNAL_RETENTION']),
+    ttl=app.config['GATE_CACHE_TTL'],
+    flush_interval=app.config['GATE_FLUSH_INTERVAL'],
+    flush_batch_size=app.config['GATE_FLUSH_BATCH_SIZE'],
+    prune_interval=app.config['GATE_JOURNAL_PRUNE_INTERVAL'],
+)
+
+
+def store_image_variants(image_path, variants):
+    """圖片衍生檔產生完成後寫回資料庫；原圖已被替換或刪除時回傳 False"""
+    conn = get_db_connection()
+    if not conn: raise RuntimeError("DB Connection Error")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("UPDATE Exhibitions SET image_variants = ? WHERE image_path = ?", (json.dumps(variants), image_path))
+            if cursor.rowcount == 0:
+                return False
+            cursor.execute("SELECT exhibition_id FROM Exhibitions WHERE image_path = ?", (image_path,))
+            exhibition_ids = [row[0] for row in cursor.fetchall()]
+            conn.commit()
+            catalog_cache.invalidate()
+            for exhibition_id in exhibition_ids:
+                reindex_exhibition(cursor, exhibition_id)
+                catalog_version.bump(exhibition_id)
+        return True
+    finally:
+        conn.close()
+
+
+# 展覽圖片衍生檔：上傳後在背景產生各尺寸的 WebP / JPEG，首頁卡片不再直接載入原圖
+app.config['IMAGE_PIPELINE_WORKERS'] = 2
+image_pipeline = ImagePipeline(UPLOAD_FOLDER, '/static/uploads/exhibitions/', on_done=store_image_variants,
+                               workers=app.config['IMAGE_PIPELINE_WORKERS'])
+app.add_template_global(image_sources)
+
+
+def finish_exhibition_purge(job):
+    """背景刪除展覽完成：刪除圖片檔並清除各快取中的這個展覽"""
+    exhibition_id = job['exhibition_id']
+    delete_old_image(job['image_path'])
+    catalog_cache.invalidate()
+    search_index.remove(exhibition_id)
+    seat_counter.invalidate(exhibition_id)
+    catalog_version.bump(exhibition_id)
+    detail_fragments.invalidate(exhibition_id)
+    gate_cache.invalidate(exhibition_id)
+
+
+# 刪除展覽：請求中只隱藏展覽，票券等關聯資料由背景執行緒分批刪除 (每批筆數、批次間停頓秒數)
+app.config['PURGE_BATCH_SIZE'] = 500
+app.config['PURGE_BATCH_PAUSE'] = 0.05
+exhibition_purger = ExhibitionPurger(db, get_db_connection, batch_size=app.config['PURGE_BATCH_SIZE'],
+                                     pause=app.config['PURGE_BATCH_PAUSE'], on_done=finish_exhibition_purge)
+
+
+# 行程啟動後的第一個請求帶起背景刪除執行緒，接手上次中斷的工作
+@app.before_request
+def start_exhibition_purger():
+    exhibition_purger.start()
+
+
+def reindex_exhibition(cursor, exhibition_id):
+    """後台異動展覽後，增量更新搜尋索引中的這一筆"""
+    cursor.execute("SELECT * FROM Exhibitions WHERE exhibition_id = ?", (exhibition_id,))
+    exhibition = fetch_one(cursor)
+    if exhibition:
+        search_index.upsert(exhibition, searchable=exhibition['status'] in CATALOG_STATUSES)
+    else:
+        search_index.remove(exhibition_id)
 
 # 輔助函式：檢查是否為管理員
 def is_admin():
     return session.get('role') == 'admin'
 
 
+# ==========================================
+# 購物車工具
+# 購物車只存 [session_id, ticket_type_id, quantity] 明細，
+# 展覽名稱、場次時間、票價等顯示資料在讀取時才向資料庫查詢
+# ==========================================
+
+def get_cart():
+    cart = session.get('cart', [])
+    # 略過舊版 (每張票一個 dict) 的購物車格式
+    return [line for line in cart if isinstance(line, list) and len(line) == 3]
+
+
+def add_to_cart(session_id, ticket_type_id, quantity):
+    """同場次同票種合併成一筆明細，不論張數多少 cookie 大小都固定"""
+    cart = get_cart()
+    for line in cart:
+        if line[0] == session_id and line[1] == ticket_type_id:
+            line[2] += quantity
+            break
+    else:
+        cart.append([session_id, ticket_type_id, quantity])
+    session['cart'] = cart
+
+
+def cart_quantity(cart):
+    return sum(line[2] for line in cart)
+
+
+def load_cart_items(cursor, cart):
+    """
+    依購物車明細查詢顯示資料與票價
+    回傳 List of Dicts；場次或票種已不存在的明細會被略過
+    """
+    if not cart:
+        return []
+    session_ids = sorted({line[0] for line in cart})
+    type_ids = sorted({line[1] for line in cart})
+    sql = f"""
+        SELECT S.session_id, S.session_time, TT.ticket_type_id, TT.name, TT.price, E.exhibition_id, E.title
+        FROM Sessions S
+        JOIN Exhibitions E ON S.exhibition_id = E.exhibition_id
+        JOIN TicketTypes TT ON TT.exhibition_id = E.exhibition_id
+        WHERE S.session_id IN ({','.join('?' * len(session_ids))})
+          AND TT.ticket_type_id IN ({','.join('?' * len(type_ids))})
+          AND E.status <> ?
+    """
+    cursor.execute(sql, session_ids + type_ids + [DELETING])
+    found = {(row.session_id, row.ticket_type_id): row for row in cursor.fetchall()}
+
+    items = []
+    for session_id, ticket_type_id, quantity in cart:
+        row = found.get((session_id, ticket_type_id))
+        if not row:
+            continue
+        items.append({
+            'exhibition_id': row.exhibition_id,
+            'exhibition_title': row.title,
+            'session_id': session_id,
+            'session_time_str': str(row.session_time),
+            'ticket_type_id': ticket_type_id,
+            'ticket_name': row.name,
+            'price': float(row.price),
+            'quantity': quantity,
+            'subtotal': float(row.price) * quantity,
+        })
+    return items
+
+
+def page_etag(*parts):
+    """
+    頁面的 ETag：parts 為影響內容的因素，另外加上網址與版面上因人而異的部分 (登入者、購物車數量)
+    有尚未顯示的 flash 訊息時回傳 None，必須實際產生頁面
+    """
+    if session.get('_flashes'):
+        return None
+    return make_etag(request.full_path, session.get('user_id'), session.get('user_name'), session.get('role'),
+                     cart_quantity(get_cart()), *parts)
+
+
+def not_modified(etag):
+    """瀏覽器 (或反向代理) 的快取仍是最新的：回 304，不必查詢資料庫也不必產生頁面"""
+    if etag is None or etag not in request.if_none_match:
+        return None
+    return with_etag(make_response('', 304), etag)
+
+
+def with_etag(response, etag):
+    if etag is not None:
+        response = make_response(response)
+        response.set_etag(etag)
+        # 每次使用前都要帶 ETag 回來驗證；登入後的頁面含個人資訊，只能存在瀏覽器
+        response.cache_control.no_cache = True
+        if 'user_id' in session:
+            response.cache_control.private = True
+        else:
+            response.cache_control.public = True
+    return response
+
+
+# 上傳的圖片 (含縮圖) 檔名都帶有隨機字串，換圖一定是新檔名，內容永遠不會改變
+@app.after_request
+def cache_uploaded_images(response):
+    if request.path.startswith('/static/uploads/') and response.status_code in (200, 304):
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+
 # Context Processor: 讓所有 Template 都能讀到購物車數量
 @app.context_processor
 def inject_cart_count():
-    cart = session.get('cart', [])
-    return dict(cart_count=len(cart))
+    return dict(cart_count=cart_quantity(get_cart()))
 
 
 # ==========================================
@@ -101,36 +589,45 @@ def inject_cart_count():
 @app.route('/')
 def index():
     keyword = request.args.get('q', '')  # 取得搜尋關鍵字
+    after = request.args.get('after')    # 分頁游標
+    next_cursor = None
+
+    now = datetime.now()
+    etag = page_etag(catalog_version.token(), now.date())
+    cached = not_modified(etag)
+    if cached: return cached
 
-    conn = get_db_connection()
-    if not conn: return "DB Connection Error", 500
     try:
-        with conn.cursor() as cursor:
-            if keyword:
-                # 搜尋標題或地點
-                sql = """
-                    SELECT * FROM Exhibitions 
-                    WHERE status IN ('Published', 'Ended') AND (title LIKE ? OR location LIKE ?)
-                    ORDER BY CASE WHEN status = 'Ended' THEN 1 ELSE 0 END, start_date DESC
-                """
-                search_term = f"%{keyword}%"
-                cursor.execute(sql, (search_term, search_term))
-            else:
-                # 顯示所有上架中與已結束的展覽 (過期的排最後)
-                cursor.execute("""
-                    SELECT * FROM Exhibitions 
-                    WHERE status IN ('Published', 'Ended') 
-                    ORDER BY CASE WHEN status = 'Ended' THEN 1 ELSE 0 END, start_date DESC
-                """)
+        if keyword:
+            # 搜尋標題、地點與介紹 (記憶體全文索引，依相關度排序)
+            exhibitions = search_index.search(keyword, limit=app.config['SEARCH_RESULT_LIMIT'])
+        else:
+            # 沒有搜尋時直接使用目錄快取，穩定狀態下不需查詢資料庫
+            exhibitions, next_cursor = catalog_cache.get().page(decode_cursor(after), app.config['PAGE_SIZE'])
+    except Exception as e:
+        print(f"載入展覽目錄失敗: {e}")
+        return "DB Connection Error", 500
 
-            rows = cursor.fetchall()
-            # ★ 補上轉換邏輯：將 List of Tuples 轉為 List of Dicts
-            exhibitions = [to_dict(cursor, row) for row in rows]
+    # ★ 傳入 now 讓前端判斷是否顯示「已結束」
+    return with_etag(render_template('index.html', exhibitions=exhibitions, keyword=keyword, now=now,
+                                     next_cursor=next_cursor, is_first_page=not after), etag)
 
-        # ★ 傳入 now 讓前端判斷是否顯示「已結束」
-        return render_template('index.html', exhibitions=exhibitions, keyword=keyword, now=datetime.now())
-    finally:
-        conn.close()
+
+# --- 展覽列表 API (keyset 分頁) ---
+@app.route('/api/exhibitions')
+def api_exhibitions():
+    limit = parse_limit(request.args.get('limit'), app.config['PAGE_SIZE'], app.config['PAGE_SIZE_MAX'])
+    try:
+        exhibitions, next_cursor = catalog_cache.get().page(decode_cursor(request.args.get('after')), limit)
+    except Exception as e:
+        print(f"載入展覽目錄失敗: {e}")
+        return {"success": False, "message": "DB Connection Error"}, 500
+
+    return {
+        "success": True,
+        "exhibitions": [dict(ex, start_date=str(ex['start_date']), end_date=str(ex['end_date'])) for ex in exhibitions],
+        "next": next_cursor,
+    }
 
 
 # --- 註冊 ---
@@ -184,13 +681,17 @@ def login():
         try:
             with conn.cursor() as cursor:
                 cursor.execute("SELECT * FROM Members WHERE email = ?", (email,))
-                user = cursor.fetchone()
-                if user:  # 如果有抓到資料，就轉成字典
-                    columns = [column[0] for column in cursor.description]
-                    user = dict(zip(columns, user))
+                user = fetch_one(cursor)
 
             if user and check_password_hash(user['password_hash'], password):
-                # 登入成功，設定 Session
+                # 登入成功：換發新的 session id (防止 session fixation)，購物車的座位保留跟著移到新 id
+                old_sid = app.session_interface.regenerate(session)
+                waiting_room.leave(old_sid)
+                with conn.cursor() as cursor:
+                    inventory_holds.transfer(cursor, old_sid, session.sid)
+                conn.commit()
+
+                # 設定 Session
                 session.permanent = True  # 啟用自動過期
                 session['user_id'] = user['member_id']
                 session['user_name'] = user['name']
@@ -211,6 +712,10 @@ def login():
 # --- 登出 ---
 @app.route('/logout')
 def logout():
+    old_sid = app.session_interface.regenerate(session)
+    waiting_room.leave(old_sid)
+    if session.pop('cart', None):
+        release_holds(old_sid)
     session.clear()
     return redirect(url_for('index'))
 
@@ -218,97 +723,102 @@ def logout():
 # --- 展覽詳細頁 (加入購物車 - 含嚴格過期檢查) ---
 @app.route('/exhibition/<int:id>', methods=['GET', 'POST'])
 def detail(id):
+    inventory_holds.maybe_sweep(get_db_connection)
+
+    # === GET: 顯示頁面 ===
+    if request.method == 'GET':
+        # 剩餘座位 (已扣除保留中的座位) 取自記憶體計數；座位數變動時 ETag 也跟著改變
+        now = datetime.now()
+        version = catalog_version.token(id)
+        sessions = seat_counter.sessions(id)
+        etag = page_etag(version, now.date(),
+                         sum(1 for s in sessions if s['session_time'] < now),
+                         [(s['session_id'], s['capacity']) for s in sessions])
+        cached = not_modified(etag)
+        if cached: return cached
+
+        # 展覽資訊與票種使用快取的 HTML 片段，每次請求只填入場次與剩餘座位
+        exhibition = detail_fragments.get(id, version, lambda: render_detail_fragments(id))
+        if not exhibition: return "找不到該展覽", 404
+
+        # ★ 傳入 now 給前端做按鈕停用判斷
+        return with_etag(render_template('detail.html', ex=exhibition, sessions=sessions, now=now), etag)
+
+    # 加入購物車會保留座位，必須登入 (避免匿名請求佔住整個場次)
+    if 'user_id' not in session:
+        flash('請先登入才能購票')
+        return redirect(url_for('login'))
+
+    # 加入購物車要保留座位，必須寫入主資料庫
     conn = get_db_connection()
     if not conn: return "DB Error", 500
 
     try:
         with conn.cursor() as cursor:
             # === POST: 加入購物車 ===
-            if request.method == 'POST':
-                try:
-                    quantity = int(request.form.get('quantity', 1))
-                except ValueError:
-                    quantity = 1
-
-                if quantity <= 0:
-                    flash("購買數量必須大於 0")
-                    return redirect(request.url)
-
-                session_id = request.form.get('session_id')
-
-                # ★ 後端防呆：嚴格檢查過期
-                # 同時查詢「場次時間」與「展覽結束日期」
-                sql = """
-                    SELECT S.session_time, E.end_date 
-                    FROM Sessions S
-                    JOIN Exhibitions E ON S.exhibition_id = E.exhibition_id
-                    WHERE S.session_id = ?
-                """
-                cursor.execute(sql, (session_id,))
-                row = cursor.fetchone()
-                if row: row = to_dict(cursor, row)  # 一行搞定轉換
-                else:
-                    flash("錯誤：找不到場次資訊")
-                    return redirect(request.url)
-
-                # 1. 檢查展覽是否已結束
-                if row['end_date'] < datetime.now().date():
-                    flash("很抱歉，此展覽活動已完全結束，無法購票！")
-                    return redirect(request.url)
-
-                # 2. 檢查場次時間是否已過
-                if row['session_time'] < datetime.now():
-                    flash("錯誤：該場次時間已過，無法購買！")
-                    return redirect(request.url)
-
-                # 建立商品物件
-                item_template = {
-                    'exhibition_id': id,
-                    'exhibition_title': request.form.get('exhibition_title'),
-                    'session_id': session_id,
-                    'session_time_str': request.form.get('session_time_str'),
-                    'ticket_type_id': request.form.get('ticket_type'),
-                    'ticket_name': request.form.get('ticket_name'),
-                    'price': float(request.form.get('price'))
-                }
-
-                cart = session.get('cart', [])
-                # 依數量重複加入
-                for _ in range(quantity):
-                    cart.append(item_template.copy())
-
-                session['cart'] = cart
-                flash(f'已將 {quantity} 張票加入購物車')
-                return redirect(url_for('index'))
-
-            # === GET: 顯示頁面 ===
-            cursor.execute("SELECT * FROM Exhibitions WHERE exhibition_id = ?", (id,))
-            exhibition = cursor.fetchone()
-            if exhibition:  # 如果有抓到資料，就轉成字典
-                columns = [column[0] for column in cursor.description]
-                exhibition = dict(zip(columns, exhibition))
+            try:
+                quantity = int(request.form.get('quantity', 1))
+            except ValueError:
+                quantity = 1
 
+            if quantity <= 0:
+                flash("購買數量必須大於 0")
+                return redirect(request.url)
 
-            cursor.execute("SELECT * FROM Sessions WHERE exhibition_id = ? ORDER BY session_time", (id,))
-            sessions = cursor.fetchall()
-            if sessions:
-                columns = [column[0] for column in cursor.description]
-                sessions = [dict(zip(columns, row)) for row in sessions]
+            try:
+                session_id = int(request.form.get('session_id'))
+            except (TypeError, ValueError):
+                flash("錯誤：找不到場次資訊")
+                return redirect(request.url)
 
-            cursor.execute("SELECT * FROM TicketTypes WHERE exhibition_id = ?", (id,))
-            ticket_types = cursor.fetchall()
-            if ticket_types:
-                columns = [column[0] for column in cursor.description]
-                ticket_types = [dict(zip(columns, row)) for row in ticket_types]
+            try:
+                ticket_type_id = int(request.form.get('ticket_type'))
+            except (TypeError, ValueError):
+                flash("錯誤：請選擇票種")
+                return redirect(request.url)
 
-            if not exhibition: return "找不到該展覽", 404
+            # ★ 後端防呆：嚴格檢查過期
+            # 同時查詢「場次時間」、「展覽結束日期」與票種是否屬於此場次的展覽
+            sql = """
+                SELECT S.session_time, E.end_date, E.status, TT.ticket_type_id
+                FROM Sessions S
+                JOIN Exhibitions E ON S.exhibition_id = E.exhibition_id
+                LEFT JOIN TicketTypes TT ON TT.exhibition_id = E.exhibition_id AND TT.ticket_type_id = ?
+                WHERE S.session_id = ?
+            """
+            cursor.execute(sql, (ticket_type_id, session_id))
+            row = fetch_one(cursor)
+            if not row or row['status'] == DELETING:
+                flash("錯誤：找不到場次資訊")
+                return redirect(request.url)
+
+            if row['ticket_type_id'] is None:
+                flash("錯誤：找不到票種資訊")
+                return redirect(request.url)
+
+            # 1. 檢查展覽是否已結束
+            if row['end_date'] < datetime.now().date():
+                flash("很抱歉，此展覽活動已完全結束，無法購票！")
+                return redirect(request.url)
+
+            # 2. 檢查場次時間是否已過
+            if row['session_time'] < datetime.now():
+                flash("錯誤：該場次時間已過，無法購買！")
+                return redirect(request.url)
+
+            # 先保留座位，保留期間內結帳不會因其他人搶購而失敗
+            if not inventory_holds.within_limit(cursor, session.sid, session_id, quantity):
+                flash(f"每人每個場次最多保留 {inventory_holds.max_per_owner} 張票，請先結帳")
+                return redirect(request.url)
+            if not inventory_holds.hold(cursor, session.sid, session_id, quantity):
+                flash("很抱歉，此場次剩餘座位不足")
+                return redirect(request.url)
+            conn.commit()
+            seat_counter.adjust(session_id, -quantity)
 
-            # ★ 傳入 now 給前端做按鈕停用判斷
-            return render_template('detail.html',
-                                   ex=exhibition,
-                                   sessions=sessions,
-                                   types=ticket_types,
-                                   now=datetime.now())
+            add_to_cart(session_id, ticket_type_id, quantity)
+            flash(f'已將 {quantity} 張票加入購物車，座位保留 {app.config["INVENTORY_HOLD_SECONDS"] // 60} 分鐘')
+            return redirect(url_for('index'))
 
     finally:
         conn.close()
@@ -317,15 +827,44 @@ def detail(id):
 # --- 查看購物車 ---
 @app.route('/cart')
 def view_cart():
-    cart = session.get('cart', [])
-    total_price = sum(item['price'] for item in cart)
-    return render_template('cart.html', cart=cart, total=total_price)
+    cart = get_cart()
+    items = []
+    if cart:
+        conn = get_db_connection(read_only=True)
+        if not conn: return "DB Connection Error", 500
+        try:
+            with conn.cursor() as cursor:
+                items = load_cart_items(cursor, cart)
+        finally:
+            conn.close()
+    total_price = sum(item['subtotal'] for item in items)
+    return render_template('cart.html', cart=items, total=total_price)
+
+
+def release_holds(owner):
+    """歸還 owner 保留的座位 (失敗也沒關係，保留到期後會自動歸還)"""
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        with conn.cursor() as cursor:
+            released = inventory_holds.release(cursor, owner)
+        conn.commit()
+        for session_id, quantity in released.items():
+            seat_counter.adjust(session_id, quantity)
+    except Exception as e:
+        conn.rollback()
+        print(f"歸還座位保留失敗: {e}")
+    finally:
+        conn.close()
 
 
 # --- 清空購物車 ---
 @app.route('/clear_cart')
 def clear_cart():
-    session.pop('cart', None)
+    waiting_room.leave(session.sid)
+    if session.pop('cart', None):
+        release_holds(session.sid)
     return redirect(url_for('view_cart'))
 
 
@@ -336,49 +875,95 @@ def checkout():
         flash('請先登入才能結帳')
         return redirect(url_for('login'))
 
-    cart = session.get('cart', [])
+    cart = get_cart()
     if not cart:
         flash('購物車是空的')
         return redirect(url_for('index'))
 
+    # 先取得結帳名額，沒有名額就到排隊頁等待，不讓大量請求同時去搶同一個場次的資料列
+    session_ids = {line[0] for line in cart}
+    try:
+        admitted = waiting_room.admit(session.sid, session_ids)
+    except Overloaded as e:
+        flash(str(e))
+        return redirect(url_for('view_cart'))
+    if not admitted:
+        return redirect(url_for('checkout_waiting'))
+
+    started = time.monotonic()
+    try:
+        return process_checkout(cart)
+    finally:
+        waiting_room.release(session_ids, time.monotonic() - started)
+
+
+def process_checkout(cart):
     conn = get_db_connection()
     try:
         with conn.cursor() as cursor:
-            total_amount = sum(item['price'] for item in cart)
+            items = load_cart_items(cursor, cart)
+            if len(items) != len(cart):
+                # 購物車無法結帳，一併歸還已保留的座位，不必等到保留過期
+                released = inventory_holds.release(cursor, session.sid)
+                conn.commit()
+                for sid, quantity in released.items():
+                    seat_counter.adjust(sid, quantity)
+                flash('結帳失敗: 購物車中有已下架的場次或票種，請清空購物車後重新選購。')
+                return redirect(url_for('view_cart'))
+            total_amount = sum(item['subtotal'] for item in items)
 
             # 1. 建立訂單
-            cursor.execute("SET NOCOUNT ON; INSERT INTO Orders (member_id, total_amount, status) VALUES (?, ?, 'Paid'); SELECT SCOPE_IDENTITY()",
-                           (session['user_id'], total_amount))
-            result = cursor.fetchone()  # 用 fetchone() 取得剛產生的 ID
-            if result:
-                order_id = int(result[0])
-            else:
-                raise Exception("無法取得訂單 ID")
-                
-            # 2. 處理每一張票 (扣庫存 + 建票)
-            for item in cart:
-                session_id = item['session_id']
-                ticket_type_id = item['ticket_type_id']
-
-                # [關鍵] 扣除庫存，若庫存不足會影響行數為 0 (防止超賣)
+            order_id = db.insert_returning_id(cursor, "INSERT INTO Orders (member_id, total_amount, status) VALUES (?, ?, 'Paid')",
+                                              (session['user_id'], total_amount))
+
+            # 2. 依場次彙總張數；已保留的座位直接認領，不足的部分才扣庫存
+            session_qty = {}
+            session_label = {}
+            for item in items:
+                sid = item['session_id']
+                session_qty[sid] = session_qty.get(sid, 0) + item['quantity']
+                session_label[sid] = item['session_time_str']
+
+            held = inventory_holds.claim(cursor, session.sid)
+            seat_changes = {}
+            # 場次依 ID 排序後再更新，讓併發交易以相同順序鎖定資料列，避免死結
+            for sid in sorted(set(session_qty) | set(held)):
+                # 正數：還要再扣的座位 (保留已過期或張數不足)；負數：多保留的座位要歸還
+                qty = session_qty.get(sid, 0) - held.get(sid, 0)
+                if qty == 0:
+                    continue
+                # [關鍵] 庫存不足整批張數時影響行數為 0 (防止超賣)
                 cursor.execute("""
                     UPDATE Sessions 
-                    SET capacity = capacity - 1 
-                    WHERE session_id = ? AND capacity > 0
-                """, (session_id,))
+                    SET capacity = capacity - ? 
+                    WHERE session_id = ? AND capacity >= ?
+                """, (qty, sid, qty))
 
                 if cursor.rowcount == 0:
-                    raise Exception(f"很抱歉，場次「{item['session_time_str']}」已額滿，無法購買。")
-
-                ticket_uuid = str(uuid.uuid4())
-                cursor.execute("""
-                    INSERT INTO Tickets (ticket_uuid, order_id, ticket_type_id, session_id, status)
-                    VALUES (?, ?, ?, ?, 'Unused')
-                """, (ticket_uuid, order_id, ticket_type_id, session_id))
+                    raise Exception(f"很抱歉，場次「{session_label[sid]}」已額滿，無法購買。")
+                seat_changes[sid] = -qty
+
+            # 3. 一次批次寫入所有票券
+            tickets = [(new_ticket_id(), order_id, item['ticket_type_id'], item['session_id'])
+                       for item in items for _ in range(item['quantity'])]
+            db.executemany(cursor, """
+                INSERT INTO Tickets (ticket_uuid, order_id, ticket_type_id, session_id, status)
+                VALUES (?, ?, ?, ?, 'Unused')
+            """, tickets)
+
+            # 4. 累加銷售彙總表 (放在 commit 前最後一步，彙總列被鎖住的時間最短)
+            # 每日銷售以訂單的 order_date (資料庫時間) 歸日，與 Orders 明細一致
+            cursor.execute("SELECT order_date FROM Orders WHERE order_id = ?", (order_id,))
+            record_sales(db, cursor, items, cursor.fetchone()[0])
 
         conn.commit()
+        mark_recent_write()
+        for sid, delta in seat_changes.items():
+            seat_counter.adjust(sid, delta)
         session.pop('cart', None)
-        flash(f'結帳成功！共購買 {len(cart)} 張票券')
+        if app.config['QR_PRERENDER_ON_CHECKOUT']:
+            qr_cache.prerender((ticket_id_text(ticket[0]) for ticket in tickets), app.config['QR_INLINE_FORMAT'])
+        flash(f'結帳成功！共購買 {len(tickets)} 張票券')
         return redirect(url_for('my_tickets'))
 
     except Exception as e:
@@ -389,27 +974,110 @@ def checkout():
         conn.close()
 
 
+# --- 結帳排隊頁 ---
+@app.route('/checkout/waiting')
+def checkout_waiting():
+    if not get_cart() or waiting_room.status(session.sid) is None:
+        return redirect(url_for('view_cart'))
+    return render_template('checkout_waiting.html')
+
+
+# --- 排隊狀態 (排隊頁輪詢) ---
+@app.route('/api/checkout/queue')
+def api_checkout_queue():
+    status = waiting_room.status(session.sid)
+    if status is None:
+        return {"success": False, "message": "目前不在排隊中"}, 404
+    # 建議下次輪詢的間隔：快輪到時縮短
+    retry_after = 1 if status['ready'] else min(5, max(1, int(status['eta_seconds'] / 2)))
+    return dict(status, success=True, retry_after=retry_after)
+
+
+def fetch_member_tickets(cursor, member_id, after=None, limit=20):
+    """
+    以 keyset 分頁查詢會員的票券，排序鍵為 (order_date, ticket_uuid) 新到舊
+    回傳 (本頁票券, 下一頁游標)；票券的 ticket_uuid 已轉成文字格式
+    """
+    params = [member_id]
+    seek = ""
+    if after and len(after) == 2 and all(isinstance(v, str) for v in after) and parse_ticket_id(after[1]):
+        seek = "AND (O.order_date < ? OR (O.order_date = ? AND T.ticket_uuid < ?))"
+        params += [after[0], after[0], parse_ticket_id(after[1])]
+    params.append(limit + 1)
+
+    cursor.execute(f"""
+        SELECT T.ticket_uuid, E.title, S.session_time, TT.name, T.status, O.order_date
+        FROM Tickets T
+        JOIN Orders O ON T.order_id = O.order_id
+        JOIN TicketTypes TT ON T.ticket_type_id = TT.ticket_type_id
+        JOIN Sessions S ON T.session_id = S.session_id
+        JOIN Exhibitions E ON TT.exhibition_id = E.exhibition_id
+        WHERE O.member_id = ? {seek}
+        ORDER BY O.order_date DESC, T.ticket_uuid DESC
+        {db.limit_sql}
+    """, params)
+    tickets = [t._replace(ticket_uuid=ticket_id_text(t.ticket_uuid)) for t in fetch_all(cursor)]
+
+    next_cursor = None
+    if len(tickets) > limit:
+        tickets = tickets[:limit]
+        last = tickets[-1]
+        next_cursor = encode_cursor([db.format_datetime(last.order_date), last.ticket_uuid])
+    return tickets, next_cursor
+
+
 # --- 我的票券 ---
 @app.route('/my_tickets')
 def my_tickets():
     if 'user_id' not in session: return redirect(url_for('login'))
 
-    conn = get_db_connection()
+    after = request.args.get('after')
+    conn = get_db_connection(read_only=True)
     try:
         with conn.cursor() as cursor:
-            sql = """
-                SELECT T.ticket_uuid, E.title, S.session_time, TT.name, T.status
-                FROM Tickets T
-                JOIN Orders O ON T.order_id = O.order_id
-                JOIN TicketTypes TT ON T.ticket_type_id = TT.ticket_type_id
-                JOIN Sessions S ON T.session_id = S.session_id
-                JOIN Exhibitions E ON TT.exhibition_id = E.exhibition_id
-                WHERE O.member_id = ?
-                ORDER BY O.order_date DESC
-            """
-            cursor.execute(sql, (session['user_id'],))
-            tickets = cursor.fetchall()
-            return render_template('my_tickets.html', tickets=tickets)
+            tickets, next_cursor = fetch_member_tickets(cursor, session['user_id'], decode_cursor(after), app.config['PAGE_SIZE'])
+    finally:
+        conn.close()
+
+    # QR Code 直接以 SVG 內嵌在頁面中，不必每張票各發一次請求
+    qr_codes = qr_cache.get_many((t.ticket_uuid for t in tickets), app.config['QR_INLINE_FORMAT'])
+    qr_codes = {ticket_uuid: body.decode('utf-8') for ticket_uuid, body in qr_codes.items()}
+    return render_template('my_tickets.html', tickets=tickets, qr_codes=qr_codes,
+                           next_cursor=next_cursor, is_first_page=not after)
+
+
+# --- 批次取得我的票券 QR Code (一次回應全部) ---
+@app.route('/api/my_tickets/qrcodes')
+def api_my_ticket_qrcodes():
+    if 'user_id' not in session: return {"success": False, "message": "請先登入"}, 401
+
+    fmt = request.args.get('format', 'svg')
+    if fmt != 'svg': return {"success": False, "message": "僅支援 svg 格式"}, 400
+    limit = parse_limit(request.args.get('limit'), app.config['PAGE_SIZE'], app.config['PAGE_SIZE_MAX'])
+
+    conn = get_db_connection(read_only=True)
+    if not conn: return {"success": False, "message": "DB Connection Error"}, 500
+    try:
+        with conn.cursor() as cursor:
+            tickets, next_cursor = fetch_member_tickets(cursor, session['user_id'], decode_cursor(request.args.get('after')), limit)
+    finally:
+        conn.close()
+
+    qr_codes = qr_cache.get_many((t.ticket_uuid for t in tickets), fmt)
+    return {"success": True, "format": fmt, "next": next_cursor,
+            "qrcodes": {ticket_uuid: body.decode('utf-8') for ticket_uuid, body in qr_codes.items()}}
+
+
+def ticket_exists(ticket_uuid):
+    ticket_id = parse_ticket_id(ticket_uuid)
+    if ticket_id is None:
+        return False
+    conn = get_db_connection(read_only=True)
+    if not conn: return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM Tickets WHERE ticket_uuid = ?", (ticket_id,))
+            return cursor.fetchone() is not None
     finally:
         conn.close()
 
@@ -417,53 +1085,86 @@ def my_tickets():
 # --- QR Code API ---
 @app.route('/qrcode/<uuid>')
 def serve_qrcode(uuid):
-    qr = qrcode.QRCode(box_size=10, border=4)
-    qr.add_data(uuid)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white").convert('RGB')
-    buf = io.BytesIO()
-    img.save(buf, format='PNG')
-    buf.seek(0)
-    return send_file(buf, mimetype='image/png')
+    if len(uuid) > 64: return "Invalid ticket id", 404
+
+    fmt = request.args.get('format', 'png')
+    if fmt not in ('png', 'svg'): return "Unsupported format", 400
+
+    # 任何字串都能產生 QR Code，但只有確實存在的票券才寫入磁碟快取，避免隨意的網址塞滿磁碟
+    body, etag = qr_cache.get(uuid, fmt, persist=lambda: ticket_exists(uuid))
+    # 同一張票的 QR Code 永遠不變：帶上強 ETag 與長效快取，瀏覽器與 proxy 不必再次請求
+    response = make_response(body)
+    response.mimetype = qr_cache.mimetype(fmt)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
 
 
 # --- 現場核銷 API (輸入 PIN 碼) ---
 @app.route('/api/use_ticket', methods=['POST'])
 def api_use_ticket():
     data = request.get_json()
-    uuid = data.get('uuid')
+    ticket_id = parse_ticket_id(data.get('uuid'))
     input_pin = data.get('pin')
+    if ticket_id is None:
+        return {"success": False, "message": "找不到票券"}, 404
 
-    conn = get_db_connection()
     try:
-        with conn.cursor() as cursor:
-            sql = """
-                SELECT T.status, E.validation_pin 
-                FROM Tickets T
-                JOIN TicketTypes TT ON T.ticket_type_id = TT.ticket_type_id
-                JOIN Exhibitions E ON TT.exhibition_id = E.exhibition_id
-                WHERE T.ticket_uuid = ?
-            """
-            cursor.execute(sql, (uuid,))
-            row = cursor.fetchone()
-            if row: row = to_dict(cursor, row)
-            else: return {"success": False, "message": "找不到票券"}, 404
+        success, message, status_code = gate_cache.scan(ticket_id_text(ticket_id), input_pin)
+    except Exception as e:
+        print(f"核銷失敗: {e}")
+        return {"success": False, "message": str(e)}, 500
+    return {"success": success, "message": message}, status_code
+
+
+# --- 掃描機批次核銷 API (離線暫存後整批上傳，可安全重送) ---
+@app.route('/api/use_tickets', methods=['POST'])
+def api_use_tickets():
+    data = request.get_json(silent=True) or {}
+    device = data.get('device')
+    items = data.get('scans')
+    if not isinstance(items, list) or not items:
+        return {"success": False, "message": "缺少掃描資料"}, 400
+    if len(items) > app.config['GATE_SCAN_BATCH_MAX']:
+        return {"success": False, "message": f"一次最多 {app.config['GATE_SCAN_BATCH_MAX']} 筆"}, 413
+
+    scans = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get('uuid'):
+            return {"success": False, "message": "掃描資料格式錯誤"}, 400
+        scanned_at = item.get('scanned_at')
+        if scanned_at:
+            try:
+                scanned_at = datetime.fromisoformat(scanned_at)
+            except (TypeError, ValueError):
+                return {"success": False, "message": f"掃描時間格式錯誤: {scanned_at}"}, 400
+            if scanned_at.tzinfo is not None:
+                scanned_at = scanned_at.astimezone().replace(tzinfo=None)  # 統一為伺服器當地時間
+        # 編號統一成標準文字格式 (大小寫、連字號)；格式不正確的會回報找不到票券
+        ticket_id = parse_ticket_id(item['uuid'])
+        scans.append((ticket_id_text(ticket_id) if ticket_id else item['uuid'], item.get('pin'), scanned_at or None))
 
-            if row['status'] == 'Used':
-                return {"success": False, "message": "此票券已經使用過了"}
+    try:
+        results = gate_cache.scan_batch(scans, device=device)
+    except Exception as e:
+        print(f"批次核銷失敗: {e}")
+        return {"success": False, "message": str(e)}, 500
+    return {"success": True,
+            "admitted": sum(1 for r in results if r['success']),
+            "results": results}
 
-            if input_pin != row['validation_pin']:
-                return {"success": False, "message": "核銷碼錯誤"}
 
-            # 用 GETDATE() 取得當前時間
-            cursor.execute("UPDATE Tickets SET status = 'Used', used_at = GETDATE() WHERE ticket_uuid = ?", (uuid,))
-            conn.commit()
-            return {"success": True, "message": "驗證成功，歡迎入場！"}
+# --- 開場前預先載入展覽的票券 (入場核銷快取) ---
+@app.route('/admin/gate/preload/<int:id>', methods=['POST'])
+def admin_gate_preload(id):
+    if not is_admin(): return {"success": False, "message": "權限不足"}, 403
+    try:
+        count = gate_cache.preload(id)
     except Exception as e:
-        conn.rollback()
         return {"success": False, "message": str(e)}, 500
-    finally:
-        conn.close()
+    return {"success": True, "tickets": count}
 
 
 # ==========================================
@@ -477,19 +1178,57 @@ def admin_dashboard():
         flash("權限不足，請以管理員身分登入")
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
+    # keyset 分頁：依 exhibition_id 新到舊
+    after = decode_cursor(request.args.get('after'))
+    limit = app.config['PAGE_SIZE_MAX']
+
+    conn = get_db_connection(read_only=True)
     try:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM Exhibitions ORDER BY exhibition_id DESC")
+            if after and isinstance(after[0], int):
+                cursor.execute(f"""
+                    SELECT exhibition_id, title, location, start_date, status
+                    FROM Exhibitions WHERE exhibition_id < ? ORDER BY exhibition_id DESC {db.limit_sql}
+                """, (after[0], limit + 1))
+            else:
+                cursor.execute(f"""
+                    SELECT exhibition_id, title, location, start_date, status
+                    FROM Exhibitions ORDER BY exhibition_id DESC {db.limit_sql}
+                """, (limit + 1,))
             
-            rows = cursor.fetchall()
-            # ★ 補上轉換邏輯
-            exhibitions = [to_dict(cursor, row) for row in rows]
-        return render_template('admin/dashboard.html', exhibitions=exhibitions)
+            exhibitions = fetch_all(cursor)
+            # 刪除中的展覽顯示背景刪除的進度
+            purge_progress = exhibition_purger.progress(
+                cursor, [ex['exhibition_id'] for ex in exhibitions if ex['status'] == DELETING])
+
+        next_cursor = None
+        if len(exhibitions) > limit:
+            exhibitions = exhibitions[:limit]
+            next_cursor = encode_cursor([exhibitions[-1]['exhibition_id']])
+        return render_template('admin/dashboard.html', exhibitions=exhibitions, purge_progress=purge_progress,
+                               next_cursor=next_cursor, is_first_page=after is None)
     finally:
         conn.close()
 
 
+# --- 連線池統計 (評估連線池大小用) ---
+@app.route('/admin/pool_stats')
+def admin_pool_stats():
+    if not is_admin(): return {"success": False, "message": "權限不足"}, 403
+    return get_db_router().stats()
+
+
+# --- 快取統計 ---
+@app.route('/admin/cache_stats')
+def admin_cache_stats():
+    if not is_admin(): return {"success": False, "message": "權限不足"}, 403
+    return {"catalog": catalog_cache.stats(), "search": search_index.stats(), "qrcode": qr_cache.stats(),
+            "seats": seat_counter.stats(), "holds": inventory_holds.stats(), "checkout_queue": waiting_room.stats(),
+            "gate": gate_cache.stats(), "images": image_pipeline.stats(), "http": catalog_version.stats(),
+            "fragments": detail_fragments.stats(),
+            "purge": exhibition_purger.stats()}
+
+
 # --- 新增展覽 (自動新增主辦單位 + 圖片上傳) ---
 @app.route('/admin/create', methods=['GET', 'POST'])
 def admin_create_exhibition():
@@ -507,8 +1246,7 @@ def admin_create_exhibition():
                 if existing_org:
                     organizer_id = existing_org[0]
                 else:
-                    cursor.execute("SET NOCOUNT ON; INSERT INTO Organizers (name) VALUES (?); SELECT SCOPE_IDENTITY()", (org_name,))
-                    organizer_id = int(cursor.fetchone()[0])  # 用 fetchone() 取 ID
+                    organizer_id = db.insert_returning_id(cursor, "INSERT INTO Organizers (name) VALUES (?)", (org_name,))
 
                 # 2. 處理圖片上傳
                 image_path = None
@@ -518,7 +1256,7 @@ def admin_create_exhibition():
                         image_path = save_exhibition_image(file)          
 
                 # 3. 新增展覽
-                cursor.execute("""
+                exhibition_id = db.insert_returning_id(cursor, """
                     INSERT INTO Exhibitions (organizer_id, title, location, description, start_date, end_date, status, validation_pin, image_path)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
@@ -533,12 +1271,17 @@ def admin_create_exhibition():
                     image_path
                 ))
                 conn.commit()
+                mark_recent_write()
+                catalog_cache.invalidate()
+                reindex_exhibition(cursor, exhibition_id)
+                catalog_version.bump(exhibition_id)
+                if image_path:
+                    image_pipeline.submit(image_path)
                 flash(f'新增成功 (主辦: {org_name})')
                 return redirect(url_for('admin_dashboard'))
 
             cursor.execute("SELECT * FROM Organizers")
-            rows = cursor.fetchall()
-            organizers = [to_dict(cursor, row) for row in rows]
+            organizers = fetch_all(cursor)
             return render_template('admin/create.html', organizers=organizers)
     finally:
         conn.close()
@@ -555,9 +1298,13 @@ def admin_edit_exhibition(id):
             # POST: 更新資料
             if request.method == 'POST':
                 # 1. 取得目前的圖片路徑
-                cursor.execute("SELECT image_path FROM Exhibitions WHERE exhibition_id = ?", (id,))
+                cursor.execute("SELECT image_path, image_variants, status FROM Exhibitions WHERE exhibition_id = ?", (id,))
                 current = cursor.fetchone()
+                if current and current[2] == DELETING:
+                    flash('此展覽正在刪除中，無法修改')
+                    return redirect(url_for('admin_dashboard'))
                 old_image_path = current[0] if current else None
+                old_image_variants = current[1] if current else None
                 
                 # 2. 處理圖片上傳
                 new_image_path = old_image_path  # 預設保留原圖
@@ -576,18 +1323,30 @@ def admin_edit_exhibition(id):
                         # 儲存新圖
                         new_image_path = save_exhibition_image(file, id)                     
                 
+                # 換圖後舊的縮圖清單作廢，等背景產生新的
+                image_changed = new_image_path != old_image_path
+                new_image_variants = None if image_changed else old_image_variants
+
                 # 3. 更新資料庫
                 cursor.execute("""
                     UPDATE Exhibitions 
                     SET title=?, location=?, description=?, 
-                        start_date=?, end_date=?, status=?, validation_pin=?, image_path=?
+                        start_date=?, end_date=?, status=?, validation_pin=?, image_path=?, image_variants=?
                     WHERE exhibition_id=?
                 """, (
                     request.form['title'], request.form['location'], request.form['description'],
                     request.form['start_date'], request.form['end_date'], request.form['status'],
-                    request.form['validation_pin'], new_image_path, id
+                    request.form['validation_pin'], new_image_path, new_image_variants, id
                 ))
                 conn.commit()
+                mark_recent_write()
+                catalog_cache.invalidate()
+                reindex_exhibition(cursor, id)
+                catalog_version.bump(id)
+                detail_fragments.invalidate(id)
+                gate_cache.invalidate(id)  # 核銷碼可能被修改
+                if image_changed and new_image_path:
+                    image_pipeline.submit(new_image_path)
                 flash('展覽修改成功！')
                 return redirect(url_for('admin_dashboard'))
 
@@ -599,10 +1358,7 @@ def admin_edit_exhibition(id):
                 WHERE E.exhibition_id = ?
             """
             cursor.execute(sql, (id,))
-            exhibition = cursor.fetchone()
-            if exhibition:  # 如果有抓到資料，就轉成字典
-                columns = [column[0] for column in cursor.description]
-                exhibition = dict(zip(columns, exhibition))
+            exhibition = fetch_one(cursor)
 
             if not exhibition:
                 flash('找不到該展覽')
@@ -613,7 +1369,7 @@ def admin_edit_exhibition(id):
         conn.close()
 
 
-# --- 刪除展覽 ---
+# --- 刪除展覽 (立即下架，關聯資料在背景分批刪除) ---
 @app.route('/admin/delete/<int:id>', methods=['POST'])
 def admin_delete_exhibition(id):
     if not is_admin(): return redirect(url_for('index'))
@@ -621,36 +1377,24 @@ def admin_delete_exhibition(id):
     conn = get_db_connection()
     try:
         with conn.cursor() as cursor:
-            # 1. 先取得展覽圖片路徑，稍後刪除檔案
-            cursor.execute("SELECT image_path FROM Exhibitions WHERE exhibition_id = ?", (id,))
-            result = cursor.fetchone()
-            image_path = result[0] if result else None
-
-            # 2. 刪除相關聯的資料 (注意外鍵順序)
-            # 2.1 先刪除票券 (Tickets 關聯 Sessions 和 TicketTypes)
-            cursor.execute("""
-                DELETE FROM Tickets 
-                WHERE session_id IN (SELECT session_id FROM Sessions WHERE exhibition_id = ?)
-                   OR ticket_type_id IN (SELECT ticket_type_id FROM TicketTypes WHERE exhibition_id = ?)
-            """, (id, id))
-            
-            # 2.2 刪除場次
-            cursor.execute("DELETE FROM Sessions WHERE exhibition_id = ?", (id,))
-            
-            # 2.3 刪除票種
-            cursor.execute("DELETE FROM TicketTypes WHERE exhibition_id = ?", (id,))
-            
-            # 3. 刪除展覽本身
-            cursor.execute("DELETE FROM Exhibitions WHERE exhibition_id = ?", (id,))
-            
+            # 票券可能多達數十萬張，一次刪除會長時間鎖住 Tickets 擋住所有結帳；
+            # 這裡只把展覽標為刪除中 (前台立即看不到) 並建立工作，由 exhibition_purger 分批刪除
+            job_id, _ = exhibition_purger.enqueue(cursor, id)
+            if job_id is None:
+                flash('找不到該展覽')
+                return redirect(url_for('admin_dashboard'))
             conn.commit()
-            
-            # 4. 刪除圖片檔案
-            if image_path:
-                delete_old_image(image_path)
-            
-            flash('展覽已成功刪除！')
-            
+            mark_recent_write()
+            catalog_cache.invalidate()
+            search_index.remove(id)
+            seat_counter.invalidate(id)
+            catalog_version.bump(id)
+            detail_fragments.invalidate(id)
+            gate_cache.invalidate(id)
+            exhibition_purger.wake()
+
+            flash('展覽已下架，場次、票種與票券將在背景分批刪除，完成後自動移除')
+
     except Exception as e:
         conn.rollback()
         flash(f'刪除失敗: {e}')
@@ -661,6 +1405,83 @@ def admin_delete_exhibition(id):
     return redirect(url_for('admin_dashboard'))
 
 
+# --- 背景刪除工作的進度 ---
+@app.route('/admin/purge_jobs')
+def admin_purge_jobs():
+    if not is_admin(): return {"success": False, "message": "權限不足"}, 403
+    conn = get_db_connection()
+    if not conn: return {"success": False, "message": "DB Error"}, 500
+    try:
+        return {"success": True, "jobs": exhibition_purger.jobs(conn, parse_limit(request.args.get('limit'), 20, 100))}
+    finally:
+        conn.close()
+
+
+# --- 銷售報表 (只讀彙總表) ---
+app.config['SALES_REPORT_DAYS'] = 30
+
+
+def load_sales_report(exhibition_id=None):
+    """全站 (或單一展覽) 的銷售數字；展覽不存在時回傳 None"""
+    conn = get_db_connection(read_only=True)
+    if not conn: raise RuntimeError("DB Connection Error")
+    try:
+        with conn.cursor() as cursor:
+            days = app.config['SALES_REPORT_DAYS']
+            if exhibition_id is None:
+                tickets_sold, revenue = grand_total(cursor)
+                return {'tickets_sold': tickets_sold, 'revenue': revenue,
+                        'exhibitions': exhibition_totals(db, cursor), 'daily': daily_sales(cursor, days)}
+
+            cursor.execute("SELECT exhibition_id, title, status FROM Exhibitions WHERE exhibition_id = ?", (exhibition_id,))
+            exhibition = fetch_one(cursor)
+            if not exhibition:
+                return None
+            sessions = session_sales(cursor, exhibition_id)
+            ticket_types = ticket_type_sales(cursor, exhibition_id)
+            return {'exhibition': exhibition,
+                    'tickets_sold': sum(t['tickets_sold'] for t in ticket_types),
+                    'revenue': sum(t['revenue'] for t in ticket_types),
+                    'sessions': sessions, 'ticket_types': ticket_types,
+                    'daily': daily_sales(cursor, days, exhibition_id)}
+    finally:
+        conn.close()
+
+
+@app.route('/admin/sales')
+@app.route('/admin/sales/<int:id>')
+def admin_sales(id=None):
+    if 'user_id' not in session or not is_admin():
+        flash("權限不足，請以管理員身分登入")
+        return redirect(url_for('login'))
+    report = load_sales_report(id)
+    if report is None: return "找不到該展覽", 404
+    return render_template('admin/sales.html', report=report, days=app.config['SALES_REPORT_DAYS'])
+
+
+@app.route('/admin/sales_summary')
+def admin_sales_summary():
+    if not is_admin(): return {"success": False, "message": "權限不足"}, 403
+    try:
+        exhibition_id = int(request.args['exhibition_id']) if request.args.get('exhibition_id') else None
+    except ValueError:
+        return {"success": False, "message": "exhibition_id 格式錯誤"}, 400
+    report = load_sales_report(exhibition_id)
+    if report is None: return {"success": False, "message": "找不到該展覽"}, 404
+    for key in ('exhibitions', 'daily', 'sessions', 'ticket_types'):
+        if key in report:
+            report[key] = [json_row(row) for row in report[key]]
+    if 'exhibition' in report:
+        report['exhibition'] = json_row(report['exhibition'])
+    return {"success": True, **report}
+
+
+def json_row(row):
+    """查詢結果轉成 JSON 用的 dict；日期與時間改為 ISO 格式 (Flask 預設會轉成 HTTP 日期字串)"""
+    return {key: value.isoformat() if isinstance(value, (date, datetime)) else value
+            for key, value in row._asdict().items()}
+
+
 # --- 管理展覽細項 (場次與票種) ---
 @app.route('/admin/manage/<int:id>', methods=['GET', 'POST'])
 def admin_manage_exhibition(id):
@@ -670,6 +1491,12 @@ def admin_manage_exhibition(id):
     try:
         with conn.cursor() as cursor:
             if request.method == 'POST':
+                cursor.execute("SELECT status FROM Exhibitions WHERE exhibition_id = ?", (id,))
+                current = cursor.fetchone()
+                if current and current[0] == DELETING:
+                    flash('此展覽正在刪除中，無法修改')
+                    return redirect(url_for('admin_dashboard'))
+
                 # 新增場次
                 if 'add_session' in request.form:
                     # 將前端格式: "2025-12-31T19:30" ->改成 資料庫格式: "2025-12-31 19:30:00"
@@ -689,24 +1516,19 @@ def admin_manage_exhibition(id):
                                    (id, request.form['name'], request.form['price']))
                     flash('票種已新增')
                 conn.commit()
+                mark_recent_write()
+                seat_counter.invalidate(id)
+                catalog_version.bump(id)
+                detail_fragments.invalidate(id)  # 票種選項可能改變
 
             cursor.execute("SELECT * FROM Exhibitions WHERE exhibition_id = ?", (id,))
-            exhibition = cursor.fetchone()
-            if exhibition:  # 如果有抓到資料，就轉成字典
-                columns = [column[0] for column in cursor.description]
-                exhibition = dict(zip(columns, exhibition))
+            exhibition = fetch_one(cursor)
 
             cursor.execute("SELECT * FROM Sessions WHERE exhibition_id = ?", (id,))
-            sessions = cursor.fetchall()
-            if sessions:
-                columns = [column[0] for column in cursor.description]
-                sessions = [dict(zip(columns, row)) for row in sessions]
+            sessions = fetch_all(cursor)
 
             cursor.execute("SELECT * FROM TicketTypes WHERE exhibition_id = ?", (id,))
-            ticket_types = cursor.fetchall()
-            if ticket_types:
-                columns = [column[0] for column in cursor.description]
-                ticket_types = [dict(zip(columns, row)) for row in ticket_types]
+            ticket_types = fetch_all(cursor)
             
             return render_template('admin/manage.html', ex=exhibition, sessions=sessions, types=ticket_types)
     finally:
@@ -0,0 +1,358 @@
+"""
+Flask 路由端對端基準測試 (離線，不需瀏覽器)
+
+以 Flask test client 直接呼叫 app，依腳本模擬使用情境，統計每個路由的
+吞吐量與 p50 / p95 / p99 延遲，並把結果存成 JSON 方便前後版本比較。
+
+注意：checkout_storm 會扣庫存、gate_scan 會把票券標記為已使用，
+請對可以隨時重建的本機測試資料庫執行 (例如先跑 python init_database.py)。
+
+執行方式 (在專案根目錄)：
+    python -m benchmarks.routes
+    python -m benchmarks.routes --scenarios browse,search --requests 500 --concurrency 8
+    python -m benchmarks.routes --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from ticket_ids import ticket_id_text
+
+SCENARIOS = ['browse', 'search', 'add_to_cart', 'checkout_storm', 'gate_scan', 'gate_batch']
+SEARCH_KEYWORDS = ['莫內', '華山', '寶可夢', '梵谷', 'teamLab', '吉卜力', '文創園區', '特展', '中正紀念堂', '不存在的展覽']
+
+
+class Recorder:
+    """收集每個路由的延遲 (毫秒) 與回應狀態"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}   # (情境, 路由) -> [毫秒]
+        self.statuses = {}  # (情境, 路由) -> {狀態碼: 次數}
+        self.outcomes = {}  # 情境 -> {結果: 次數}
+        self.wall = {}      # 情境 -> 總耗時 (秒)
+
+    def timed(self, scenario, route, fn):
+        start = time.perf_counter()
+        response = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.samples.setdefault((scenario, route), []).append(elapsed)
+            counts = self.statuses.setdefault((scenario, route), {})
+            counts[response.status_code] = counts.get(response.status_code, 0) + 1
+        return response
+
+    def outcome(self, scenario, name):
+        with self._lock:
+            counts = self.outcomes.setdefault(scenario, {})
+            counts[name] = counts.get(name, 0) + 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+# ==========================================
+# 測試資料探索
+# ==========================================
+
+def discover(app_module):
+    """從資料庫找出情境需要的展覽、場次、票種、會員與票券"""
+    conn = app_module.get_db_connection()
+    if not conn:
+        raise SystemExit("無法連線資料庫，請確認 app.py 的資料庫設定")
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT exhibition_id FROM Exhibitions WHERE status IN ('Published', 'Ended')")
+        exhibition_ids = [row[0] for row in cursor.fetchall()]
+
+        # 可購買的場次 (展覽未結束、場次未開始)，依剩餘座位多到少
+        cursor.execute("""
+            SELECT S.session_id, S.exhibition_id, S.capacity, TT.ticket_type_id
+            FROM Sessions S
+            JOIN Exhibitions E ON S.exhibition_id = E.exhibition_id
+            JOIN TicketTypes TT ON TT.exhibition_id = E.exhibition_id
+            WHERE E.status = 'Published' AND S.session_time > ? AND E.end_date >= ?
+            ORDER BY S.capacity DESC
+        """, (datetime.now(), datetime.now().date()))
+        purchasable = [tuple(row) for row in cursor.fetchall()]
+
+        cursor.execute("SELECT member_id FROM Members WHERE role = 'user'")
+        member_ids = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute("""
+            SELECT T.ticket_uuid, E.validation_pin
+            FROM Tickets T
+            JOIN TicketTypes TT ON T.ticket_type_id = TT.ticket_type_id
+            JOIN Exhibitions E ON TT.exhibition_id = E.exhibition_id
+            WHERE T.status = 'Unused'
+        """)
+        tickets = [(ticket_id_text(row[0]), row[1]) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    return {'exhibition_ids': exhibition_ids, 'purchasable': purchasable, 'member_ids': member_ids, 'tickets': tickets}
+
+
+# ==========================================
+# 情境
+# ==========================================
+
+def login_as(client, member_id):
+    """直接寫入 session 模擬登入，避免密碼雜湊的成本干擾測量"""
+    with client.session_transaction() as sess:
+        sess['user_id'] = member_id
+        sess['user_name'] = f'bench-{member_id}'
+        sess['role'] = 'user'
+
+
+def scenario_browse(app, data, rec, rng, n):
+    client = app.test_client()
+    for _ in range(n):
+        response = rec.timed('browse', 'GET /', lambda: client.get('/'))
+        if data['exhibition_ids']:
+            ex_id = rng.choice(data['exhibition_ids'])
+            rec.timed('browse', 'GET /exhibition/<id>', lambda: client.get(f'/exhibition/{ex_id}'))
+        rec.outcome('browse', 'ok' if response.status_code == 200 else 'error')
+
+
+def scenario_search(app, data, rec, rng, n):
+    client = app.test_client()
+    for _ in range(n):
+        keyword = rng.choice(SEARCH_KEYWORDS)
+        response = rec.timed('search', 'GET /?q=', lambda: client.get('/', query_string={'q': keyword}))
+        rec.outcome('search', 'ok' if response.status_code == 200 else 'error')
+
+
+def scenario_add_to_cart(app, data, rec, rng, n):
+    if not data['purchasable']:
+        return
+    client = app.test_client()
+    for i in range(n):
+        session_id, ex_id, _, ticket_type_id = rng.choice(data['purchasable'])
+        form = {'session_id': session_id, 'ticket_type': ticket_type_id, 'quantity': rng.randint(1, 4)}
+        response = rec.timed('add_to_cart', 'POST /exhibition/<id>', lambda: client.post(f'/exhibition/{ex_id}', data=form))
+        rec.timed('add_to_cart', 'GET /cart', lambda: client.get('/cart'))
+        rec.outcome('add_to_cart', 'ok' if response.status_code == 302 else 'error')
+        if i % 20 == 19:
+            client.get('/clear_cart')
+
+
+def run_checkout_storm(app, data, rec, rng, n, concurrency):
+    """所有使用者同時搶購同一個場次 (剩餘座位最多的那一場)"""
+    if not data['purchasable'] or not data['member_ids']:
+        return
+    session_id, ex_id, _, ticket_type_id = data['purchasable'][0]
+
+    # 先各自把票加入購物車，再用 barrier 讓所有人同時按下結帳
+    clients = []
+    for i in range(n):
+        client = app.test_client()
+        login_as(client, data['member_ids'][i % len(data['member_ids'])])
+        client.post(f'/exhibition/{ex_id}', data={'session_id': session_id, 'ticket_type': ticket_type_id,
+                                                  'quantity': rng.randint(1, 2)})
+        clients.append(client)
+
+    barrier = threading.Barrier(min(concurrency, n))
+
+    def checkout(client):
+        try:
+            barrier.wait(timeout=10)
+        except threading.BrokenBarrierError:
+            pass
+        response = rec.timed('checkout_storm', 'POST /checkout', lambda: client.post('/checkout'))
+        location = response.headers.get('Location', '')
+        if 'waiting' in location:
+            # 進入排隊：模擬排隊頁輪詢，輪到時再送出一次結帳
+            rec.outcome('checkout_storm', 'queued')
+            while True:
+                status = rec.timed('checkout_storm', 'GET /api/checkout/queue', lambda: client.get('/api/checkout/queue'))
+                data = status.get_json()
+                if not data.get('success') or data['ready']:
+                    break
+                time.sleep(min(data['retry_after'], 0.05))
+            response = rec.timed('checkout_storm', 'POST /checkout', lambda: client.post('/checkout'))
+            location = response.headers.get('Location', '')
+        rec.outcome('checkout_storm', 'success' if 'my_tickets' in location else 'rejected')
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(checkout, clients))
+
+
+def scenario_gate_scan(app, data, rec, rng, n):
+    client = app.test_client()
+    with data['lock']:
+        batch = [data['tickets'].pop() for _ in range(min(n, len(data['tickets'])))]
+    for i, (ticket_uuid, pin) in enumerate(batch):
+        # 約 5% 模擬輸錯 PIN，另外每 10 張重刷一次已使用的票
+        wrong_pin = rng.random() < 0.05
+        payload = {'uuid': ticket_uuid, 'pin': '0000' if wrong_pin and pin != '0000' else pin}
+        response = rec.timed('gate_scan', 'POST /api/use_ticket', lambda: client.post('/api/use_ticket', json=payload))
+        body = response.get_json(silent=True) or {}
+        rec.outcome('gate_scan', 'admitted' if body.get('success') else 'refused')
+        if i % 10 == 9:
+            rec.timed('gate_scan', 'POST /api/use_ticket', lambda: client.post('/api/use_ticket', json=payload))
+            rec.outcome('gate_scan', 'rescan')
+
+
+def scenario_gate_batch(app, data, rec, rng, n):
+    """掃描機離線暫存後每 50 張上傳一次；每批重送一次 (模擬網路中斷後重傳)"""
+    client = app.test_client()
+    device = f'bench-scanner-{rng.random():.6f}'
+    with data['lock']:
+        tickets = [data['tickets'].pop() for _ in range(min(n, len(data['tickets'])))]
+    for start in range(0, len(tickets), 50):
+        payload = {'device': device, 'scans': [
+            {'uuid': ticket_uuid, 'pin': pin, 'scanned_at': datetime.now().isoformat()}
+            for ticket_uuid, pin in tickets[start:start + 50]]}
+        for _ in range(2):
+            response = rec.timed('gate_batch', 'POST /api/use_tickets', lambda: client.post('/api/use_tickets', json=payload))
+            body = response.get_json(silent=True) or {}
+            for result in body.get('results', []):
+                rec.outcome('gate_batch', result['result'])
+
+
+SIMPLE_SCENARIOS = {
+    'browse': scenario_browse,
+    'search': scenario_search,
+    'add_to_cart': scenario_add_to_cart,
+    'gate_scan': scenario_gate_scan,
+    'gate_batch': scenario_gate_batch,
+}
+
+
+def run_scenario(name, app, data, rec, requests, concurrency, seed):
+    start = time.perf_counter()
+    if name == 'checkout_storm':
+        run_checkout_storm(app, data, rec, random.Random(seed), requests, concurrency)
+    else:
+        fn = SIMPLE_SCENARIOS[name]
+        per_worker = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(fn, app, data, rec, random.Random(seed + i), count)
+                       for i, count in enumerate(per_worker) if count]
+            for future in futures:
+                future.result()
+    rec.wall[name] = time.perf_counter() - start
+
+
+# ==========================================
+# 報告
+# ==========================================
+
+def summarize(rec):
+    routes = []
+    for (scenario, route), samples in sorted(rec.samples.items()):
+        ordered = sorted(samples)
+        wall = rec.wall.get(scenario) or 1e-9
+        routes.append({
+            'scenario': scenario,
+            'route': route,
+            'count': len(ordered),
+            'throughput_rps': round(len(ordered) / wall, 1),
+            'mean_ms': round(sum(ordered) / len(ordered), 3),
+            'p50_ms': round(percentile(ordered, 50), 3),
+            'p95_ms': round(percentile(ordered, 95), 3),
+            'p99_ms': round(percentile(ordered, 99), 3),
+            'max_ms': round(ordered[-1], 3),
+            'statuses': {str(k): v for k, v in sorted(rec.statuses[(scenario, route)].items())},
+        })
+    return routes
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_summary(routes, rec, baseline=None):
+    base = {(r['scenario'], r['route']): r for r in baseline['routes']} if baseline else {}
+    header = f"{'情境':<16}{'路由':<28}{'次數':>7}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+    if base:
+        header += f"{'p95 變化':>12}"
+    print(header)
+    for r in routes:
+        line = (f"{r['scenario']:<16}{r['route']:<28}{r['count']:>7}{r['throughput_rps']:>9.1f}"
+                f"{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}")
+        old = base.get((r['scenario'], r['route']))
+        if old and old['p95_ms']:
+            line += f"{(r['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100:>+11.1f}%"
+        print(line)
+    for scenario, counts in sorted(rec.outcomes.items()):
+        print(f"  {scenario} 結果：" + "，".join(f"{k} {v}" for k, v in sorted(counts.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"以逗號分隔，可用：{', '.join(SCENARIOS)}")
+    parser.add_argument('--requests', type=int, default=200, help='每個情境的迭代次數')
+    parser.add_argument('--concurrency', type=int, default=8, help='併發執行緒數')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default='bench_results.json', help='結果輸出的 JSON 檔')
+    parser.add_argument('--compare', help='與先前輸出的 JSON 檔比較 p95 變化')
+    args = parser.parse_args()
+
+    import app as app_module
+    app = app_module.app
+    app.config['TESTING'] = True
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知的情境：{', '.join(sorted(unknown))}")
+
+    data = discover(app_module)
+    data['lock'] = threading.Lock()
+    random.Random(args.seed).shuffle(data['tickets'])
+    rec = Recorder()
+
+    # 先暖機一次，讓連線池與各種快取進入穩定狀態
+    warmup = app.test_client()
+    warmup.get('/')
+    warmup.get('/', query_string={'q': SEARCH_KEYWORDS[0]})
+
+    for name in scenarios:
+        print(f"執行情境 {name} ...")
+        run_scenario(name, app, data, rec, args.requests, args.concurrency, args.seed)
+
+    routes = summarize(rec)
+    result = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'seed': args.seed,
+        'scenarios': {name: {'wall_seconds': round(rec.wall.get(name, 0), 3), 'outcomes': rec.outcomes.get(name, {})}
+                      for name in scenarios},
+        'routes': routes,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print()
+    print_summary(routes, rec, baseline)
+    print(f"\n結果已寫入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+查詢結果轉換的微基準測試：比較舊的 to_dict()、dict(zip(...)) 與 row_mapping 的 Record
+
+執行方式 (在專案根目錄)：
+    python -m benchmarks.row_mapping --rows 10000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import date
+
+from row_mapping import map_rows
+
+COLUMNS = ('exhibition_id', 'organizer_id', 'title', 'location', 'start_date', 'end_date', 'status', 'image_path')
+
+
+class FakeCursor:
+    """模擬 pyodbc cursor：只提供 description 與 fetchall()"""
+
+    def __init__(self, rows):
+        self.description = [(name, None, None, None, None, None, True) for name in COLUMNS]
+        self._rows = rows
+
+    def fetchall(self):
+        return self._rows
+
+
+def make_rows(n):
+    return [
+        (i, i % 20 + 1, f'展覽 {i}', f'華山1914文創園區 {i % 7} 館',
+         date(2025, 1 + i % 12, 1), date(2026, 1 + i % 12, 28), 'Published', None)
+        for i in range(n)
+    ]
+
+
+# --- 三種轉換方式 ---
+def legacy_to_dict(cursor, rows):
+    # 舊寫法：每一筆資料都重新從 cursor.description 取欄位名稱
+    return [dict(zip([column[0] for column in cursor.description], row)) for row in rows]
+
+
+def dict_zip_once(cursor, rows):
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def records(cursor, rows):
+    return map_rows(cursor, rows)
+
+
+def measure(fn, rows, repeat):
+    cursor = FakeCursor(rows)
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn(cursor, rows)
+        best = min(best, time.perf_counter() - start)
+
+    # 保留結果時每筆資料額外配置的記憶體
+    gc.collect()
+    tracemalloc.start()
+    result = fn(cursor, rows)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return best, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    print(f"資料筆數: {args.rows}，欄位數: {len(COLUMNS)}，取 {args.repeat} 次中最快的一次")
+    print(f"{'方式':<16}{'總時間 (ms)':>14}{'每筆 (ns)':>12}{'每筆記憶體 (bytes)':>22}")
+    baseline = None
+    for name, fn in (('to_dict()', legacy_to_dict), ('dict(zip) 一次', dict_zip_once), ('Record', records)):
+        elapsed, retained = measure(fn, rows, args.repeat)
+        baseline = baseline or elapsed
+        print(f"{name:<16}{elapsed * 1000:>14.2f}{elapsed / args.rows * 1e9:>12.0f}"
+              f"{retained / args.rows:>22.0f}   ({baseline / elapsed:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+票券編號的寫入基準測試：比較舊的 uuid4 文字主鍵 (VARCHAR(36)) 與時間排序的 16 bytes 二進位主鍵
+
+在目前設定的資料庫中建立兩張暫時的資料表 (欄位與索引同 Tickets)，模擬結帳每次寫入幾張票券並 commit，
+統計每秒寫入筆數、寫入過程中的最慢批次，以及寫入後主鍵與各索引佔用的空間。測試完會刪除這兩張資料表。
+
+執行方式 (在專案根目錄)：
+    python -m benchmarks.ticket_ids --rows 200000
+    python -m benchmarks.ticket_ids --backend sqlite --rows 200000 --batch 4
+"""
+import argparse
+import random
+import time
+import uuid
+
+from db_backends import get_dialect, translate_ddl
+from ticket_ids import new_ticket_id
+
+LAYOUTS = [
+    # (名稱, 資料表, 主鍵型別, 產生主鍵)
+    ('uuid4 VARCHAR(36)', 'BenchTickets_uuid4', 'VARCHAR(36)', lambda: str(uuid.uuid4())),
+    ('v7 BINARY(16)', 'BenchTickets_v7', '{binary16}', lambda: new_ticket_id()),
+]
+
+
+def create_table(db, cursor, table, key_type):
+    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    cursor.execute(translate_ddl(f"""
+        CREATE TABLE {table} (
+            ticket_uuid {key_type} NOT NULL,
+            order_id INT NOT NULL,
+            ticket_type_id INT NOT NULL,
+            session_id INT,
+            status VARCHAR(20) DEFAULT 'Unused',
+            used_at DATETIME,
+            CONSTRAINT PK_{table} PRIMARY KEY (ticket_uuid)
+        )
+    """, db))
+    cursor.execute(db.create_index_sql(f'IX_{table}_order_id', table, 'order_id', 'ticket_type_id, session_id, status'))
+    cursor.execute(db.create_index_sql(f'IX_{table}_session_id', table, 'session_id'))
+
+
+def index_sizes(db, cursor, table):
+    """回傳 {索引名稱: KB}"""
+    if db.name == 'sqlite':
+        # 主鍵不是 INTEGER PRIMARY KEY 時，SQLite 會另外建立 sqlite_autoindex_* 索引
+        cursor.execute("""
+            SELECT name, SUM(pgsize) FROM dbstat
+            WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = ?)
+            GROUP BY name
+        """, (table,))
+        return {row[0]: row[1] // 1024 for row in cursor.fetchall()}
+    cursor.execute("""
+        SELECT I.name, SUM(P.used_page_count) * 8
+        FROM sys.dm_db_partition_stats P
+        JOIN sys.indexes I ON P.object_id = I.object_id AND P.index_id = I.index_id
+        WHERE P.object_id = OBJECT_ID(?)
+        GROUP BY I.name
+    """, (table,))
+    return {row[0]: int(row[1]) for row in cursor.fetchall()}
+
+
+def fragmentation(db, cursor, table):
+    """(僅 SQL Server) 主鍵索引的邏輯碎片比例 (%)，反映頁面分裂的程度"""
+    if db.name == 'sqlite':
+        return None
+    cursor.execute("""
+        SELECT avg_fragmentation_in_percent FROM sys.dm_db_index_physical_stats(DB_ID(), OBJECT_ID(?), 1, NULL, 'LIMITED')
+    """, (table,))
+    row = cursor.fetchone()
+    return round(row[0], 1) if row else None
+
+
+def run(db, conn, name, table, key_type, make_key, rows, batch, rng):
+    cursor = conn.cursor()
+    create_table(db, cursor, table, key_type)
+    conn.commit()
+
+    sql = f"INSERT INTO {table} (ticket_uuid, order_id, ticket_type_id, session_id, status) VALUES (?, ?, ?, ?, 'Unused')"
+    slowest = 0
+    start = time.perf_counter()
+    for order_id in range(1, rows // batch + 1):
+        batch_start = time.perf_counter()
+        db.executemany(cursor, sql, [(make_key(), order_id, rng.randrange(1, 200), rng.randrange(1, 2000))
+                                     for _ in range(batch)])
+        conn.commit()
+        slowest = max(slowest, time.perf_counter() - batch_start)
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'name': name,
+        'rows_per_second': (rows // batch * batch) / elapsed if elapsed else 0,
+        'slowest_batch_ms': slowest * 1000,
+        'sizes': index_sizes(db, cursor, table),
+        'fragmentation': fragmentation(db, cursor, table),
+    }
+    cursor.execute(f"DROP TABLE {table}")
+    conn.commit()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='每種主鍵寫入的票券數')
+    parser.add_argument('--batch', type=int, default=2, help='每次 commit 寫入幾張 (模擬一筆訂單)')
+    parser.add_argument('--backend', choices=['mssql', 'sqlite'], help='資料庫後端 (預設讀取環境變數 DB_BACKEND)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    db = get_dialect(args.backend)
+    conn = db.connect()
+    try:
+        print(f"資料庫: {db.name}，每種主鍵寫入 {args.rows:,} 筆，每次 commit {args.batch} 筆")
+        for name, table, key_type, make_key in LAYOUTS:
+            r = run(db, conn, name, table, key_type, make_key, args.rows, args.batch, random.Random(args.seed))
+            print(f"\n## {r['name']}")
+            print(f"   寫入: {r['rows_per_second']:,.0f} 筆/秒，最慢一批 {r['slowest_batch_ms']:.1f} ms")
+            if r['fragmentation'] is not None:
+                print(f"   主鍵索引碎片: {r['fragmentation']}%")
+            for index, kb in sorted(r['sizes'].items()):
+                print(f"   {index:<40}{kb:>10,} KB")
+            print(f"   {'合計':<38}{sum(r['sizes'].values()):>10,} KB")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import threading
+import time
+
+
+class CatalogCache:
+    """
+    首頁展覽目錄的讀取快取 (read-through)
+    - 快取內容在 ttl 秒後過期，由下一個請求重新載入
+    - 後台新增 / 修改 / 刪除展覽時呼叫 invalidate()，版本號 +1 並讓快取立即失效
+    - 同時只有一個執行緒會重新載入，其他執行緒等待結果，避免快取失效瞬間的大量查詢
+    注意：版本號只存在單一行程中，多個 worker 之間依靠 ttl 達成最終一致
+    """
+
+    def __init__(self, loader, ttl=300):
+        self._loader = loader
+        self.ttl = ttl
+        self.version = 1
+        self._data = None
+        self._data_version = 0
+        self._expires_at = 0
+        self._lock = threading.Lock()          # 重新載入時持有 (可能很久)
+        self._version_lock = threading.Lock()  # 保護版本號與統計數字 (只持有很短的時間)
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _fresh(self):
+        return self._data is not None and self._data_version == self.version and time.monotonic() < self._expires_at
+
+    def get(self):
+        if self._fresh():
+            self._count(hits=1)
+            return self._data
+
+        with self._lock:
+            # 取得鎖之後再檢查一次，可能已被其他執行緒載入
+            if self._fresh():
+                self._count(hits=1)
+                return self._data
+            self._count(misses=1)
+            version = self.version
+            data = self._loader()
+            self._data = data
+            self._data_version = version
+            self._expires_at = time.monotonic() + self.ttl
+            return data
+
+    def _count(self, **counts):
+        with self._version_lock:
+            for key, n in counts.items():
+                self._stats[key] += n
+
+    def invalidate(self):
+        with self._version_lock:
+            self.version += 1
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._version_lock:
+            stats = dict(self._stats)
+        return dict(stats, version=self.version, ttl=self.ttl,
+                    cached=self._data is not None, size=len(self._data) if self._data is not None else 0)
@@ -0,0 +1,370 @@
+"""
+資料庫方言 (dialect) 與連線後端
+
+同一套路由與 init_database() 可以在 SQL Server 或 SQLite 上執行，
+差異 (連線方式、取得自動編號、目前時間、分頁、DDL 型別、批次寫入…) 都集中在這裡。
+
+以環境變數選擇後端：
+    DB_BACKEND=mssql   (預設) 使用 ODBC 連線 SQL Server
+    DB_BACKEND=sqlite  使用本機 SQLite 檔案，路徑由 DB_SQLITE_PATH 指定
+"""
+import os
+import re
+import sqlite3
+from datetime import date, datetime
+
+from row_mapping import columns_of, record_type
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# SQL Server 連線設定
+MSSQL_SERVER_CONNECTION_STRING = (
+    r'DRIVER={ODBC Driver 17 for SQL Server};'
+    r'SERVER=localhost\SQLEXPRESS;'
+    r'UID=root;'
+    r'PWD=wendy940704;'
+)
+MSSQL_DATABASE = 'ExhibitionTicketSystem'
+MSSQL_CONNECTION_STRING = MSSQL_SERVER_CONNECTION_STRING + f'DATABASE={MSSQL_DATABASE};'
+
+DEFAULT_SQLITE_PATH = os.path.join(BASE_DIR, 'instance', 'exhibition.sqlite3')
+
+
+class SQLServerDialect:
+    name = 'mssql'
+
+    # DDL 片段 (init_database 的建表語句使用)
+    ddl = {
+        'identity_pk': 'INT PRIMARY KEY IDENTITY(1,1)',
+        'text': 'NVARCHAR(MAX)',
+        'now': 'GETDATE()',
+        # 不用 UNIQUEIDENTIFIER：它的排序不是依位元組順序，時間排序的編號會失去效果
+        'binary16': 'BINARY(16)',
+    }
+    now_sql = 'GETDATE()'
+    # 放在 ORDER BY 之後，參數為筆數
+    limit_sql = 'OFFSET 0 ROWS FETCH NEXT ? ROWS ONLY'
+
+    def limit(self, count):
+        """筆數為常數時的 limit_sql (報告、腳本用)"""
+        return f'OFFSET 0 ROWS FETCH NEXT {int(count)} ROWS ONLY'
+
+    def __init__(self, connection_string=MSSQL_CONNECTION_STRING,
+                 server_connection_string=MSSQL_SERVER_CONNECTION_STRING, database=MSSQL_DATABASE):
+        self.connection_string = connection_string
+        self.server_connection_string = server_connection_string
+        self.database = database
+
+    def replica(self, target):
+        """唯讀副本：target 為副本的連線字串 (可加上 ApplicationIntent=ReadOnly)"""
+        return SQLServerDialect(connection_string=target, server_connection_string=self.server_connection_string,
+                                database=self.database)
+
+    def connect(self):
+        import pyodbc
+        return pyodbc.connect(self.connection_string)
+
+    def connect_for_setup(self):
+        """init_database 用：連到伺服器，必要時建立資料庫後切換過去"""
+        import pyodbc
+        conn = pyodbc.connect(self.server_connection_string, autocommit=True)
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            IF NOT EXISTS (SELECT * FROM sys.databases WHERE name = '{self.database}')
+            BEGIN
+                CREATE DATABASE {self.database};
+            END
+        """)
+        cursor.execute(f"USE {self.database};")
+        return conn
+
+    def insert_returning_id(self, cursor, sql, params=()):
+        """執行 INSERT 並回傳新資料列的自動編號"""
+        cursor.execute(f"SET NOCOUNT ON; {sql}; SELECT SCOPE_IDENTITY()", params)
+        row = cursor.fetchone()
+        if not row or row[0] is None:
+            raise Exception("無法取得新增資料的 ID")
+        return int(row[0])
+
+    def executemany(self, cursor, sql, rows):
+        cursor.fast_executemany = True
+        cursor.executemany(sql, rows)
+
+    def set_identity_insert(self, cursor, table, enabled):
+        cursor.execute(f"SET IDENTITY_INSERT {table} {'ON' if enabled else 'OFF'}")
+
+    def format_datetime(self, value):
+        """日期時間轉成查詢參數字串：毫秒精度，與 DATETIME 欄位比對時不會有誤差"""
+        return value.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+    def create_table_sql(self, table, body):
+        """建立資料表 (已存在則略過)"""
+        return f"IF OBJECT_ID('{table}') IS NULL CREATE TABLE {table} ({body})"
+
+    def rename_table_sql(self, table, new_name):
+        return f"EXEC sp_rename '{table}', '{new_name}'"
+
+    def uuid_to_binary_sql(self, expr):
+        """UUID 文字 (8-4-4-4-12) 轉成 16 bytes，位元組順序與文字相同 (不經過 UNIQUEIDENTIFIER 的混合位元組順序)"""
+        return f"CONVERT(BINARY(16), REPLACE({expr}, '-', ''), 2)"
+
+    def date_sql(self, expr):
+        """日期時間只取日期部分"""
+        return f"CAST({expr} AS DATE)"
+
+    def upsert_add_sql(self, table, keys, counters):
+        """
+        累加計數：keys 對應的資料列不存在時新增，存在時把 counters 加上參數值
+        參數順序為 keys + counters；HOLDLOCK 讓併發的第一次寫入不會同時走到 INSERT
+        """
+        columns = list(keys) + list(counters)
+        source = ', '.join(f'? AS {column}' for column in columns)
+        match = ' AND '.join(f'T.{key} = S.{key}' for key in keys)
+        update = ', '.join(f'{column} = T.{column} + S.{column}' for column in counters)
+        return f"""
+            MERGE {table} WITH (HOLDLOCK) AS T
+            USING (SELECT {source}) AS S ON {match}
+            WHEN MATCHED THEN UPDATE SET {update}
+            WHEN NOT MATCHED THEN INSERT ({', '.join(columns)}) VALUES ({', '.join(f'S.{column}' for column in columns)});
+        """
+
+    def delete_returning(self, cursor, table, columns, where, params=()):
+        """刪除符合條件的資料列並回傳被刪除的欄位值；同一列只會被一個交易刪到，可當作「認領」使用"""
+        output = ', '.join(f'DELETED.{column}' for column in columns)
+        cursor.execute(f"SET NOCOUNT ON; DELETE FROM {table} OUTPUT {output} WHERE {where}", params)
+        return cursor.fetchall()
+
+    def create_index_sql(self, name, table, columns, include=None):
+        include_sql = f" INCLUDE ({include})" if include else ""
+        return f"""
+            IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{name}' AND object_id = OBJECT_ID('{table}'))
+                CREATE NONCLUSTERED INDEX {name} ON {table} ({columns}){include_sql};
+        """
+
+    def query_plan(self, cursor, sql):
+        """以 SHOWPLAN_TEXT 取得估計執行計畫 (不會真的執行查詢)"""
+        cursor.execute("SET SHOWPLAN_TEXT ON")
+        try:
+            cursor.execute(sql)
+            lines = []
+            while True:
+                if cursor.description:
+                    lines.extend(row[0].rstrip() for row in cursor.fetchall())
+                if not cursor.nextset():
+                    break
+            return lines[1:]  # 第一筆是查詢本身
+        finally:
+            cursor.execute("SET SHOWPLAN_TEXT OFF")
+
+
+# ==========================================
+# SQLite
+# ==========================================
+
+def _parse_datetime(raw):
+    text = raw.decode('utf-8')
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return text
+
+
+def _parse_date(raw):
+    text = raw.decode('utf-8')
+    try:
+        return date.fromisoformat(text[:10])
+    except ValueError:
+        return text
+
+
+def _parse_decimal(raw):
+    return float(raw)
+
+
+def _unhex(text):
+    try:
+        return bytes.fromhex(text) if text is not None else None
+    except ValueError:
+        return None
+
+
+# 寫入時統一轉成 ISO 字串 ('YYYY-MM-DD HH:MM:SS[.ffffff]')，讀取時依欄位宣告型別轉回 Python 物件
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter('DATETIME', _parse_datetime)
+sqlite3.register_converter('DATE', _parse_date)
+sqlite3.register_converter('DECIMAL', _parse_decimal)
+
+
+def _record_factory(cursor, row):
+    # 與 pyodbc Row 一樣可以用 row.欄位 或 row[0] 取值
+    return tuple.__new__(record_type(columns_of(cursor)), row)
+
+
+class SQLiteCursor:
+    """
+    讓 sqlite3 cursor 的用法與 pyodbc 一致：
+    - 支援 with conn.cursor() as cursor (離開時沒有例外就 commit)
+    - 可設定 fast_executemany (SQLite 不需要，直接忽略)
+    """
+
+    def __init__(self, conn, raw):
+        self._conn = conn
+        self._raw = raw
+        self.fast_executemany = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def execute(self, sql, params=()):
+        self._raw.execute(sql, params)
+        return self
+
+    def executemany(self, sql, rows):
+        self._raw.executemany(sql, rows)
+        return self
+
+    def nextset(self):
+        return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._conn.commit()
+        self._raw.close()
+
+
+class SQLiteConnection:
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self):
+        return SQLiteCursor(self._raw, self._raw.cursor())
+
+
+class SQLiteDialect:
+    name = 'sqlite'
+
+    ddl = {
+        'identity_pk': 'INTEGER PRIMARY KEY AUTOINCREMENT',
+        'text': 'TEXT',
+        'now': "(datetime('now', 'localtime'))",
+        'binary16': 'BLOB',
+    }
+    now_sql = "datetime('now', 'localtime')"
+    limit_sql = 'LIMIT ?'
+
+    def limit(self, count):
+        return f'LIMIT {int(count)}'
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, read_only=False):
+        self.path = path
+        self.read_only = read_only
+
+    def replica(self, target):
+        """唯讀副本：target 為另一個資料庫檔案 (例如以 snapshot() 複製出來的)，以唯讀模式開啟"""
+        return SQLiteDialect(target, read_only=True)
+
+    def connect(self):
+        # 連線池會把連線交給不同執行緒使用 (同一時間只有一個執行緒)，所以關閉同執行緒檢查
+        if self.read_only:
+            raw = sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro", uri=True, timeout=30,
+                                  detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        else:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            raw = sqlite3.connect(self.path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+            raw.execute("PRAGMA journal_mode=WAL")
+        raw.row_factory = _record_factory
+        if sqlite3.sqlite_version_info < (3, 41):
+            # unhex() 在 SQLite 3.41 才內建，舊版以 Python 函式補上 (migration 轉換票券編號時使用)
+            raw.create_function('unhex', 1, _unhex, deterministic=True)
+        raw.execute("PRAGMA synchronous=NORMAL")
+        raw.execute("PRAGMA foreign_keys=ON")
+        return SQLiteConnection(raw)
+
+    def snapshot(self, dest):
+        """以 backup API 把目前的資料庫完整複製到 dest (本機測試唯讀副本用)"""
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        source = sqlite3.connect(self.path)
+        target = sqlite3.connect(dest)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+    def connect_for_setup(self):
+        return self.connect()
+
+    def insert_returning_id(self, cursor, sql, params=()):
+        cursor.execute(sql, params)
+        return int(cursor.lastrowid)
+
+    def executemany(self, cursor, sql, rows):
+        cursor.executemany(sql, rows)
+
+    def set_identity_insert(self, cursor, table, enabled):
+        pass  # SQLite 本來就可以直接指定 INTEGER PRIMARY KEY 的值
+
+    def format_datetime(self, value):
+        # 與寫入時的格式一致，字串比較才會正確
+        return value.isoformat(' ')
+
+    def create_table_sql(self, table, body):
+        return f"CREATE TABLE IF NOT EXISTS {table} ({body})"
+
+    def rename_table_sql(self, table, new_name):
+        return f"ALTER TABLE {table} RENAME TO {new_name}"
+
+    def uuid_to_binary_sql(self, expr):
+        return f"unhex(REPLACE({expr}, '-', ''))"
+
+    def date_sql(self, expr):
+        return f"date({expr})"
+
+    def upsert_add_sql(self, table, keys, counters):
+        # SQLite 3.24 起支援 ON CONFLICT ... DO UPDATE (UPSERT)
+        columns = list(keys) + list(counters)
+        update = ', '.join(f'{column} = {column} + excluded.{column}' for column in counters)
+        return f"""
+            INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})
+            ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {update}
+        """
+
+    def delete_returning(self, cursor, table, columns, where, params=()):
+        # SQLite 3.35 起支援 RETURNING
+        cursor.execute(f"DELETE FROM {table} WHERE {where} RETURNING {', '.join(columns)}", params)
+        return cursor.fetchall()
+
+    def create_index_sql(self, name, table, columns, include=None):
+        # SQLite 沒有 INCLUDE，把要涵蓋的欄位接在索引鍵後面達到相同效果
+        if include:
+            columns = f"{columns}, {include}"
+        return f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"
+
+    def query_plan(self, cursor, sql):
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def translate_ddl(sql, dialect):
+    """把建表語句中的 {identity_pk}、{text}、{now}、{binary16} 換成該方言的寫法"""
+    return re.sub(r'\{(\w+)\}', lambda m: dialect.ddl[m.group(1)], sql)
+
+
+def get_dialect(backend=None, sqlite_path=None):
+    backend = (backend or os.environ.get('DB_BACKEND') or 'mssql').lower()
+    if backend == 'sqlite':
+        return SQLiteDialect(sqlite_path or os.environ.get('DB_SQLITE_PATH') or DEFAULT_SQLITE_PATH)
+    if backend == 'mssql':
+        return SQLServerDialect()
+    raise ValueError(f"不支援的資料庫後端: {backend}")
@@ -0,0 +1,274 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """等待可用連線逾時"""
+    pass
+
+
+class PooledConnection:
+    """
+    包裝實際的資料庫連線
+    close() 不會真的關閉連線，而是歸還給連線池；其餘屬性直接轉交給原始連線
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.use_count = 0
+        self._checked_out = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._checked_out:
+            self._checked_out = False
+            self._pool._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    執行緒安全的資料庫連線池
+    - min_size / max_size：池中至少保留、最多建立的連線數
+    - timeout：借用連線時最多等待幾秒
+    - max_uses / max_age：連線借出超過 N 次或存活超過 N 秒就回收重建
+    - validate_after：閒置超過 N 秒的連線，借出前先以 SELECT 1 檢查是否仍存活
+    """
+
+    def __init__(self, creator, min_size=1, max_size=10, timeout=5.0,
+                 max_uses=1000, max_age=1800, validate_after=30):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError("連線池大小設定錯誤")
+        self._creator = creator
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.validate_after = validate_after
+
+        self._idle = deque()
+        self._cond = threading.Condition()
+        self._size = 0  # 目前存在的連線數 (閒置 + 借出)
+        self._stats = {'created': 0, 'recycled': 0, 'invalid': 0, 'checkouts': 0, 'timeouts': 0, 'waiting': 0}
+
+        for _ in range(min_size):
+            self._idle.append(self._create())
+
+    # --- 內部工具 ---
+    def _create(self):
+        conn = PooledConnection(self, self._creator())
+        self._size += 1
+        self._stats['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        self._size -= 1
+        try:
+            conn._raw.close()
+        except Exception:
+            pass
+
+    def _expired(self, conn):
+        if self.max_uses and conn.use_count >= self.max_uses:
+            return True
+        if self.max_age and time.monotonic() - conn.created_at >= self.max_age:
+            return True
+        return False
+
+    def _is_alive(self, conn):
+        if time.monotonic() - conn.last_used < self.validate_after:
+            return True
+        try:
+            cursor = conn._raw.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    # --- 借出 / 歸還 ---
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                while self._idle:
+                    conn = self._idle.pop()  # LIFO：優先使用最近用過的熱連線
+                    if not self._expired(conn):
+                        break
+                    self._stats['recycled'] += 1
+                    self._discard(conn)
+                    conn = None
+
+                if conn is None:
+                    if self._size < self.max_size:
+                        self._size += 1  # 先佔位，實際連線在鎖外建立
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats['timeouts'] += 1
+                            raise PoolTimeout(f"等待資料庫連線逾時 ({self.timeout} 秒)")
+                        self._stats['waiting'] += 1
+                        try:
+                            self._cond.wait(remaining)
+                        finally:
+                            self._stats['waiting'] -= 1
+                        continue
+
+            # 連線檢查與建立都在鎖外進行，避免網路延遲卡住其他執行緒
+            if conn is not None:
+                if self._is_alive(conn):
+                    with self._cond:
+                        return self._checkout(conn)
+                with self._cond:
+                    self._stats['invalid'] += 1
+                    self._discard(conn)
+                    self._cond.notify()
+                continue
+
+            try:
+                raw = self._creator()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            conn = PooledConnection(self, raw)
+            with self._cond:
+                self._stats['created'] += 1
+                return self._checkout(conn)
+
+    def _checkout(self, conn):
+        conn._checked_out = True
+        conn.use_count += 1
+        self._stats['checkouts'] += 1
+        return conn
+
+    def _release(self, conn):
+        # 歸還前先撤銷未提交的交易，避免把半套交易留給下一個請求
+        try:
+            conn._raw.rollback()
+            healthy = True
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            conn.last_used = time.monotonic()
+            if not healthy:
+                self._stats['invalid'] += 1
+                self._discard(conn)
+            elif self._expired(conn):
+                self._stats['recycled'] += 1
+                self._discard(conn)
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def close_all(self):
+        """關閉所有閒置連線 (借出中的連線歸還時才會回到池中)"""
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop())
+
+    def stats(self):
+        """回傳連線池統計，用來評估每個 worker 的連線池大小"""
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                'size': self._size,
+                'idle': idle,
+                'in_use': self._size - idle,
+                'waiting': self._stats['waiting'],
+                'created': self._stats['created'],
+                'recycled': self._stats['recycled'],
+                'invalid': self._stats['invalid'],
+                'checkouts': self._stats['checkouts'],
+                'timeouts': self._stats['timeouts'],
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            }
+
+
+class ReplicaRouter:
+    """
+    讀寫分離：寫入 (與需要最新資料的讀取) 走主資料庫，唯讀請求輪流分給各個唯讀副本
+    副本連線失敗時標記為停用 retry_after 秒並改用下一個副本，全部不可用時退回主資料庫
+    """
+
+    def __init__(self, primary, replicas=None, retry_after=30):
+        self.primary = primary
+        self.replicas = dict(replicas or {})  # 名稱 -> ConnectionPool
+        self.retry_after = retry_after
+        self._order = list(self.replicas)
+        self._next = 0
+        self._down_until = {}
+        self._lock = threading.Lock()
+        self._stats = {'writes': 0, 'reads': 0, 'replica_reads': 0, 'pinned_reads': 0, 'fallbacks': 0}
+
+    def _candidates(self):
+        """依輪替順序回傳目前可用的副本名稱"""
+        with self._lock:
+            now = time.monotonic()
+            start = self._next
+            self._next = (self._next + 1) % len(self._order)
+            names = self._order[start:] + self._order[:start]
+            return [name for name in names if self._down_until.get(name, 0) <= now]
+
+    def acquire(self, read_only=False, pin_primary=False):
+        """pin_primary：唯讀但需要看到最新資料 (例如使用者剛寫入過)，仍走主資料庫"""
+        if not read_only or pin_primary or not self.replicas:
+            with self._lock:
+                if read_only:
+                    self._stats['reads'] += 1
+                    self._stats['pinned_reads'] += pin_primary
+                else:
+                    self._stats['writes'] += 1
+            return self.primary.acquire()
+
+        for name in self._candidates():
+            try:
+                conn = self.replicas[name].acquire()
+            except PoolTimeout:
+                continue  # 只是暫時滿載，不停用
+            except Exception as e:
+                print(f"唯讀副本 {name} 無法使用，暫停 {self.retry_after} 秒: {e}")
+                with self._lock:
+                    self._down_until[name] = time.monotonic() + self.retry_after
+                continue
+            with self._lock:
+                self._stats['reads'] += 1
+                self._stats['replica_reads'] += 1
+            return conn
+
+        with self._lock:
+            self._stats['reads'] += 1
+            self._stats['fallbacks'] += 1
+        return self.primary.acquire()
+
+    def close_all(self):
+        self.primary.close_all()
+        for pool in self.replicas.values():
+            pool.close_all()
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            routing = dict(self._stats, down=sorted(name for name, until in self._down_until.items() if until > now))
+        return {
+            'primary': self.primary.stats(),
+            'replicas': {name: pool.stats() for name, pool in self.replicas.items()},
+            'routing': routing,
+        }
@@ -0,0 +1,50 @@
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+    """
+    已產生的 HTML 片段快取 (展覽詳細頁中不隨請求改變的部分)
+    - get(key, version, render)：快取中的版本與 version 相同時直接回傳，否則呼叫 render() 重新產生
+      render() 回傳 None (例如展覽不存在) 時不寫入快取
+    - invalidate(key)：後台修改展覽、場次或票種時呼叫；不帶參數時清空全部
+    - 行程內 LRU，最多保留 max_entries 個 key；多個 worker 之間靠 version (含定期輪替的 epoch) 達成最終一致
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (version, 片段)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, key, version, render):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[1]
+            self._stats['misses'] += 1
+
+        # 產生片段時不持有鎖；同一個 key 同時失效時可能重複產生，結果相同
+        value = render()
+        if value is None:
+            return None
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._entries), max_entries=self.max_entries)
@@ -0,0 +1,383 @@
+"""
+入場核銷快取 (gate-scan validation cache)
+
+開場時同一檔展覽每分鐘有數百次掃描，每次都 JOIN 三張表再 UPDATE + commit 太重。
+這裡把整檔展覽的票券 (uuid -> 狀態, 核銷碼) 預先載入記憶體，掃描直接在記憶體中判斷；
+核銷結果先寫入本機的核銷日誌 (SQLite，ticket_uuid 為主鍵)，再由背景執行緒批次寫回 Tickets.used_at。
+
+防止重複入場的保證來自核銷日誌：
+- 同一張票只能成功寫入日誌一次 (主鍵衝突即代表已經核銷過)，同一台機器上的多個 worker 共用同一個日誌檔
+- 日誌以 synchronous=FULL 寫入，回應「歡迎入場」前已經落地；重新啟動後尚未寫回的紀錄會繼續寫回
+- 寫回時只更新仍是 Unused 的票券，重複寫回不會覆蓋 used_at
+- 已寫回的紀錄保留 retention 秒 (供重送辨識) 後由背景執行緒分批刪除，之後改由 Tickets.status 擋下重複入場
+
+掃描機也可以先在本機暫存，再以 scan_batch() 整批上傳 (網路不穩時)：
+- 一批的核銷紀錄在同一個日誌交易中寫入
+- 同一批中重複掃描同一張票，只有最早的一次有效
+- 重送同一批 (同一台裝置、同一個掃描時間) 會得到相同的結果，不會被當成重複入場
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+
+class ScanJournal:
+    """核銷日誌：記錄已放行的票券與尚未寫回資料庫的紀錄"""
+
+    def __init__(self, path, retention=24 * 60 * 60):
+        self.path = path
+        self.retention = retention  # 已寫回的紀錄保留秒數
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS scans (
+                ticket_uuid TEXT PRIMARY KEY,
+                used_at TEXT NOT NULL,
+                flushed INTEGER NOT NULL DEFAULT 0,
+                device TEXT,
+                flushed_at REAL
+            )
+        """)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(scans)")]
+        if 'device' not in columns:
+            conn.execute("ALTER TABLE scans ADD COLUMN device TEXT")  # 舊版日誌檔
+        if 'flushed_at' not in columns:
+            # 舊版日誌檔：已寫回的紀錄從現在開始計算保留時間
+            conn.execute("ALTER TABLE scans ADD COLUMN flushed_at REAL")
+            conn.execute("UPDATE scans SET flushed_at = ? WHERE flushed = 1", (time.time(),))
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_scans_pending ON scans (flushed, used_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_scans_flushed_at ON scans (flushed_at)")
+        conn.commit()
+
+    def _conn(self):
+        # sqlite3 連線不能跨執行緒共用，每個執行緒各自開一條
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")  # 放行前確保紀錄已寫入磁碟
+            self._local.conn = conn
+        return conn
+
+    def claim(self, ticket_uuid, used_at):
+        """寫入核銷紀錄；這張票已經核銷過時回傳 False"""
+        conn = self._conn()
+        try:
+            conn.execute("INSERT INTO scans (ticket_uuid, used_at) VALUES (?, ?)", (ticket_uuid, used_at.isoformat(' ')))
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            return False
+
+    def claim_many(self, rows):
+        """
+        在同一個交易中寫入多筆核銷紀錄 [(ticket_uuid, used_at, device)]
+        回傳 (這次寫入的票券, 原本就有紀錄的票券 {ticket_uuid: (used_at, device)})
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")  # 先取得寫入鎖，其他 worker 不會在查詢與寫入之間插入同一張票
+        try:
+            existing = self._entries(conn, [ticket_uuid for ticket_uuid, _, _ in rows])
+            new_rows = [(ticket_uuid, used_at.isoformat(' '), device)
+                        for ticket_uuid, used_at, device in rows if ticket_uuid not in existing]
+            conn.executemany("INSERT INTO scans (ticket_uuid, used_at, device) VALUES (?, ?, ?)", new_rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return {row[0] for row in new_rows}, existing
+
+    def entries(self, ticket_uuids):
+        """回傳其中已經有核銷紀錄的票券 {ticket_uuid: (used_at, device)}"""
+        return self._entries(self._conn(), list(ticket_uuids))
+
+    def _entries(self, conn, ticket_uuids):
+        found = {}
+        for start in range(0, len(ticket_uuids), 500):
+            chunk = ticket_uuids[start:start + 500]
+            rows = conn.execute(f"SELECT ticket_uuid, used_at, device FROM scans WHERE ticket_uuid IN ({','.join('?' * len(chunk))})", chunk)
+            found.update((ticket_uuid, (datetime.fromisoformat(used_at), device)) for ticket_uuid, used_at, device in rows)
+        return found
+
+    def claimed(self, ticket_uuids):
+        """回傳其中已經有核銷紀錄的票券"""
+        return set(self.entries(ticket_uuids))
+
+    def pending(self, limit=500):
+        """尚未寫回資料庫的紀錄 [(ticket_uuid, used_at)]"""
+        rows = self._conn().execute(
+            "SELECT ticket_uuid, used_at FROM scans WHERE flushed = 0 ORDER BY used_at LIMIT ?", (limit,)
+        ).fetchall()
+        return [(ticket_uuid, datetime.fromisoformat(used_at)) for ticket_uuid, used_at in rows]
+
+    def mark_flushed(self, ticket_uuids):
+        conn = self._conn()
+        now = time.time()
+        conn.executemany("UPDATE scans SET flushed = 1, flushed_at = ? WHERE ticket_uuid = ?", [(now, u) for u in ticket_uuids])
+        conn.commit()
+
+    def prune(self, batch_size=500):
+        """分批刪除寫回資料庫超過 retention 秒的紀錄，回傳刪除筆數"""
+        conn = self._conn()
+        cutoff = time.time() - self.retention
+        total = 0
+        while True:
+            deleted = conn.execute("""
+                DELETE FROM scans WHERE ticket_uuid IN (
+                    SELECT ticket_uuid FROM scans WHERE flushed = 1 AND flushed_at < ? LIMIT ?
+                )
+            """, (cutoff, batch_size)).rowcount
+            conn.commit()
+            total += deleted
+            if deleted < batch_size:
+                return total
+
+    def pending_count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM scans WHERE flushed = 0").fetchone()[0]
+
+
+class GateValidationCache:
+    """
+    - load_exhibition(exhibition_id)：回傳該展覽所有票券 (ticket_uuid, status, validation_pin)
+    - lookup_tickets(ticket_uuids)：快取中沒有的票券 (例如預先載入後才售出)，回傳 {ticket_uuid: (exhibition_id, status, validation_pin)}
+    - write_back(rows)：把 [(ticket_uuid, used_at)] 寫回 Tickets，寫入成功才會標記為已寫回
+    展覽的快取 ttl 秒後重新載入 (核銷碼可能被修改)；每 flush_interval 秒或累積 flush_batch_size 筆時寫回一次
+    每 prune_interval 秒順便清除核銷日誌中保留期已過的紀錄
+    """
+
+    def __init__(self, load_exhibition, lookup_tickets, write_back, journal,
+                 ttl=300, flush_interval=2, flush_batch_size=500, prune_interval=300):
+        self._load_exhibition = load_exhibition
+        self._lookup_tickets = lookup_tickets
+        self._write_back = write_back
+        self.journal = journal
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.prune_interval = prune_interval
+        self._next_prune = time.monotonic() + prune_interval
+
+        self._tickets = {}       # ticket_uuid -> [status, validation_pin, exhibition_id]
+        self._exhibitions = {}   # exhibition_id -> 載入時間
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._unflushed = 0
+        self._flusher = None
+        self._stats = {'scans': 0, 'admitted': 0, 'hits': 0, 'misses': 0, 'loads': 0, 'flushed': 0, 'flush_errors': 0,
+                       'batches': 0, 'replayed': 0, 'pruned': 0}
+
+    # --- 載入 ---
+    def preload(self, exhibition_id):
+        """載入 (或重新載入) 一檔展覽的所有票券，回傳票券數"""
+        with self._load_lock:
+            rows = self._load_exhibition(exhibition_id)
+            # 已核銷但尚未寫回資料庫的票券，以核銷日誌為準
+            used = self.journal.claimed(row[0] for row in rows if row[1] != 'Used')
+            with self._lock:
+                for ticket_uuid, status, pin in rows:
+                    self._tickets[ticket_uuid] = ['Used' if ticket_uuid in used else status, pin, exhibition_id]
+                self._exhibitions[exhibition_id] = time.monotonic()
+                self._stats['loads'] += 1
+            return len(rows)
+
+    def invalidate(self, exhibition_id):
+        """後台修改展覽 (例如核銷碼) 後呼叫，下次掃描時重新載入"""
+        with self._lock:
+            self._exhibitions.pop(exhibition_id, None)
+            for ticket_uuid in [u for u, entry in self._tickets.items() if entry[2] == exhibition_id]:
+                del self._tickets[ticket_uuid]
+
+    def _entries(self, ticket_uuids):
+        """回傳 {ticket_uuid: 快取項目}，找不到的票券不會出現在結果中"""
+        found = {}
+        missing = []
+        reload = set()
+        for ticket_uuid in ticket_uuids:
+            entry = self._tickets.get(ticket_uuid)
+            if entry is None:
+                missing.append(ticket_uuid)
+                continue
+            loaded_at = self._exhibitions.get(entry[2])
+            if loaded_at is not None and time.monotonic() - loaded_at < self.ttl:
+                found[ticket_uuid] = entry
+            else:
+                reload.add(entry[2])
+                missing.append(ticket_uuid)
+        self._count(hits=len(found))
+        for exhibition_id in reload:
+            self.preload(exhibition_id)
+
+        lookup = []
+        for ticket_uuid in missing:
+            entry = self._tickets.get(ticket_uuid)
+            if entry is not None:
+                found[ticket_uuid] = entry
+            else:
+                lookup.append(ticket_uuid)
+        if not lookup:
+            return found
+
+        self._count(misses=len(lookup))
+        rows = self._lookup_tickets(lookup)
+        for exhibition_id in {row[0] for row in rows.values()} - set(self._exhibitions):
+            # 第一次掃到這檔展覽：整批載入，之後的掃描都在記憶體中完成
+            self.preload(exhibition_id)
+        with self._lock:
+            for ticket_uuid, (exhibition_id, status, pin) in rows.items():
+                found[ticket_uuid] = self._tickets.setdefault(ticket_uuid, [status, pin, exhibition_id])
+        return found
+
+    def _entry(self, ticket_uuid):
+        return self._entries([ticket_uuid]).get(ticket_uuid)
+
+    # --- 核銷 ---
+    def scan(self, ticket_uuid, pin):
+        """回傳 (是否放行, 訊息, HTTP 狀態碼)"""
+        self._count(scans=1)
+        self._ensure_flusher()
+        entry = self._entry(ticket_uuid)
+        if entry is None:
+            return False, "找不到票券", 404
+        if entry[0] == 'Used':
+            return False, "此票券已經使用過了", 200
+        if pin != entry[1]:
+            return False, "核銷碼錯誤", 200
+
+        # 核銷日誌的主鍵保證同一張票只會放行一次 (包含其他 worker 與重新啟動前的紀錄)
+        with self._lock:
+            if entry[0] == 'Used':
+                return False, "此票券已經使用過了", 200
+            entry[0] = 'Used'
+        try:
+            claimed = self.journal.claim(ticket_uuid, datetime.now())
+        except Exception:
+            entry[0] = 'Unused'  # 日誌寫入失敗不能放行，也不能把票券標記為已使用
+            raise
+        if not claimed:
+            return False, "此票券已經使用過了", 200
+
+        self._admitted(1)
+        return True, "驗證成功，歡迎入場！", 200
+
+    def scan_batch(self, scans, device=None):
+        """
+        批次核銷 scans = [(ticket_uuid, pin, scanned_at)]，scanned_at 為掃描機記錄的時間 (None 代表現在)
+        scanned_at 原樣寫入 used_at 並用來辨識重送，不做任何調整
+        回傳與 scans 同順序的結果 [{'uuid', 'success', 'result', 'message'}]，result 為：
+        admitted / replayed (重送已放行的掃描) / used / duplicate (同一批重複掃描) / wrong_pin / not_found
+        """
+        self._count(batches=1, scans=len(scans))
+        self._ensure_flusher()
+        now = datetime.now()
+        results = [None] * len(scans)
+        entries = self._entries({ticket_uuid for ticket_uuid, _, _ in scans})
+
+        # 依掃描時間處理：同一張票只有最早一次有效的掃描會放行 (輸錯 PIN 後重刷不算重複)
+        candidates = {}  # ticket_uuid -> (scans 中的位置, 核銷時間)
+        for i in sorted(range(len(scans)), key=lambda i: scans[i][2] or now):
+            ticket_uuid, pin, scanned_at = scans[i]
+            entry = entries.get(ticket_uuid)
+            if entry is None:
+                results[i] = (False, 'not_found', "找不到票券")
+            elif ticket_uuid in candidates:
+                results[i] = (False, 'duplicate', "同一批次重複掃描")
+            elif pin != entry[1]:
+                results[i] = (False, 'wrong_pin', "核銷碼錯誤")
+            else:
+                candidates[ticket_uuid] = (i, scanned_at or now)
+
+        # 快取中尚未使用的票券整批寫入日誌；已使用的票券只比對日誌，判斷是否為重送
+        unused = [(ticket_uuid, used_at, device) for ticket_uuid, (_, used_at) in candidates.items()
+                  if entries[ticket_uuid][0] != 'Used']
+        claimed, existing = self.journal.claim_many(unused) if unused else (set(), {})
+        used = [ticket_uuid for ticket_uuid in candidates if entries[ticket_uuid][0] == 'Used']
+        existing.update(self.journal.entries(used) if used else {})
+
+        with self._lock:
+            for ticket_uuid, (i, used_at) in candidates.items():
+                entries[ticket_uuid][0] = 'Used'
+                if ticket_uuid in claimed:
+                    results[i] = (True, 'admitted', "驗證成功，歡迎入場！")
+                elif existing.get(ticket_uuid) == (used_at, device):
+                    results[i] = (True, 'replayed', "驗證成功，歡迎入場！")
+                else:
+                    results[i] = (False, 'used', "此票券已經使用過了")
+
+        admitted = len(claimed)
+        replayed = sum(1 for _, result, _ in results if result == 'replayed')
+        self._count(replayed=replayed)
+        self._admitted(admitted)
+        return [{'uuid': scans[i][0], 'success': success, 'result': result, 'message': message}
+                for i, (success, result, message) in enumerate(results)]
+
+    # --- 寫回 (write-behind) ---
+    def flush(self):
+        """把核銷日誌中尚未寫回的紀錄批次寫回資料庫，回傳寫回筆數"""
+        total = 0
+        with self._flush_lock:
+            while True:
+                rows = self.journal.pending(self.flush_batch_size)
+                if not rows:
+                    break
+                self._write_back(rows)
+                self.journal.mark_flushed(ticket_uuid for ticket_uuid, _ in rows)
+                total += len(rows)
+                if len(rows) < self.flush_batch_size:
+                    break
+        with self._lock:
+            self._unflushed = 0
+            self._stats['flushed'] += total
+        return total
+
+    def _count(self, **counts):
+        with self._lock:
+            for key, n in counts.items():
+                self._stats[key] += n
+
+    def _admitted(self, n):
+        """放行 n 張票；累積 flush_batch_size 筆尚未寫回時提早喚醒背景執行緒"""
+        with self._lock:
+            self._stats['admitted'] += n
+            self._unflushed += n
+            full = self._unflushed >= self.flush_batch_size
+        if full:
+            self._wakeup.set()
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._run, name='gate-write-behind', daemon=True)
+                    self._flusher.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                self._count(flush_errors=1)
+                print(f"核銷紀錄寫回資料庫失敗 (稍後重試): {e}")
+            self._maybe_prune()
+
+    def _maybe_prune(self):
+        if time.monotonic() < self._next_prune:
+            return
+        self._next_prune = time.monotonic() + self.prune_interval
+        try:
+            self._count(pruned=self.journal.prune(self.flush_batch_size))
+        except Exception as e:
+            print(f"清除過期核銷紀錄失敗: {e}")
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, tickets=len(self._tickets), exhibitions=len(self._exhibitions),
+                        pending=self.journal.pending_count(), ttl=self.ttl, flush_interval=self.flush_interval,
+                        retention=self.journal.retention)
@@ -0,0 +1,53 @@
+"""
+HTTP 條件式請求 (conditional GET)
+
+首頁與展覽詳細頁以「目錄版本號 + 影響頁面內容的其他因素」計算 ETag，
+瀏覽器或反向代理帶著 If-None-Match 回來時，版本沒變就直接回 304，不必查詢資料庫也不必產生頁面。
+"""
+import hashlib
+import threading
+import time
+
+
+class CatalogVersion:
+    """
+    目錄版本號
+    - bump()：後台新增 / 修改 / 刪除展覽 (或場次、票種、圖片) 時呼叫
+    - bump(exhibition_id) 同時讓首頁與該展覽的詳細頁失效；不帶參數時所有頁面都失效
+    - max_age：版本號只存在單一行程中，其他 worker 的異動靠每 max_age 秒輪替一次的 epoch 達成最終一致
+    """
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        self._global = 0        # 任何異動都 +1 (首頁)
+        self._all = 0           # 不指定展覽的異動 +1 (所有詳細頁)
+        self._exhibitions = {}  # exhibition_id -> 版本號
+        self._lock = threading.Lock()
+        self._stats = {'bumps': 0}
+
+    def _epoch(self):
+        return int(time.time() // self.max_age) if self.max_age else 0
+
+    def bump(self, exhibition_id=None):
+        with self._lock:
+            self._global += 1
+            if exhibition_id is None:
+                self._all += 1
+            else:
+                self._exhibitions[exhibition_id] = self._exhibitions.get(exhibition_id, 0) + 1
+            self._stats['bumps'] += 1
+
+    def token(self, exhibition_id=None):
+        """首頁 (不帶參數) 或單一展覽目前的版本字串"""
+        if exhibition_id is None:
+            return f"{self._global}.{self._epoch()}"
+        return f"{self._all}.{self._exhibitions.get(exhibition_id, 0)}.{self._epoch()}"
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, version=self._global, exhibitions=len(self._exhibitions), max_age=self.max_age)
+
+
+def make_etag(*parts):
+    """由頁面內容的相關因素計算 ETag (不含引號)"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:32]
@@ -0,0 +1,190 @@
+"""
+展覽圖片衍生檔 (image derivatives)
+
+後台上傳的原圖最大可到 16 MB，首頁卡片卻只需要 400px 寬的縮圖。
+上傳後在背景執行緒池中把原圖縮成各種尺寸的 WebP 與 JPEG (不帶 EXIF、ICC 等中繼資料)，
+完成後由 on_done 把衍生檔清單寫回資料庫 (Exhibitions.image_variants)，樣板再以 srcset 讓瀏覽器挑選合適的尺寸。
+
+衍生檔與原圖放在同一個資料夾，檔名為「原圖主檔名_尺寸名稱_寬度.副檔名」，
+刪除原圖時依同樣的規則找出所有衍生檔一併刪除 (不需要查資料庫)。
+"""
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+# 尺寸名稱 -> 產生的寬度 (px)，第二個寬度給高解析度螢幕；原圖比較小時不放大
+VARIANTS = {
+    'card': (400, 800),      # 首頁卡片
+    'detail': (800, 1200),   # 詳細頁橫幅 (手機、平板)
+    'hero': (1600, 2400),    # 詳細頁橫幅 (桌機全寬)
+}
+
+# 格式 -> (副檔名, PIL 格式, 存檔參數)；WebP 優先，JPEG 給不支援 WebP 的瀏覽器
+FORMATS = {
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def _has_alpha(im):
+    return im.mode in ('RGBA', 'LA', 'PA') or (im.mode == 'P' and 'transparency' in im.info)
+
+
+def _flatten(im, background=(255, 255, 255)):
+    """JPEG 不支援透明：把透明部分鋪上白底"""
+    rgba = im.convert('RGBA')
+    canvas = Image.new('RGB', rgba.size, background)
+    canvas.paste(rgba, mask=rgba.getchannel('A'))
+    return canvas
+
+
+class ImagePipeline:
+    """
+    - submit(image_path)：排入背景產生衍生檔 (同一張圖處理中時不會重複排入)
+    - generate(image_path)：直接產生並回傳衍生檔清單 {尺寸名稱: {格式: [[寬度, 網址], ...]}}
+    - remove(image_path)：刪除一張原圖的所有衍生檔
+    on_done(image_path, variants) 回傳 False 代表原圖已被替換或刪除，剛產生的衍生檔會直接刪掉
+    """
+
+    def __init__(self, folder, url_prefix, on_done=None, workers=2, variants=None):
+        self.folder = folder
+        self.url_prefix = url_prefix.rstrip('/') + '/'
+        self.on_done = on_done
+        self.variants = variants or VARIANTS
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-variants')
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'generated': 0, 'files': 0, 'failed': 0, 'discarded': 0}
+
+    def _filename(self, image_path):
+        """網址 -> 上傳資料夾中的檔名；不是本系統上傳的圖片回傳 None"""
+        if not image_path or not image_path.startswith(self.url_prefix):
+            return None
+        filename = image_path[len(self.url_prefix):]
+        return filename if filename and os.path.basename(filename) == filename else None
+
+    def submit(self, image_path):
+        if self._filename(image_path) is None:
+            return False
+        with self._lock:
+            if image_path in self._pending:
+                return False
+            self._pending.add(image_path)
+            self._stats['submitted'] += 1
+        self._executor.submit(self._run, image_path)
+        return True
+
+    def _run(self, image_path):
+        try:
+            variants = self.generate(image_path)
+            if variants is None:
+                return
+            if self.on_done and self.on_done(image_path, variants) is False:
+                self.remove(image_path)
+                self._count(discarded=1)
+        except Exception as e:
+            self._count(failed=1)
+            print(f"產生圖片衍生檔失敗 ({image_path}): {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(image_path)
+
+    def generate(self, image_path):
+        filename = self._filename(image_path)
+        source = os.path.join(self.folder, filename) if filename else None
+        if not source or not os.path.exists(source):
+            return None
+        stem = os.path.splitext(filename)[0]
+        max_width = max(width for widths in self.variants.values() for width in widths)
+
+        result = {}
+        files = 0
+        with Image.open(source) as im:
+            # JPEG 可以直接以較低解析度解碼，大圖不必先完整展開到記憶體
+            im.draft('RGB', (max_width, max_width))
+            im = ImageOps.exif_transpose(im)  # 依 EXIF 方向轉正 (存檔時不會帶出 EXIF)
+            alpha = _has_alpha(im)
+            base = {'webp': im.convert('RGBA' if alpha else 'RGB'), 'jpeg': _flatten(im) if alpha else im.convert('RGB')}
+
+            for name, widths in self.variants.items():
+                entries = {fmt: [] for fmt in FORMATS}
+                done = set()
+                for width in widths:
+                    width = min(width, im.width)
+                    if width in done:
+                        continue  # 原圖比較小時，不同尺寸會落在同一個寬度
+                    done.add(width)
+                    height = max(1, round(im.height * width / im.width))
+                    for fmt, (ext, pil_format, options) in FORMATS.items():
+                        frame = base[fmt] if width == im.width else base[fmt].resize((width, height), Image.LANCZOS)
+                        variant_name = f"{stem}_{name}_{width}.{ext}"
+                        self._save(frame, os.path.join(self.folder, variant_name), pil_format, options)
+                        entries[fmt].append([width, self.url_prefix + variant_name])
+                        files += 1
+                result[name] = entries
+
+        self._count(generated=1, files=files)
+        return result
+
+    def _count(self, **counts):
+        with self._lock:
+            for key, n in counts.items():
+                self._stats[key] += n
+
+    def _save(self, frame, path, pil_format, options):
+        # 先寫暫存檔再改名，瀏覽器不會讀到寫到一半的圖片
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            frame.save(tmp_path, pil_format, **options)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def remove(self, image_path):
+        """刪除一張原圖的所有衍生檔，回傳刪除的檔案數"""
+        filename = self._filename(image_path)
+        if filename is None or not os.path.isdir(self.folder):
+            return 0
+        stem = os.path.splitext(filename)[0]
+        pattern = re.compile(rf"{re.escape(stem)}_({'|'.join(map(re.escape, self.variants))})_\d+\.(webp|jpg)$")
+        removed = 0
+        for name in os.listdir(self.folder):
+            if pattern.match(name):
+                try:
+                    os.remove(os.path.join(self.folder, name))
+                    removed += 1
+                except OSError as e:
+                    print(f"刪除圖片衍生檔失敗: {e}")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending))
+
+
+def image_sources(variants, *names):
+    """
+    樣板用：由 Exhibitions.image_variants (JSON) 組出 <picture> 需要的資料
+    names 可以指定多個尺寸合併成同一組 srcset (例如 'detail', 'hero')
+    回傳 {'src', 'webp', 'jpeg'}，尚未產生衍生檔時回傳 None (樣板改用原圖)
+    """
+    if not variants:
+        return None
+    try:
+        manifest = json.loads(variants) if isinstance(variants, str) else variants
+    except ValueError:
+        return None
+    sources = {}
+    for fmt in FORMATS:
+        entries = sorted({(width, url) for name in names for width, url in manifest.get(name, {}).get(fmt, [])})
+        if not entries:
+            return None
+        sources[fmt] = ', '.join(f"{url} {width}w" for width, url in entries)
+        if fmt == 'jpeg':
+            sources['src'] = entries[0][1]
+    return sources
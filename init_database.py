@@ -1,37 +1,68 @@
-import pyodbc
+import argparse
+import bisect
+import itertools
+import random
+import time
+from db_backends import get_dialect, translate_ddl
+from migrations import migrate
+from ticket_ids import new_ticket_id, ticket_id_text
 from werkzeug.security import generate_password_hash
-import uuid
-from datetime import datetime
+from datetime import date, datetime, timedelta
 
+# 固定亂數種子：同樣的種子與規模，每次產生的資料都一樣
+DEFAULT_SEED = 20251201
+DEFAULT_BATCH_SIZE = 5000
 
-def init_database():
-    print("開始初始化 SQL Server 資料庫")
+# 產生模擬資料時的「今天」，固定下來才能重現 (而不是用 datetime.now())
+REFERENCE_DATE = date(2025, 12, 15)
+
+
+def seeded_uuid(rng, when):
+    """由指定的亂數產生器產生票券編號 (文字格式，時間取下單時間)，可重現"""
+    return ticket_id_text(new_ticket_id(when, rng))
+
+
+def insert_many(db, cursor, sql, rows, table=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    批次寫入：每次送出 batch_size 筆 (SQL Server 使用 fast_executemany)
+    rows 可以是 list 或 generator；回傳寫入筆數並印出每秒筆數
+    """
+    rows = iter(rows)
+    total = 0
+    start = time.perf_counter()
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        db.executemany(cursor, sql, batch)
+        total += len(batch)
+    elapsed = time.perf_counter() - start
+    if table:
+        print(f"  {table}: {total:,} 筆，{elapsed:.2f} 秒，{total / elapsed if elapsed else 0:,.0f} 筆/秒")
+    return total
+
+
+def init_database(scale=0, seed=DEFAULT_SEED, batch_size=DEFAULT_BATCH_SIZE, backend=None, replica_path=None):
+    """
+    重建資料庫並寫入示範資料
+    scale > 0 時再額外產生模擬的大量資料 (見 generate_synthetic_data)
+    backend 為 'mssql' 或 'sqlite'，未指定時讀取環境變數 DB_BACKEND
+    replica_path：(僅 SQLite) 完成後另外複製一份當作本機測試用的唯讀副本
+    """
+    db = get_dialect(backend)
+    print(f"開始初始化資料庫 ({db.name})")
+    rng = random.Random(seed)
 
     try:
-        # 1. 先連線到 SQL Server (不指定 DB)
-        conn = pyodbc.connect(
-            r'DRIVER={ODBC Driver 17 for SQL Server};'
-            r'SERVER=localhost\SQLEXPRESS;'
-            r'UID=root;'
-            r'PWD=wendy940704;',
-            autocommit=True
-        )
+        # 1~2. 連線資料庫 (SQL Server 會先連到伺服器，必要時建立資料庫)
+        conn = db.connect_for_setup()
         print("資料庫連線成功")
         cursor = conn.cursor()
 
-        # 2. 建立資料庫
-        db_name = "ExhibitionTicketSystem"
-        cursor.execute(f"""
-            IF NOT EXISTS (SELECT * FROM sys.databases WHERE name = '{db_name}')
-            BEGIN
-                CREATE DATABASE {db_name};
-            END
-        """)
-        cursor.execute(f"USE {db_name};")
-
         # 3. 清除舊資料表
         print("正在重置資料表")
-        tables = ['Tickets', 'Payments', 'Orders', 'TicketTypes', 'Sessions', 'Exhibitions', 'Members', 'Organizers']
+        tables = ['SchemaMigrations', 'SalesBySession', 'SalesByTicketType', 'SalesByDay', 'PurgeJobs', 'InventoryHolds',
+                  'Tickets', 'Payments', 'Orders', 'TicketTypes', 'Sessions', 'Exhibitions', 'Members', 'Organizers']
         for table in tables:
             cursor.execute(f"DROP TABLE IF EXISTS {table};")
 
@@ -40,27 +71,27 @@ def init_database():
 
         queries = [
             """CREATE TABLE Organizers (
-                organizer_id INT PRIMARY KEY IDENTITY(1,1),
+                organizer_id {identity_pk},
                 name NVARCHAR(100) NOT NULL,
                 contact_person NVARCHAR(50),
                 phone VARCHAR(20),
                 email VARCHAR(100)
             )""",
             """CREATE TABLE Members (
-                member_id INT PRIMARY KEY IDENTITY(1,1),
+                member_id {identity_pk},
                 name NVARCHAR(50) NOT NULL,
                 email VARCHAR(100) NOT NULL UNIQUE,
                 password_hash VARCHAR(255) NOT NULL,
                 phone VARCHAR(20),
                 role VARCHAR(20) DEFAULT 'user',
-                created_at DATETIME DEFAULT GETDATE()
+                created_at DATETIME DEFAULT {now}
             )""",
             """CREATE TABLE Exhibitions (
-                exhibition_id INT PRIMARY KEY IDENTITY(1,1),
+                exhibition_id {identity_pk},
                 organizer_id INT,
                 title NVARCHAR(200) NOT NULL,
                 location NVARCHAR(200),
-                description NVARCHAR(MAX),
+                description {text},
                 start_date DATE,
                 end_date DATE,
                 status VARCHAR(20) DEFAULT 'Draft',
@@ -69,27 +100,28 @@ def init_database():
                 FOREIGN KEY (organizer_id) REFERENCES Organizers(organizer_id)
             )""",
             """CREATE TABLE Sessions (
-                session_id INT PRIMARY KEY IDENTITY(1,1),
+                session_id {identity_pk},
                 exhibition_id INT NOT NULL,
                 session_time DATETIME NOT NULL,
                 capacity INT NOT NULL,
                 FOREIGN KEY (exhibition_id) REFERENCES Exhibitions(exhibition_id)
             )""",
             """CREATE TABLE TicketTypes (
-                ticket_type_id INT PRIMARY KEY IDENTITY(1,1),
+                ticket_type_id {identity_pk},
                 exhibition_id INT NOT NULL,
                 name NVARCHAR(50) NOT NULL,
                 price DECIMAL(10, 2) NOT NULL,
                 FOREIGN KEY (exhibition_id) REFERENCES Exhibitions(exhibition_id)
             )""",
             """CREATE TABLE Orders (
-                order_id INT PRIMARY KEY IDENTITY(1,1),
+                order_id {identity_pk},
                 member_id INT NOT NULL,
                 total_amount DECIMAL(10, 2) NOT NULL,
-                order_date DATETIME DEFAULT GETDATE(),
+                order_date DATETIME DEFAULT {now},
                 status VARCHAR(20) DEFAULT 'Pending',
                 FOREIGN KEY (member_id) REFERENCES Members(member_id)
             )""",
+            # 票券編號先以文字寫入，最後由 migration 3 轉成 16 bytes 的二進位主鍵
             """CREATE TABLE Tickets (
                 ticket_uuid VARCHAR(36) PRIMARY KEY,
                 order_id INT NOT NULL,
@@ -104,7 +136,7 @@ def init_database():
         ]
 
         for query in queries:
-            cursor.execute(query)
+            cursor.execute(translate_ddl(query, db))
 
         print("寫入初始化資料")
 
@@ -122,11 +154,10 @@ def init_database():
             ('蔡宗翰', 'zonghan.tsai@hotmail.com', generate_password_hash('user123'), '0990123456', 'user'),
         ]
         
-        for member in members_data:
-            cursor.execute("""
-                INSERT INTO Members (name, email, password_hash, phone, role) 
-                VALUES (?, ?, ?, ?, ?)
-            """, member)
+        insert_many(db, cursor, """
+            INSERT INTO Members (name, email, password_hash, phone, role)
+            VALUES (?, ?, ?, ?, ?)
+        """, members_data, table='Members')
 
 
         print("新增主辦單位")
@@ -153,11 +184,10 @@ def init_database():
             ('國立科學工藝博物館', '蘇館長', '07-3800089', 'service@nstm.gov.tw'),
         ]
         
-        for org in organizers_data:
-            cursor.execute("""
-                INSERT INTO Organizers (name, contact_person, phone, email) 
-                VALUES (?, ?, ?, ?)
-            """, org)
+        insert_many(db, cursor, """
+            INSERT INTO Organizers (name, contact_person, phone, email)
+            VALUES (?, ?, ?, ?)
+        """, organizers_data, table='Organizers')
 
         
         print("新增展覽")
@@ -228,11 +258,10 @@ def init_database():
              '2025-12-01', '2026-06-30', 'Published', '1234'),
         ]
         
-        for ex in exhibitions_data:
-            cursor.execute("""
-                INSERT INTO Exhibitions (organizer_id, title, location, description, start_date, end_date, status, validation_pin) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, ex)
+        insert_many(db, cursor, """
+            INSERT INTO Exhibitions (organizer_id, title, location, description, start_date, end_date, status, validation_pin)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, exhibitions_data, table='Exhibitions')
 
 
         print("新增每場展覽的場次")
@@ -310,11 +339,10 @@ def init_database():
             (20, '2026-02-10 18:00:00', 250),
         ]
         
-        for session in sessions_data:
-            cursor.execute("""
-                INSERT INTO Sessions (exhibition_id, session_time, capacity) 
-                VALUES (?, ?, ?)
-            """, session)
+        insert_many(db, cursor, """
+            INSERT INTO Sessions (exhibition_id, session_time, capacity)
+            VALUES (?, ?, ?)
+        """, sessions_data, table='Sessions')
 
 
         print("新增每場展覽的票種")
@@ -362,11 +390,10 @@ def init_database():
             (20, '全票', 550), (20, '學生票', 450),
         ]
         
-        for tt in ticket_types_data:
-            cursor.execute("""
-                INSERT INTO TicketTypes (exhibition_id, name, price) 
-                VALUES (?, ?, ?)
-            """, tt)
+        insert_many(db, cursor, """
+            INSERT INTO TicketTypes (exhibition_id, name, price)
+            VALUES (?, ?, ?)
+        """, ticket_types_data, table='TicketTypes')
 
 
         print("新增訂單")
@@ -388,52 +415,66 @@ def init_database():
             (4, 800, '2025-12-07 15:30:00', 'Cancelled'), # order_id=7: 寶可夢 全票x1+兒童票x1 (已取消)
         ]
         
-        for order in orders_data:
-            cursor.execute("""
-                INSERT INTO Orders (member_id, total_amount, order_date, status) 
-                VALUES (?, ?, ?, ?)
-            """, order)
+        insert_many(db, cursor, """
+            INSERT INTO Orders (member_id, total_amount, order_date, status)
+            VALUES (?, ?, ?, ?)
+        """, orders_data, table='Orders')
 
 
         print("新增票券")
-        # 根據訂單內容生成對應票券
+        # 根據訂單內容生成對應票券 (票券編號依下單時間排序)
+        order_dates = {order_id: datetime.fromisoformat(order[2]) for order_id, order in enumerate(orders_data, 1)}
         tickets_data = [
             # ticket_uuid, order_id, ticket_type_id, session_id, status, used_at
             
             # 訂單1 (王小明): 莫內展 全票x2, session_id=13 (12/25 10:00), ticket_type_id=11 (莫內全票)
-            (str(uuid.uuid4()), 1, 11, 13, 'Unused', None),
-            (str(uuid.uuid4()), 1, 11, 13, 'Unused', None),
+            (seeded_uuid(rng, order_dates[1]), 1, 11, 13, 'Unused', None),
+            (seeded_uuid(rng, order_dates[1]), 1, 11, 13, 'Unused', None),
             
             # 訂單2 (王小明): 蠟筆小新 全票x2, session_id=23 (12/27 10:00), ticket_type_id=19 (蠟筆小新全票)
-            (str(uuid.uuid4()), 2, 19, 23, 'Unused', None),
-            (str(uuid.uuid4()), 2, 19, 23, 'Unused', None),
+            (seeded_uuid(rng, order_dates[2]), 2, 19, 23, 'Unused', None),
+            (seeded_uuid(rng, order_dates[2]), 2, 19, 23, 'Unused', None),
             
             # 訂單3 (王小明): 吉卜力 全票x1, session_id=29 (1/15 10:00), ticket_type_id=23 (吉卜力全票)
             # 注意: 這筆訂單未付款，但票券仍會生成 (狀態可能不同，視系統設計)
-            (str(uuid.uuid4()), 3, 23, 29, 'Unused', None),
+            (seeded_uuid(rng, order_dates[3]), 3, 23, 29, 'Unused', None),
             
             # 訂單4 (李美華): 梵谷展 全票x2, session_id=16 (12/28 10:00), ticket_type_id=13 (梵谷全票)
-            (str(uuid.uuid4()), 4, 13, 16, 'Unused', None),
-            (str(uuid.uuid4()), 4, 13, 16, 'Unused', None),
+            (seeded_uuid(rng, order_dates[4]), 4, 13, 16, 'Unused', None),
+            (seeded_uuid(rng, order_dates[4]), 4, 13, 16, 'Unused', None),
             
             # 訂單5 (李美華): teamLab 全票x1, session_id=51 (2/10 10:00), ticket_type_id=39 (teamLab全票)
-            (str(uuid.uuid4()), 5, 39, 48, 'Unused', None),
+            (seeded_uuid(rng, order_dates[5]), 5, 39, 48, 'Unused', None),
             
             # 訂單6 (張志豪): 角落小夥伴 全票x1+兒童票x1, session_id=27 (1/10 10:00)
             # ticket_type_id=21 (角落全票), ticket_type_id=22 (角落兒童票)
-            (str(uuid.uuid4()), 6, 21, 27, 'Unused', None),
-            (str(uuid.uuid4()), 6, 22, 27, 'Unused', None),
+            (seeded_uuid(rng, order_dates[6]), 6, 21, 27, 'Unused', None),
+            (seeded_uuid(rng, order_dates[6]), 6, 22, 27, 'Unused', None),
         ]
         
-        for ticket in tickets_data:
-            cursor.execute("""
-                INSERT INTO Tickets (ticket_uuid, order_id, ticket_type_id, session_id, status, used_at) 
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, ticket)
+        insert_many(db, cursor, """
+            INSERT INTO Tickets (ticket_uuid, order_id, ticket_type_id, session_id, status, used_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, tickets_data, table='Tickets')
+
+        # 5. 產生大量模擬資料
+        if scale > 0:
+            generate_synthetic_data(db, cursor, scale, rng, batch_size)
+
+        # 6. 套用版本化的結構變更 (索引、票券編號轉為二進位等)
+        print("套用 migrations")
+        migrate(conn, db)
 
         conn.commit()
         print("資料庫初始化完成")
 
+        if replica_path:
+            if db.name == 'sqlite':
+                db.snapshot(replica_path)
+                print(f"已複製唯讀副本: {replica_path}")
+            else:
+                print("SQL Server 的唯讀副本請以 Always On 或複寫設定，略過 --replica")
+
     except Exception as e:
         print(f"初始化失敗: {e}")
         import traceback
@@ -445,5 +486,236 @@ def init_database():
             conn.close()
 
 
+# ==========================================
+# 大量模擬資料產生器
+# ==========================================
+
+SYNTH_THEMES = ['莫內', '梵谷', '畢卡索', '達文西', '草間彌生', '奈良美智', '吉卜力', '迪士尼', '寶可夢', '哆啦A夢',
+                '航海王', '蠟筆小新', '角落小夥伴', '名偵探柯南', 'teamLab', '安藤忠雄', '故宮國寶', '浮世繪', '印象派', '文藝復興']
+SYNTH_KINDS = ['特展', '沉浸式體驗展', '回顧展', '主題展', '藝術大展', '互動展', '巡迴展']
+SYNTH_VENUES = ['華山1914文創園區', '松山文創園區', '中正紀念堂', '國立故宮博物院', '台北市立美術館', '國立台灣美術館',
+                '高雄市立美術館', '奇美博物館', '南港展覽館', '高雄駁二藝術特區', '國立科學工藝博物館', '台北當代藝術館']
+SYNTH_HALLS = ['一館', '二館', '東2館', '東3館', '中4館', '中5館', '特展廳', '大廳', '一號倉庫', '二號倉庫']
+SYNTH_TICKET_TYPES = [('全票', 1.0), ('學生票', 0.8), ('兒童票', 0.7), ('敬老票', 0.5), ('優待票', 0.75)]
+SYNTH_SESSION_HOURS = [10, 12, 14, 16, 18, 19]
+
+# 每單張數的分布：1 張 40%、2 張 35%、3 張 15%、4 張 10%
+SYNTH_ORDER_SIZES = [1, 2, 3, 4]
+SYNTH_ORDER_SIZE_WEIGHTS = [40, 35, 15, 10]
+# 下單時段：晚上與午休時間較多
+SYNTH_ORDER_HOURS = list(range(24))
+SYNTH_ORDER_HOUR_WEIGHTS = [1, 1, 1, 1, 1, 1, 2, 3, 4, 5, 6, 7, 9, 8, 6, 6, 6, 7, 8, 10, 12, 12, 9, 4]
+
+
+def _next_id(cursor, table, column):
+    cursor.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}")
+    return int(cursor.fetchone()[0]) + 1
+
+
+def _insert_with_ids(db, cursor, table, sql, rows, batch_size, report=True):
+    """指定 IDENTITY 欄位的值寫入，讓後續資料可以直接引用這些 ID"""
+    db.set_identity_insert(cursor, table, True)
+    try:
+        return insert_many(db, cursor, sql, rows, table=table if report else None, batch_size=batch_size)
+    finally:
+        db.set_identity_insert(cursor, table, False)
+
+
+def generate_synthetic_data(db, cursor, scale, rng, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    依規模產生模擬資料，每 1 單位規模約為：
+    1,000 檔展覽、20,000 位會員、100,000 筆訂單、約 19 萬張票券
+    - 展覽熱門程度呈 Zipf 分布，少數熱門展覽賣出大部分的票
+    - 下單時間集中在開賣後前幾天，之後逐漸下降；每日時段以晚上最多
+    - 已過的場次大部分票券已核銷
+    """
+    print(f"產生模擬資料 (規模 {scale})")
+    overall_start = time.perf_counter()
+    total_rows = 0
+
+    n_members = max(1, int(20000 * scale))
+    n_organizers = max(1, int(200 * scale))
+    n_exhibitions = max(1, int(1000 * scale))
+    n_orders = int(100000 * scale)
+
+    # --- 會員 (共用同一組密碼雜湊，避免花大量時間計算雜湊) ---
+    member_start = _next_id(cursor, 'Members', 'member_id')
+    password_hash = generate_password_hash('user123')
+    total_rows += _insert_with_ids(db, cursor, 'Members', """
+        INSERT INTO Members (member_id, name, email, password_hash, phone, role)
+        VALUES (?, ?, ?, ?, ?, 'user')
+    """, (
+        (member_start + i, f'會員{member_start + i}', f'member{member_start + i}@example.com', password_hash,
+         f'09{rng.randrange(10 ** 8):08d}')
+        for i in range(n_members)
+    ), batch_size)
+
+    # --- 主辦單位 ---
+    organizer_start = _next_id(cursor, 'Organizers', 'organizer_id')
+    total_rows += _insert_with_ids(db, cursor, 'Organizers', """
+        INSERT INTO Organizers (organizer_id, name, contact_person, phone, email)
+        VALUES (?, ?, ?, ?, ?)
+    """, (
+        (organizer_start + i, f'模擬主辦單位{organizer_start + i}', '聯絡人', '02-12345678', f'org{organizer_start + i}@example.com')
+        for i in range(n_organizers)
+    ), batch_size)
+
+    # --- 展覽、場次、票種 (先在記憶體中產生，訂單需要參考) ---
+    exhibition_start = _next_id(cursor, 'Exhibitions', 'exhibition_id')
+    session_id = _next_id(cursor, 'Sessions', 'session_id')
+    ticket_type_id = _next_id(cursor, 'TicketTypes', 'ticket_type_id')
+    exhibitions, sessions, ticket_types = [], [], []
+    catalog = []  # (exhibition_id, 開賣日, 最後可下單日, [(session_id, session_time, 容量)], [(ticket_type_id, 價格)])
+    for i in range(n_exhibitions):
+        exhibition_id = exhibition_start + i
+        theme = rng.choice(SYNTH_THEMES)
+        start_date = REFERENCE_DATE + timedelta(days=rng.randint(-720, 180))
+        end_date = start_date + timedelta(days=rng.randint(30, 180))
+        if rng.random() < 0.03:
+            status = 'Draft'
+        else:
+            status = 'Ended' if end_date < REFERENCE_DATE else 'Published'
+        exhibitions.append((
+            exhibition_id, organizer_start + rng.randrange(n_organizers),
+            f'{theme}{rng.choice(SYNTH_KINDS)} #{exhibition_id}',
+            f'{rng.choice(SYNTH_VENUES)} {rng.choice(SYNTH_HALLS)}',
+            f'{theme}主題的模擬展覽資料，用於效能測試。',
+            start_date, end_date, status, f'{rng.randrange(10000):04d}',
+        ))
+
+        ex_sessions = []
+        days = (end_date - start_date).days
+        for _ in range(rng.randint(2, 6)):
+            session_time = datetime.combine(start_date + timedelta(days=rng.randrange(days + 1)), datetime.min.time())
+            session_time = session_time.replace(hour=rng.choice(SYNTH_SESSION_HOURS))
+            capacity = rng.choice([100, 150, 200, 250, 300, 500])
+            sessions.append([session_id, exhibition_id, session_time, capacity])
+            ex_sessions.append((session_id, session_time, capacity))
+            session_id += 1
+
+        ex_types = []
+        base_price = rng.randrange(250, 650, 10)
+        for name, ratio in rng.sample(SYNTH_TICKET_TYPES, rng.randint(2, 3)):
+            price = round(base_price * ratio / 10) * 10
+            ticket_types.append((ticket_type_id, exhibition_id, name, price))
+            ex_types.append((ticket_type_id, price))
+            ticket_type_id += 1
+
+        # 草稿不開賣；開賣日為展覽開始前 30 天
+        on_sale = start_date - timedelta(days=30)
+        last_day = min(end_date, REFERENCE_DATE)
+        if status != 'Draft' and on_sale <= last_day:
+            catalog.append((exhibition_id, on_sale, last_day, ex_sessions, ex_types))
+
+    total_rows += _insert_with_ids(db, cursor, 'Exhibitions', """
+        INSERT INTO Exhibitions (exhibition_id, organizer_id, title, location, description, start_date, end_date, status, validation_pin)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, exhibitions, batch_size)
+    total_rows += _insert_with_ids(db, cursor, 'Sessions', """
+        INSERT INTO Sessions (session_id, exhibition_id, session_time, capacity)
+        VALUES (?, ?, ?, ?)
+    """, sessions, batch_size)
+    total_rows += _insert_with_ids(db, cursor, 'TicketTypes', """
+        INSERT INTO TicketTypes (ticket_type_id, exhibition_id, name, price)
+        VALUES (?, ?, ?, ?)
+    """, ticket_types, batch_size)
+
+    # --- 訂單與票券 ---
+    if not catalog:
+        # 規模很小時可能沒有任何開賣中的展覽，沒有可下單的場次就不產生訂單
+        print("  沒有開賣中的展覽，略過訂單與票券")
+        n_orders = 0
+    # 熱門程度：隨機排名後套用 Zipf 分布 (第 k 名的權重為 1 / k^1.1)
+    rng.shuffle(catalog)
+    cum_weights = list(itertools.accumulate(1 / (rank ** 1.1) for rank in range(1, len(catalog) + 1)))
+    sold = {}  # session_id -> 已售張數
+    reference_dt = datetime.combine(REFERENCE_DATE, datetime.min.time())
+    order_start = _next_id(cursor, 'Orders', 'order_id')
+
+    def pick_order():
+        """抽一筆訂單內容；熱門展覽額滿時改抽其他展覽，多次都額滿則回傳 None"""
+        size = rng.choices(SYNTH_ORDER_SIZES, SYNTH_ORDER_SIZE_WEIGHTS)[0]
+        for _ in range(8):
+            exhibition_id, on_sale, last_day, ex_sessions, ex_types = catalog[
+                bisect.bisect_left(cum_weights, rng.random() * cum_weights[-1])]
+            sid, session_time, capacity = rng.choice(ex_sessions)
+            if sold.get(sid, 0) + size <= capacity:
+                break
+        else:
+            return None
+        sold[sid] = sold.get(sid, 0) + size
+
+        # 下單日：開賣後呈指數遞減 (平均 10 天)，不超過最後可下單日，也不晚於所選場次的開始時間
+        window = (min(last_day, session_time.date()) - on_sale).days
+        offset = min(int(rng.expovariate(1 / 10)), window)
+        order_date = datetime.combine(on_sale + timedelta(days=offset), datetime.min.time()) + timedelta(
+            hours=rng.choices(SYNTH_ORDER_HOURS, SYNTH_ORDER_HOUR_WEIGHTS)[0], minutes=rng.randrange(60))
+        if order_date >= session_time:
+            order_date = session_time - timedelta(minutes=rng.randrange(1, 120))
+        lines = [(rng.choice(ex_types), sid, session_time) for _ in range(size)]
+        return order_date, lines
+
+    orders_done = 0
+    tickets_total = 0
+    order_id = order_start
+    phase_start = time.perf_counter()
+    chunk_size = max(batch_size, 1000)
+    while orders_done < n_orders:
+        orders, tickets = [], []
+        for _ in range(min(chunk_size, n_orders - orders_done)):
+            orders_done += 1
+            picked = pick_order()
+            if picked is None:
+                continue
+            order_date, lines = picked
+            roll = rng.random()
+            status = 'Paid' if roll < 0.92 else ('Pending' if roll < 0.97 else 'Cancelled')
+            orders.append((order_id, member_start + rng.randrange(n_members),
+                           sum(price for (_, price), _, _ in lines), order_date, status))
+            for (tt_id, _), sid, session_time in lines:
+                if session_time < reference_dt and rng.random() < 0.85:
+                    used_at = session_time + timedelta(minutes=rng.randrange(90))
+                    tickets.append((seeded_uuid(rng, order_date), order_id, tt_id, sid, 'Used', used_at))
+                else:
+                    tickets.append((seeded_uuid(rng, order_date), order_id, tt_id, sid, 'Unused', None))
+            order_id += 1
+
+        _insert_with_ids(db, cursor, 'Orders', """
+            INSERT INTO Orders (order_id, member_id, total_amount, order_date, status)
+            VALUES (?, ?, ?, ?, ?)
+        """, orders, batch_size, report=False)
+        insert_many(db, cursor, """
+            INSERT INTO Tickets (ticket_uuid, order_id, ticket_type_id, session_id, status, used_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, tickets, batch_size=batch_size)
+        tickets_total += len(tickets)
+        total_rows += len(orders) + len(tickets)
+
+    elapsed = time.perf_counter() - phase_start
+    n_written = order_id - order_start
+    print(f"  Orders + Tickets: {n_written:,} 筆訂單、{tickets_total:,} 張票券，{elapsed:.2f} 秒，"
+          f"{(n_written + tickets_total) / elapsed if elapsed else 0:,.0f} 筆/秒")
+
+    # --- 場次剩餘座位 = 容量 - 已售 (一次 set-based 更新，SQL Server 與 SQLite 共用的 UPDATE ... FROM 寫法) ---
+    session_start = sessions[0][0] if sessions else session_id
+    cursor.execute("""
+        UPDATE Sessions SET capacity = capacity - X.sold
+        FROM (SELECT session_id, COUNT(*) AS sold FROM Tickets WHERE session_id >= ? GROUP BY session_id) X
+        WHERE Sessions.session_id = X.session_id
+    """, (session_start,))
+
+    elapsed = time.perf_counter() - overall_start
+    print(f"模擬資料完成：共 {total_rows:,} 筆，{elapsed:.2f} 秒，平均 {total_rows / elapsed if elapsed else 0:,.0f} 筆/秒")
+
+
 if __name__ == '__main__':
-    init_database()
+    parser = argparse.ArgumentParser(description='重建資料庫並寫入示範資料')
+    parser.add_argument('--scale', type=float, default=0,
+                        help='額外產生的模擬資料規模 (1 = 1,000 檔展覽、約 19 萬張票券)，預設 0 只寫入示範資料')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='亂數種子，相同種子會產生相同資料')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='每批寫入筆數')
+    parser.add_argument('--backend', choices=['mssql', 'sqlite'], help='資料庫後端 (預設讀取環境變數 DB_BACKEND)')
+    parser.add_argument('--replica', metavar='PATH', help='(SQLite) 另外複製一份資料庫檔案當作唯讀副本')
+    args = parser.parse_args()
+    init_database(scale=args.scale, seed=args.seed, batch_size=args.batch_size, backend=args.backend,
+                  replica_path=args.replica)
@@ -0,0 +1,217 @@
+"""
+場次座位保留 (inventory holds)
+
+加入購物車時就從 Sessions.capacity 扣下座位，並在 InventoryHolds 記錄一筆保留 (預設 10 分鐘)；
+結帳時直接把自己的保留轉成票券，不必在熱門場次開賣時和所有人搶同一列的剩餘座位。
+過期的保留由 sweep() 批次歸還，因此 Sessions.capacity 代表「可售 = 總量 - 已售 - 保留中」。
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class SeatCounter:
+    """
+    各場次剩餘座位的記憶體計數，展覽詳細頁直接讀取，不必查詢 (並等待) 正在被搶購的場次資料列
+    - 依展覽整批載入場次，ttl 秒後重新載入，與其他 worker 的異動達成最終一致
+    - 本行程內的保留、結帳、歸還以 adjust() 立即反映
+    """
+
+    def __init__(self, loader, ttl=5):
+        self._loader = loader        # exhibition_id -> 場次列表 (session_id, session_time, capacity)
+        self.ttl = ttl
+        self._exhibitions = {}       # exhibition_id -> (到期時間, [場次])
+        self._sessions = {}          # session_id -> 場次 (dict，capacity 為剩餘座位)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'adjustments': 0}
+
+    def _cached(self, exhibition_id):
+        entry = self._exhibitions.get(exhibition_id)
+        if entry and time.monotonic() < entry[0]:
+            with self._lock:
+                return [dict(s) for s in entry[1]]
+        return None
+
+    def sessions(self, exhibition_id):
+        """回傳展覽的場次列表 (依時間排序)，每筆的 capacity 為目前剩餘座位"""
+        sessions = self._cached(exhibition_id)
+        if sessions is not None:
+            self._count(hits=1)
+            return sessions
+
+        with self._load_lock:
+            sessions = self._cached(exhibition_id)
+            if sessions is not None:
+                self._count(hits=1)
+                return sessions
+            self._count(misses=1)
+            loaded = [{'session_id': row['session_id'], 'session_time': row['session_time'], 'capacity': row['capacity']}
+                      for row in self._loader(exhibition_id)]
+            with self._lock:
+                old = self._exhibitions.get(exhibition_id)
+                for s in old[1] if old else ():
+                    self._sessions.pop(s['session_id'], None)
+                for s in loaded:
+                    self._sessions[s['session_id']] = s
+                self._exhibitions[exhibition_id] = (time.monotonic() + self.ttl, loaded)
+                return [dict(s) for s in loaded]
+
+    def _count(self, **counts):
+        with self._lock:
+            for key, n in counts.items():
+                self._stats[key] += n
+
+    def adjust(self, session_id, delta):
+        """本行程內的座位異動 (保留為負、歸還為正)"""
+        with self._lock:
+            s = self._sessions.get(session_id)
+            if s is not None:
+                s['capacity'] += delta
+                self._stats['adjustments'] += 1
+
+    def invalidate(self, exhibition_id=None):
+        """後台新增 / 刪除場次後呼叫，下次讀取時重新載入"""
+        with self._lock:
+            if exhibition_id is None:
+                self._exhibitions.clear()
+                self._sessions.clear()
+                return
+            entry = self._exhibitions.pop(exhibition_id, None)
+            for s in entry[1] if entry else ():
+                self._sessions.pop(s['session_id'], None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, ttl=self.ttl, exhibitions=len(self._exhibitions), sessions=len(self._sessions))
+
+
+class InventoryHolds:
+    """
+    座位保留引擎
+    - hold()：扣座位並記錄保留 (庫存不足時回傳 False)；同一人在同一場次保留中的張數不可超過 max_per_owner
+    - claim()：結帳時認領自己尚未過期的保留，回傳 {session_id: 張數}
+    - release()：清空購物車時歸還自己的保留
+    - transfer()：登入換發 session id 後，把保留移到新的 session id 名下
+    - sweep()：批次歸還過期的保留；maybe_sweep() 每隔 sweep_interval 秒由請求順便觸發
+    保留以 DELETE ... OUTPUT / RETURNING 認領，同一筆保留只會被結帳或 sweep() 其中一方取得
+    """
+
+    COLUMNS = ('session_id', 'quantity')
+
+    def __init__(self, db, counter=None, hold_seconds=600, sweep_interval=30, sweep_batch_size=1000, max_per_owner=10):
+        self.db = db
+        self.counter = counter
+        self.hold_seconds = hold_seconds
+        self.max_per_owner = max_per_owner
+        self.sweep_interval = sweep_interval
+        self.sweep_batch_size = sweep_batch_size
+        self._next_sweep = time.time() + sweep_interval
+        self._sweep_lock = threading.Lock()
+        self._lock = threading.Lock()  # 保護統計數字
+        self._stats = {'holds': 0, 'rejected': 0, 'over_limit': 0, 'claimed': 0, 'released': 0, 'expired': 0, 'sweeps': 0}
+
+    def held(self, cursor, owner, session_id):
+        """owner 在此場次尚未過期的保留張數"""
+        cursor.execute("SELECT SUM(quantity) FROM InventoryHolds WHERE owner = ? AND session_id = ? AND expires_at > ?",
+                       (owner, session_id, datetime.now()))
+        row = cursor.fetchone()
+        return (row[0] or 0) if row else 0
+
+    def within_limit(self, cursor, owner, session_id, quantity):
+        """再保留 quantity 張是否仍在每人上限內 (防止單一使用者反覆加入購物車佔住整個場次)"""
+        if self.held(cursor, owner, session_id) + quantity <= self.max_per_owner:
+            return True
+        self._count(over_limit=1)
+        return False
+
+    def hold(self, cursor, owner, session_id, quantity):
+        cursor.execute("""
+            UPDATE Sessions SET capacity = capacity - ?
+            WHERE session_id = ? AND capacity >= ?
+        """, (quantity, session_id, quantity))
+        if cursor.rowcount == 0:
+            self._count(rejected=1)
+            return False
+        cursor.execute("INSERT INTO InventoryHolds (owner, session_id, quantity, expires_at) VALUES (?, ?, ?, ?)",
+                       (owner, session_id, quantity, datetime.now() + timedelta(seconds=self.hold_seconds)))
+        self._count(holds=1)
+        return True
+
+    def _take(self, cursor, where, params):
+        """刪除 (認領) 符合條件的保留，依場次加總張數"""
+        seats = {}
+        for session_id, quantity in self.db.delete_returning(cursor, 'InventoryHolds', self.COLUMNS, where, params):
+            seats[session_id] = seats.get(session_id, 0) + quantity
+        return seats
+
+    def _restore(self, cursor, seats):
+        if seats:
+            self.db.executemany(cursor, "UPDATE Sessions SET capacity = capacity + ? WHERE session_id = ?",
+                                [(quantity, session_id) for session_id, quantity in sorted(seats.items())])
+
+    def claim(self, cursor, owner):
+        """認領後座位已經扣過，呼叫端不必再更新 Sessions；交易 rollback 時保留會一併復原"""
+        seats = self._take(cursor, "owner = ? AND expires_at > ?", (owner, datetime.now()))
+        self._count(claimed=sum(seats.values()))
+        return seats
+
+    def release(self, cursor, owner):
+        seats = self._take(cursor, "owner = ? AND expires_at > ?", (owner, datetime.now()))
+        self._restore(cursor, seats)
+        self._count(released=sum(seats.values()))
+        return seats
+
+    def transfer(self, cursor, old_owner, new_owner):
+        cursor.execute("UPDATE InventoryHolds SET owner = ? WHERE owner = ?", (new_owner, old_owner))
+        return cursor.rowcount
+
+    def sweep(self, conn):
+        """分批歸還所有過期的保留，每批一個交易；回傳 {session_id: 歸還張數}"""
+        cutoff = datetime.now()
+        released = {}
+        cursor = conn.cursor()
+        while True:
+            seats = self._take(cursor, f"""
+                hold_id IN (SELECT hold_id FROM InventoryHolds WHERE expires_at <= ?
+                            ORDER BY hold_id {self.db.limit(self.sweep_batch_size)})
+            """, (cutoff,))
+            if not seats:
+                conn.commit()
+                break
+            self._restore(cursor, seats)
+            conn.commit()
+            for session_id, quantity in seats.items():
+                released[session_id] = released.get(session_id, 0) + quantity
+                if self.counter:
+                    self.counter.adjust(session_id, quantity)
+        self._count(sweeps=1, expired=sum(released.values()))
+        return released
+
+    def maybe_sweep(self, get_connection):
+        now = time.time()
+        if now < self._next_sweep or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sweep = now + self.sweep_interval
+            conn = get_connection()
+            if conn:
+                try:
+                    self.sweep(conn)
+                finally:
+                    conn.close()
+        except Exception as e:
+            print(f"歸還過期座位保留失敗: {e}")
+        finally:
+            self._sweep_lock.release()
+
+    def _count(self, **counts):
+        with self._lock:
+            for key, n in counts.items():
+                self._stats[key] += n
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        return dict(stats, hold_seconds=self.hold_seconds, sweep_interval=self.sweep_interval,
+                    max_per_owner=self.max_per_owner)
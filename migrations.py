@@ -0,0 +1,321 @@
+"""
+資料庫結構版本管理 (schema migrations)
+
+每個 migration 有固定的版本號，套用後記錄在 SchemaMigrations 資料表中，
+重複執行只會套用尚未執行過的版本，不會清除任何資料。
+
+執行方式 (在專案根目錄)：
+    python migrations.py             套用所有尚未執行的 migration
+    python migrations.py --status    列出各版本是否已套用
+    python migrations.py --report    套用前後各跑一次熱門查詢，比較執行計畫與耗時
+"""
+import argparse
+import time
+
+from db_backends import get_dialect, translate_ddl
+
+
+def _create_index(name, table, columns, include=None):
+    """建立索引 (已存在則略過)，確保每個 migration 都可以重複執行"""
+    return lambda db: db.create_index_sql(name, table, columns, include)
+
+
+def _add_column(table, column, definition):
+    """新增欄位；definition 可使用 {text} 等方言相關的型別"""
+    return lambda db: f"ALTER TABLE {table} ADD {column} {translate_ddl(definition, db)}"
+
+
+def _create_table(name, body):
+    """建立資料表 (已存在則略過)；body 可使用 {identity_pk}、{text}、{now}、{binary16} 等方言相關的型別"""
+    return lambda db: db.create_table_sql(name, translate_ddl(body, db))
+
+
+def _fill_sales_summary_v6(db):
+    """
+    migration 6：由現有的已付款訂單計算彙總表的初始內容
+    這裡是當時的查詢的固定副本，之後修改 sales_summary.py 不會改變已發佈的 migration
+    """
+    paid_tickets = """
+        FROM Tickets T
+        JOIN Orders O ON T.order_id = O.order_id
+        JOIN TicketTypes TT ON T.ticket_type_id = TT.ticket_type_id
+    """
+    day = db.date_sql('O.order_date')
+    return [
+        "DELETE FROM SalesBySession",
+        f"""
+            INSERT INTO SalesBySession (exhibition_id, session_id, tickets_sold, revenue)
+            SELECT S.exhibition_id, T.session_id, COUNT(*), SUM(TT.price)
+            {paid_tickets}
+            JOIN Sessions S ON T.session_id = S.session_id
+            WHERE O.status = 'Paid'
+            GROUP BY S.exhibition_id, T.session_id
+        """,
+        "DELETE FROM SalesByTicketType",
+        f"""
+            INSERT INTO SalesByTicketType (exhibition_id, ticket_type_id, tickets_sold, revenue)
+            SELECT TT.exhibition_id, T.ticket_type_id, COUNT(*), SUM(TT.price)
+            {paid_tickets}
+            WHERE O.status = 'Paid'
+            GROUP BY TT.exhibition_id, T.ticket_type_id
+        """,
+        "DELETE FROM SalesByDay",
+        f"""
+            INSERT INTO SalesByDay (sales_date, exhibition_id, orders, tickets_sold, revenue)
+            SELECT {day}, TT.exhibition_id, COUNT(DISTINCT O.order_id), COUNT(*), SUM(TT.price)
+            {paid_tickets}
+            WHERE O.status = 'Paid'
+            GROUP BY {day}, TT.exhibition_id
+        """,
+    ]
+
+
+# (版本, 說明, SQL 語句列表)；新增 migration 時請接在最後面，版本號遞增，已發佈的版本不要修改
+# 語句可以是字串，或是接收資料庫方言、回傳 SQL (或 SQL 列表) 的函式 (各資料庫語法不同時使用)
+MIGRATIONS = [
+    (1, '熱門查詢的次要索引', [
+        # detail()、admin_manage_exhibition()、admin_delete_exhibition() 依展覽查場次與票種
+        _create_index('IX_Sessions_exhibition_id', 'Sessions', 'exhibition_id', 'session_time, capacity'),
+        _create_index('IX_TicketTypes_exhibition_id', 'TicketTypes', 'exhibition_id', 'name, price'),
+        # my_tickets() 依會員查訂單，並依下單時間排序
+        _create_index('IX_Orders_member_id_order_date', 'Orders', 'member_id, order_date DESC', 'status'),
+        # my_tickets() 由訂單找票券；admin_delete_exhibition() 依場次 / 票種刪除票券
+        _create_index('IX_Tickets_order_id', 'Tickets', 'order_id', 'ticket_type_id, session_id, status'),
+        _create_index('IX_Tickets_session_id', 'Tickets', 'session_id'),
+        _create_index('IX_Tickets_ticket_type_id', 'Tickets', 'ticket_type_id'),
+        # index() 依狀態篩選並依開始日期排序
+        _create_index('IX_Exhibitions_status_start_date', 'Exhibitions', 'status, start_date DESC',
+                      'title, location, end_date, image_path'),
+    ]),
+    (2, '加入購物車時的座位保留', [
+        _create_table('InventoryHolds', """
+            hold_id {identity_pk},
+            owner VARCHAR(64) NOT NULL,
+            session_id INT NOT NULL,
+            quantity INT NOT NULL,
+            expires_at DATETIME NOT NULL,
+            FOREIGN KEY (session_id) REFERENCES Sessions(session_id)
+        """),
+        # 結帳 / 清空購物車依擁有者認領；sweep() 依到期時間批次歸還
+        _create_index('IX_InventoryHolds_owner', 'InventoryHolds', 'owner, expires_at', 'session_id, quantity'),
+        _create_index('IX_InventoryHolds_expires_at', 'InventoryHolds', 'expires_at'),
+        _create_index('IX_InventoryHolds_session_id', 'InventoryHolds', 'session_id'),
+    ]),
+    (3, '票券編號改為 16 bytes 的二進位值', [
+        # 主鍵型別無法直接修改 (SQLite 不支援)，建立新表、轉換資料後換名；舊票券的文字編號轉換後不變
+        _create_table('Tickets_v3', """
+            ticket_uuid {binary16} NOT NULL,
+            order_id INT NOT NULL,
+            ticket_type_id INT NOT NULL,
+            session_id INT,
+            status VARCHAR(20) DEFAULT 'Unused',
+            used_at DATETIME,
+            CONSTRAINT PK_Tickets PRIMARY KEY (ticket_uuid),
+            FOREIGN KEY (order_id) REFERENCES Orders(order_id),
+            FOREIGN KEY (ticket_type_id) REFERENCES TicketTypes(ticket_type_id),
+            FOREIGN KEY (session_id) REFERENCES Sessions(session_id)
+        """),
+        lambda db: f"""
+            INSERT INTO Tickets_v3 (ticket_uuid, order_id, ticket_type_id, session_id, status, used_at)
+            SELECT {db.uuid_to_binary_sql('ticket_uuid')}, order_id, ticket_type_id, session_id, status, used_at
+            FROM Tickets
+        """,
+        "DROP TABLE Tickets",
+        lambda db: db.rename_table_sql('Tickets_v3', 'Tickets'),
+        # 索引隨舊表一起刪除，重新建立 (與版本 1 相同)
+        _create_index('IX_Tickets_order_id', 'Tickets', 'order_id', 'ticket_type_id, session_id, status'),
+        _create_index('IX_Tickets_session_id', 'Tickets', 'session_id'),
+        _create_index('IX_Tickets_ticket_type_id', 'Tickets', 'ticket_type_id'),
+    ]),
+    (4, '展覽圖片的縮圖與衍生檔清單', [
+        # JSON：{尺寸名稱: {格式: [[寬度, 網址], ...]}}，由 image_pipeline 在背景產生後寫入
+        _add_column('Exhibitions', 'image_variants', '{text} NULL'),
+    ]),
+    (5, '展覽的背景分批刪除工作', [
+        # 展覽刪除完成後工作紀錄仍保留，所以 exhibition_id 不設外鍵
+        _create_table('PurgeJobs', """
+            job_id {identity_pk},
+            exhibition_id INT NOT NULL,
+            image_path NVARCHAR(500) NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'Pending',
+            phase VARCHAR(20) NULL,
+            total_tickets INT NULL,
+            deleted_tickets INT NOT NULL DEFAULT 0,
+            attempts INT NOT NULL DEFAULT 0,
+            last_error {text} NULL,
+            locked_by VARCHAR(64) NULL,
+            locked_until DATETIME NULL,
+            created_at DATETIME DEFAULT {now},
+            finished_at DATETIME NULL
+        """),
+        # 背景執行緒依狀態找出待處理的工作
+        _create_index('IX_PurgeJobs_status', 'PurgeJobs', 'status, job_id', 'locked_until'),
+    ]),
+    (6, '銷售彙總表', [
+        # 由結帳增量更新，後台報表只讀這幾張表 (見 sales_summary.py)
+        _create_table('SalesBySession', """
+            exhibition_id INT NOT NULL,
+            session_id INT NOT NULL,
+            tickets_sold INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            CONSTRAINT PK_SalesBySession PRIMARY KEY (exhibition_id, session_id)
+        """),
+        _create_table('SalesByTicketType', """
+            exhibition_id INT NOT NULL,
+            ticket_type_id INT NOT NULL,
+            tickets_sold INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            CONSTRAINT PK_SalesByTicketType PRIMARY KEY (exhibition_id, ticket_type_id)
+        """),
+        _create_table('SalesByDay', """
+            sales_date DATE NOT NULL,
+            exhibition_id INT NOT NULL,
+            orders INT NOT NULL DEFAULT 0,
+            tickets_sold INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            CONSTRAINT PK_SalesByDay PRIMARY KEY (sales_date, exhibition_id)
+        """),
+        # 單一展覽的每日銷售；展覽刪除時依展覽清除
+        _create_index('IX_SalesByDay_exhibition_id', 'SalesByDay', 'exhibition_id, sales_date'),
+        # 由現有的訂單與票券計算初始內容
+        _fill_sales_summary_v6,
+    ]),
+]
+
+
+def ensure_version_table(cursor, db):
+    cursor.execute(_create_table('SchemaMigrations', """
+        version INT PRIMARY KEY,
+        description NVARCHAR(200) NOT NULL,
+        applied_at DATETIME DEFAULT {now}
+    """)(db))
+
+
+def applied_versions(cursor, db):
+    ensure_version_table(cursor, db)
+    cursor.execute("SELECT version FROM SchemaMigrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(conn, db, target=None):
+    """依序套用尚未執行的 migration，回傳本次套用的版本列表"""
+    cursor = conn.cursor()
+    done = applied_versions(cursor, db)
+    conn.commit()
+
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        print(f"套用 migration {version}: {description}")
+        try:
+            for statement in statements:
+                sql = statement(db) if callable(statement) else statement
+                for part in [sql] if isinstance(sql, str) else sql:
+                    cursor.execute(part)
+            cursor.execute("INSERT INTO SchemaMigrations (version, description) VALUES (?, ?)", (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+# ==========================================
+# 執行計畫與耗時報告
+# ==========================================
+
+# 報告用的熱門查詢 (參數直接帶入常數，讓 SHOWPLAN 可以解析；{limit} 依資料庫換成限制筆數的語法)
+REPORT_QUERIES = [
+    ('index() 首頁目錄', """
+        SELECT exhibition_id, title, location, start_date, end_date, status, image_path FROM Exhibitions
+        WHERE status IN ('Published', 'Ended')
+        ORDER BY CASE WHEN status = 'Ended' THEN 1 ELSE 0 END, start_date DESC, exhibition_id DESC
+    """),
+    ('detail() 場次', "SELECT * FROM Sessions WHERE exhibition_id = 6 ORDER BY session_time"),
+    ('detail() 票種', "SELECT * FROM TicketTypes WHERE exhibition_id = 6"),
+    ('my_tickets() 票券', """
+        SELECT T.ticket_uuid, E.title, S.session_time, TT.name, T.status, O.order_date
+        FROM Tickets T
+        JOIN Orders O ON T.order_id = O.order_id
+        JOIN TicketTypes TT ON T.ticket_type_id = TT.ticket_type_id
+        JOIN Sessions S ON T.session_id = S.session_id
+        JOIN Exhibitions E ON TT.exhibition_id = E.exhibition_id
+        WHERE O.member_id = 2
+        ORDER BY O.order_date DESC, T.ticket_uuid DESC
+        {limit}
+    """),
+    ('admin_delete_exhibition() 票券', """
+        SELECT COUNT(*) FROM Tickets
+        WHERE session_id IN (SELECT session_id FROM Sessions WHERE exhibition_id = 6)
+           OR ticket_type_id IN (SELECT ticket_type_id FROM TicketTypes WHERE exhibition_id = 6)
+    """),
+]
+
+
+def query_timing(cursor, sql, repeat=20):
+    """回傳 (平均, 最快) 毫秒"""
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sql)
+        cursor.fetchall()
+        elapsed.append((time.perf_counter() - start) * 1000)
+    return sum(elapsed) / len(elapsed), min(elapsed)
+
+
+def collect_report(conn, db, repeat=20):
+    cursor = conn.cursor()
+    report = {}
+    for name, sql in REPORT_QUERIES:
+        sql = sql.replace('{limit}', db.limit(21))
+        report[name] = {'plan': db.query_plan(cursor, sql), 'timing': query_timing(cursor, sql, repeat)}
+    return report
+
+
+def print_report(before, after):
+    print("\n========== 執行計畫與耗時比較 ==========")
+    for name, _ in REPORT_QUERIES:
+        b, a = before[name], after[name]
+        print(f"\n## {name}")
+        print(f"   耗時 (平均 / 最快)：套用前 {b['timing'][0]:.2f} / {b['timing'][1]:.2f} ms，"
+              f"套用後 {a['timing'][0]:.2f} / {a['timing'][1]:.2f} ms")
+        print("   [套用前執行計畫]")
+        for line in b['plan']:
+            print(f"     {line}")
+        print("   [套用後執行計畫]")
+        for line in a['plan']:
+            print(f"     {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--status', action='store_true', help='列出各版本是否已套用')
+    parser.add_argument('--report', action='store_true', help='輸出套用前後的執行計畫與耗時比較')
+    parser.add_argument('--target', type=int, help='只套用到指定版本')
+    parser.add_argument('--repeat', type=int, default=20, help='報告中每個查詢執行的次數')
+    parser.add_argument('--backend', choices=['mssql', 'sqlite'], help='資料庫後端 (預設讀取環境變數 DB_BACKEND)')
+    args = parser.parse_args()
+
+    db = get_dialect(args.backend)
+    conn = db.connect()
+    try:
+        if args.status:
+            done = applied_versions(conn.cursor(), db)
+            conn.commit()
+            for version, description, _ in MIGRATIONS:
+                print(f"[{'x' if version in done else ' '}] {version}: {description}")
+            return
+
+        before = collect_report(conn, db, args.repeat) if args.report else None
+        applied = migrate(conn, db, args.target)
+        print(f"完成，本次套用 {len(applied)} 個 migration" if applied else "資料庫結構已是最新版本")
+        if args.report:
+            print_report(before, collect_report(conn, db, args.repeat))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
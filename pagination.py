@@ -0,0 +1,56 @@
+import base64
+import bisect
+import json
+
+
+def encode_cursor(values):
+    """把分頁游標 (排序鍵) 編碼成網址可用的字串"""
+    raw = json.dumps(list(values), separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """解析分頁游標，格式錯誤時回傳 None (視為第一頁)"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return tuple(values) if isinstance(values, list) else None
+
+
+def parse_limit(value, default=20, maximum=100):
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, maximum))
+
+
+class KeysetList:
+    """
+    已排序的記憶體清單，事先算好每筆資料的排序鍵
+    page() 以二分搜尋找到游標位置，每頁的成本只跟頁面大小有關 (keyset / seek 分頁)
+    """
+
+    def __init__(self, items, key):
+        self.items = sorted(items, key=key)
+        self.keys = [key(item) for item in self.items]
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def page(self, after=None, limit=20):
+        """回傳 (本頁資料, 下一頁游標)；沒有下一頁時游標為 None"""
+        try:
+            start = bisect.bisect_right(self.keys, tuple(after)) if after else 0
+        except TypeError:
+            start = 0  # 游標內容與排序鍵型別不符，從第一頁開始
+        end = start + limit
+        next_cursor = encode_cursor(self.keys[end - 1]) if end < len(self.items) else None
+        return self.items[start:end], next_cursor
@@ -0,0 +1,251 @@
+"""
+展覽的背景分批刪除 (purge job)
+
+大型展覽可能有數十萬張票券，一個 DELETE 刪完會長時間鎖住 Tickets (甚至升級成資料表鎖)，
+期間所有人的結帳都會被擋住。刪除展覽改為：
+1. 請求中只把展覽狀態改為 Deleting (前台立即看不到、不能再加入購物車或結帳)，並寫入一筆 PurgeJobs
+2. 背景執行緒依場次、票種分批刪除票券，每批一個短交易並記錄進度，批次之間稍作停頓
+3. 票券刪完後，在最後一個交易中刪除座位保留、場次、票種、展覽本身與它的銷售彙總
+
+每一步都可以重複執行，行程中途停止後，任何一個 worker 重新啟動時都會接手未完成的工作。
+同一個工作同時只會由一個 worker 處理 (以 locked_by / locked_until 租約認領，逾期未續約視為中斷)。
+"""
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from row_mapping import fetch_all, fetch_one
+from sales_summary import forget_exhibition
+
+DELETING = 'Deleting'  # 刪除中的展覽狀態
+
+
+class ExhibitionPurger:
+    """
+    - enqueue(cursor, exhibition_id)：在呼叫端的交易中隱藏展覽並建立刪除工作 (由呼叫端 commit)
+    - start()：啟動背景執行緒 (重複呼叫無妨)，處理新的與中斷的工作
+    - on_done(job)：展覽刪除完成後呼叫 (刪除圖片檔、清除快取)
+    """
+
+    def __init__(self, db, get_connection, batch_size=500, pause=0.05, poll_interval=30, lease_seconds=120,
+                 on_done=None):
+        self.db = db
+        self._get_connection = get_connection
+        self.batch_size = batch_size
+        self.pause = pause                  # 每批之間停頓的秒數，讓結帳等交易有機會取得鎖
+        self.poll_interval = poll_interval  # 沒有工作時多久檢查一次 (也是失敗後重試的間隔)
+        self.lease_seconds = lease_seconds
+        self.on_done = on_done
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"[:64]
+        self._worker = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {'jobs': 0, 'batches': 0, 'tickets': 0, 'errors': 0}
+
+    # --- 建立工作 ---
+    def enqueue(self, cursor, exhibition_id):
+        """回傳 (job_id, image_path)；展覽不存在時回傳 (None, None)"""
+        cursor.execute("SELECT status, image_path FROM Exhibitions WHERE exhibition_id = ?", (exhibition_id,))
+        row = fetch_one(cursor)
+        if not row:
+            return None, None
+        if row['status'] == DELETING:
+            # 重複送出：沿用尚未完成的工作
+            cursor.execute("SELECT job_id FROM PurgeJobs WHERE exhibition_id = ? AND status = 'Pending'", (exhibition_id,))
+            existing = cursor.fetchone()
+            if existing:
+                return existing[0], row['image_path']
+
+        job_id = self.db.insert_returning_id(cursor, """
+            INSERT INTO PurgeJobs (exhibition_id, image_path, status, phase, deleted_tickets, attempts)
+            VALUES (?, ?, 'Pending', 'queued', 0, 0)
+        """, (exhibition_id, row['image_path']))
+        cursor.execute("UPDATE Exhibitions SET status = ? WHERE exhibition_id = ?", (DELETING, exhibition_id))
+        return job_id, row['image_path']
+
+    # --- 背景執行緒 ---
+    def start(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name='exhibition-purge', daemon=True)
+                    self._worker.start()
+
+    def wake(self):
+        self.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            try:
+                while self.run_pending():
+                    pass
+            except Exception as e:
+                self._count(errors=1)
+                print(f"展覽背景刪除失敗 (稍後重試): {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def run_pending(self):
+        """認領並處理一個工作；沒有可處理的工作時回傳 False"""
+        conn = self._get_connection()
+        if not conn: raise RuntimeError("DB Connection Error")
+        try:
+            job = self._claim(conn)
+            if job is None:
+                return False
+            try:
+                self._purge(conn, job)
+            except Exception as e:
+                conn.rollback()
+                self._release(conn, job['job_id'], e)
+                raise
+            return True
+        finally:
+            conn.close()
+
+    def _claim(self, conn):
+        now = datetime.now()
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT job_id FROM PurgeJobs
+                WHERE status = 'Pending' AND (locked_until IS NULL OR locked_until < ?)
+                ORDER BY job_id {self.db.limit(1)}
+            """, (now,))
+            row = cursor.fetchone()
+            if not row:
+                conn.commit()
+                return None
+            # 條件與上面相同：其他 worker 搶先認領時影響行數為 0
+            cursor.execute("""
+                UPDATE PurgeJobs SET locked_by = ?, locked_until = ?, attempts = attempts + 1
+                WHERE job_id = ? AND status = 'Pending' AND (locked_until IS NULL OR locked_until < ?)
+            """, (self.owner, now + timedelta(seconds=self.lease_seconds), row[0], now))
+            claimed = cursor.rowcount == 1
+            conn.commit()
+            if not claimed:
+                return None
+            cursor.execute("SELECT * FROM PurgeJobs WHERE job_id = ?", (row[0],))
+            return fetch_one(cursor)
+
+    def _progress(self, cursor, job_id, phase, deleted=0):
+        """更新進度並續約；租約已被其他 worker 接手時丟出例外 (本批交易隨之回滾)"""
+        cursor.execute("""
+            UPDATE PurgeJobs SET phase = ?, deleted_tickets = deleted_tickets + ?, locked_until = ?
+            WHERE job_id = ? AND locked_by = ?
+        """, (phase, deleted, datetime.now() + timedelta(seconds=self.lease_seconds), job_id, self.owner))
+        if cursor.rowcount != 1:
+            raise RuntimeError(f"刪除工作 {job_id} 已由其他 worker 接手")
+
+    def _release(self, conn, job_id, error):
+        """處理失敗：釋放租約，poll_interval 秒後 (由任何 worker) 重試"""
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE PurgeJobs SET last_error = ?, locked_until = ?
+                    WHERE job_id = ? AND locked_by = ?
+                """, (str(error)[:1000], datetime.now() + timedelta(seconds=self.poll_interval), job_id, self.owner))
+            conn.commit()
+        except Exception as e:
+            print(f"無法記錄刪除工作 {job_id} 的錯誤: {e}")
+
+    def _purge(self, conn, job):
+        job_id, exhibition_id = job['job_id'], job['exhibition_id']
+        self._count(jobs=1)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT session_id FROM Sessions WHERE exhibition_id = ?", (exhibition_id,))
+            session_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT ticket_type_id FROM TicketTypes WHERE exhibition_id = ?", (exhibition_id,))
+            type_ids = [row[0] for row in cursor.fetchall()]
+
+            if job['total_tickets'] is None:
+                # 只在第一次執行時計算總數 (進度百分比用)；中斷後接手時沿用
+                cursor.execute("""
+                    SELECT COUNT(*) FROM Tickets
+                    WHERE session_id IN (SELECT session_id FROM Sessions WHERE exhibition_id = ?)
+                       OR ticket_type_id IN (SELECT ticket_type_id FROM TicketTypes WHERE exhibition_id = ?)
+                """, (exhibition_id, exhibition_id))
+                cursor.execute("UPDATE PurgeJobs SET total_tickets = ? WHERE job_id = ?", (cursor.fetchone()[0], job_id))
+                self._progress(cursor, job_id, 'tickets')
+                conn.commit()
+
+            # 依場次、再依票種 (其他展覽的場次誤用本展覽票種的票券) 分批刪除，每次都走對應的索引
+            for column, values in (('session_id', session_ids), ('ticket_type_id', type_ids)):
+                for value in values:
+                    while True:
+                        cursor.execute(f"""
+                            DELETE FROM Tickets WHERE ticket_uuid IN (
+                                SELECT ticket_uuid FROM Tickets WHERE {column} = ?
+                                ORDER BY {column} {self.db.limit(self.batch_size)})
+                        """, (value,))
+                        deleted = cursor.rowcount
+                        self._progress(cursor, job_id, 'tickets', deleted)
+                        conn.commit()
+                        self._count(batches=1, tickets=deleted)
+                        if deleted < self.batch_size:
+                            break
+                        time.sleep(self.pause)
+
+            # 票券都刪完了，剩下的資料量很小，一個交易刪完
+            # (刪除期間若仍有結帳寫入票券，外鍵會讓這個交易失敗，下次重試時再從票券開始)
+            cursor.execute("DELETE FROM InventoryHolds WHERE session_id IN (SELECT session_id FROM Sessions WHERE exhibition_id = ?)",
+                           (exhibition_id,))
+            cursor.execute("DELETE FROM Sessions WHERE exhibition_id = ?", (exhibition_id,))
+            cursor.execute("DELETE FROM TicketTypes WHERE exhibition_id = ?", (exhibition_id,))
+            cursor.execute("DELETE FROM Exhibitions WHERE exhibition_id = ?", (exhibition_id,))
+            forget_exhibition(cursor, exhibition_id)
+            self._progress(cursor, job_id, 'done')
+            cursor.execute("""
+                UPDATE PurgeJobs SET status = 'Done', finished_at = ?, locked_by = NULL, locked_until = NULL, last_error = NULL
+                WHERE job_id = ?
+            """, (datetime.now(), job_id))
+            conn.commit()
+
+        if self.on_done:
+            try:
+                self.on_done(job)
+            except Exception as e:
+                print(f"展覽刪除完成後的清理失敗: {e}")
+
+    # --- 進度 ---
+    @staticmethod
+    def _percent(job):
+        if job['status'] == 'Done':
+            return 100
+        if job['total_tickets']:
+            return min(99, job['deleted_tickets'] * 100 // job['total_tickets'])
+        return 0
+
+    def jobs(self, conn, limit=20):
+        """最近的刪除工作 (新到舊)，每筆附上進度百分比 percent"""
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT job_id, exhibition_id, status, phase, total_tickets, deleted_tickets, attempts, last_error,
+                       locked_by, created_at, finished_at
+                FROM PurgeJobs ORDER BY job_id DESC {self.db.limit(limit)}
+            """)
+            jobs = [row._asdict() for row in fetch_all(cursor)]
+        for job in jobs:
+            job['percent'] = self._percent(job)
+        return jobs
+
+    def progress(self, cursor, exhibition_ids):
+        """{exhibition_id: 進度百分比}，只包含尚未完成的工作 (後台列表顯示用)"""
+        if not exhibition_ids:
+            return {}
+        cursor.execute(f"""
+            SELECT exhibition_id, status, total_tickets, deleted_tickets FROM PurgeJobs
+            WHERE status = 'Pending' AND exhibition_id IN ({','.join('?' * len(exhibition_ids))})
+        """, list(exhibition_ids))
+        return {row['exhibition_id']: self._percent(row) for row in fetch_all(cursor)}
+
+    def _count(self, **counts):
+        with self._lock:
+            for key, n in counts.items():
+                self._stats[key] += n
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, batch_size=self.batch_size, pause=self.pause, running=self._worker is not None)
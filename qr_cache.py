@@ -0,0 +1,204 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import qrcode
+
+
+def render_png(data, box_size=10, border=4):
+    """產生 QR Code PNG 圖檔 (bytes)"""
+    qr = qrcode.QRCode(box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white").convert('RGB')
+    buf = io.BytesIO()
+    img.save(buf, format='PNG', optimize=True)
+    return buf.getvalue()
+
+
+def render_svg(data, box_size=10, border=4):
+    """
+    產生 QR Code SVG (bytes)，直接由模組矩陣輸出向量路徑，完全不經過 PIL
+    同一列相鄰的黑色模組合併成一段水平線段，減少路徑長度
+    """
+    qr = qrcode.QRCode(box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()  # 已包含外框 (border)
+    size = len(matrix)
+
+    parts = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if row[x]:
+                start = x
+                while x < size and row[x]:
+                    x += 1
+                parts.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+            else:
+                x += 1
+
+    pixels = size * box_size
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path fill="#000" d="{"".join(parts)}"/></svg>'
+    )
+    return svg.encode('utf-8')
+
+
+class QRCodeCache:
+    """
+    QR Code 圖檔快取
+    - 第一層：行程內 LRU，key 為 (資料, 格式, 繪製參數)
+    - 第二層 (選用)：磁碟上以 key 雜湊命名的檔案，重啟或多個 worker 之間可共用
+      最多保留 disk_max_files 個檔案，超過時刪除最舊的一批；只有 persist 為真的資料 (確實存在的票券) 才寫入磁碟
+    每個項目都附帶以內容雜湊計算的強 ETag
+    """
+
+    renderers = {
+        'png': (render_png, 'image/png'),
+        'svg': (render_svg, 'image/svg+xml'),
+    }
+
+    def __init__(self, max_entries=2048, disk_dir=None, box_size=10, border=4, prerender_workers=2,
+                 disk_max_files=50000):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_files = disk_max_files
+        self._disk_files = None  # 磁碟上的檔案數，第一次寫入時才掃描
+        self.box_size = box_size
+        self.border = border
+        self._entries = OrderedDict()  # key -> (body, etag)
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()  # 計算檔案數與清除舊檔時使用，不擋住記憶體快取
+        self._executor = ThreadPoolExecutor(max_workers=prerender_workers, thread_name_prefix='qr-prerender')
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'disk_pruned': 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def mimetype(self, fmt='png'):
+        return self.renderers[fmt][1]
+
+    def _key(self, data, fmt):
+        return (data, fmt, self.box_size, self.border)
+
+    def _disk_path(self, key):
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, digest[:2], f"{digest}.{key[1]}")
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, data, fmt='png', persist=True):
+        """
+        回傳 (圖檔內容, ETag)；快取沒有時才重新繪製
+        persist 為 False (或回傳 False 的函式，只在記憶體快取沒有時才呼叫) 時只放在記憶體，不讀寫磁碟
+        """
+        key = self._key(data, fmt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry
+
+        if callable(persist):
+            persist = persist()
+        use_disk = bool(self.disk_dir and persist)
+
+        body = None
+        if use_disk:
+            try:
+                with open(self._disk_path(key), 'rb') as f:
+                    body = f.read()
+                with self._lock:
+                    self._stats['disk_hits'] += 1
+            except OSError:
+                body = None
+
+        if body is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            render, _ = self.renderers[fmt]
+            body = render(data, box_size=self.box_size, border=self.border)
+            if use_disk:
+                self._write_disk(self._disk_path(key), body)
+
+        entry = (body, hashlib.sha256(body).hexdigest()[:32])
+        self._remember(key, entry)
+        return entry
+
+    def _disk_listing(self):
+        """磁碟快取中的所有檔案 [(修改時間, 路徑)]"""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        return files
+
+    def _write_disk(self, path, body):
+        # 先寫暫存檔再改名，避免其他 worker 讀到寫到一半的檔案
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"QR Code 寫入磁碟快取失敗: {e}")
+            return
+
+        with self._disk_lock:
+            if self._disk_files is None:
+                self._disk_files = len(self._disk_listing())
+            else:
+                self._disk_files += 1
+            if self._disk_files <= self.disk_max_files:
+                return
+            # 超過上限：重新掃描 (其他 worker 也會寫入)，刪除最舊的檔案直到剩下九成
+            files = sorted(self._disk_listing())
+            excess = len(files) - int(self.disk_max_files * 0.9)
+            pruned = 0
+            for _, old_path in files[:max(0, excess)]:
+                try:
+                    os.remove(old_path)
+                    pruned += 1
+                except OSError:
+                    pass
+            self._disk_files = len(files) - pruned
+        with self._lock:
+            self._stats['disk_pruned'] += pruned
+
+    def get_many(self, items, fmt='svg'):
+        """一次取得多張票的 QR Code，回傳 {資料: 圖檔內容}"""
+        return {data: self.get(data, fmt)[0] for data in items}
+
+    def prerender(self, items, fmt='png'):
+        """在背景執行緒預先產生 QR Code (例如結帳完成時)，不阻塞目前的請求"""
+        for data in items:
+            self._executor.submit(self._prerender_one, data, fmt)
+
+    def _prerender_one(self, data, fmt):
+        try:
+            self.get(data, fmt)
+        except Exception as e:
+            print(f"預先產生 QR Code 失敗: {e}")
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), max_entries=self.max_entries,
+                        disk_files=self._disk_files, disk_max_files=self.disk_max_files)
@@ -0,0 +1,82 @@
+from collections import namedtuple
+
+
+class RecordMixin:
+    """
+    讓查詢結果同時支援屬性與 key 存取：ex.title、ex['title']、ex.get('title')
+    實際資料存在 tuple 中，欄位名稱與位置由同一個結果集的所有資料列共用
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return tuple.__getitem__(self, self._index[key])
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def keys(self):
+        return self._columns
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self._columns, self)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def to_dict(self):
+        return dict(zip(self._columns, self))
+
+
+_record_types = {}
+
+
+def record_type(columns):
+    """依欄位名稱取得 (或建立) 對應的 Record 類別，相同欄位組合只建立一次"""
+    columns = tuple(columns)
+    cls = _record_types.get(columns)
+    if cls is None:
+        # rename=True：欄位名稱不是合法識別字時 (例如 COUNT(*)) 改用 _0、_1 當屬性名稱，key 存取仍用原名
+        base = namedtuple('Record', columns, rename=True)
+        cls = type('Record', (RecordMixin, base), {
+            '__slots__': (),
+            '_columns': columns,
+            '_index': {name: i for i, name in enumerate(columns)},
+        })
+        _record_types[columns] = cls
+    return cls
+
+
+def columns_of(cursor):
+    return tuple(column[0] for column in cursor.description)
+
+
+def map_row(cursor, row):
+    """單筆資料轉成 Record；沒有資料時回傳 None"""
+    if row is None:
+        return None
+    return tuple.__new__(record_type(columns_of(cursor)), row)
+
+
+def map_rows(cursor, rows):
+    """整個結果集只計算一次欄位資訊，再逐筆轉成 Record"""
+    make = tuple.__new__
+    cls = record_type(columns_of(cursor))
+    return [make(cls, row) for row in rows]
+
+
+def fetch_one(cursor):
+    return map_row(cursor, cursor.fetchone())
+
+
+def fetch_all(cursor):
+    return map_rows(cursor, cursor.fetchall())
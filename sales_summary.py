@@ -0,0 +1,249 @@
+"""
+銷售彙總表 (sales summary)
+
+後台的銷售數字只讀這幾張彙總表，不再對 Tickets / Orders 做即時的 GROUP BY，資料量再大查詢成本也不變：
+    SalesBySession     各場次售出張數與營收 (剩餘座位直接讀 Sessions.capacity)
+    SalesByTicketType  各票種售出張數與營收 (加總即為展覽的總數)
+    SalesByDay         每日、每個展覽的訂單數、售出張數與營收
+
+彙總表在結帳的交易中以 record_sales() 增量更新 (commit 前最後一步，鎖住彙總列的時間很短)；
+退票 / 取消訂單時以 sign=-1 呼叫即可扣回。展覽被刪除時由 forget_exhibition() 一併清除。
+只計入已付款 (Paid) 訂單，營收以票種價格計算 (與結帳時的計算方式相同)。
+
+執行方式 (在專案根目錄)：
+    python sales_summary.py --rebuild    由明細重新計算所有彙總表
+    python sales_summary.py --check      比對彙總表與明細重新計算的結果 (不寫入)
+"""
+import argparse
+from datetime import date, datetime, timedelta
+
+from db_backends import get_dialect
+from row_mapping import fetch_all
+
+# 資料表 -> (鍵欄位, 累加欄位)
+SUMMARY_TABLES = {
+    'SalesBySession': (('exhibition_id', 'session_id'), ('tickets_sold', 'revenue')),
+    'SalesByTicketType': (('exhibition_id', 'ticket_type_id'), ('tickets_sold', 'revenue')),
+    'SalesByDay': (('sales_date', 'exhibition_id'), ('orders', 'tickets_sold', 'revenue')),
+}
+
+
+def _aggregate_sql(db, table):
+    """由明細計算彙總表內容的查詢 (欄位順序同 SUMMARY_TABLES)"""
+    paid_tickets = """
+        FROM Tickets T
+        JOIN Orders O ON T.order_id = O.order_id
+        JOIN TicketTypes TT ON T.ticket_type_id = TT.ticket_type_id
+    """
+    if table == 'SalesBySession':
+        return f"""
+            SELECT S.exhibition_id, T.session_id, COUNT(*), SUM(TT.price)
+            {paid_tickets}
+            JOIN Sessions S ON T.session_id = S.session_id
+            WHERE O.status = 'Paid'
+            GROUP BY S.exhibition_id, T.session_id
+        """
+    if table == 'SalesByTicketType':
+        return f"""
+            SELECT TT.exhibition_id, T.ticket_type_id, COUNT(*), SUM(TT.price)
+            {paid_tickets}
+            WHERE O.status = 'Paid'
+            GROUP BY TT.exhibition_id, T.ticket_type_id
+        """
+    day = db.date_sql('O.order_date')
+    return f"""
+        SELECT {day}, TT.exhibition_id, COUNT(DISTINCT O.order_id), COUNT(*), SUM(TT.price)
+        {paid_tickets}
+        WHERE O.status = 'Paid'
+        GROUP BY {day}, TT.exhibition_id
+    """
+
+
+def rebuild_statements(db):
+    """清空並重新計算所有彙總表的 SQL 語句列表 (--rebuild 用；migration 6 使用自己的固定副本)"""
+    statements = []
+    for table, (keys, counters) in SUMMARY_TABLES.items():
+        statements.append(f"DELETE FROM {table}")
+        statements.append(f"INSERT INTO {table} ({', '.join(keys + counters)}) {_aggregate_sql(db, table)}")
+    return statements
+
+
+# ==========================================
+# 增量更新 (在呼叫端的交易中執行，由呼叫端 commit)
+# ==========================================
+
+def record_sales(db, cursor, items, day, sign=1):
+    """
+    items：結帳明細 (dict，需有 exhibition_id、session_id、ticket_type_id、quantity、subtotal)，同一筆訂單
+    day：訂單的 order_date (由資料庫產生，不能用應用程式主機的日期，否則與 --check 重新計算的結果不一致)
+    sign=-1 為退票 / 取消訂單 (扣回同樣的數字)
+    """
+    if isinstance(day, str):
+        day = datetime.fromisoformat(day)
+    if isinstance(day, datetime):
+        day = day.date()
+    by_session, by_type, by_day = {}, {}, {}
+    for item in items:
+        quantity, revenue = item['quantity'] * sign, item['subtotal'] * sign
+        for totals, key in ((by_session, (item['exhibition_id'], item['session_id'])),
+                            (by_type, (item['exhibition_id'], item['ticket_type_id'])),
+                            (by_day, (day, item['exhibition_id']))):
+            sold, amount = totals.get(key, (0, 0))
+            totals[key] = (sold + quantity, amount + revenue)
+
+    # 依鍵排序後寫入，併發的結帳以相同順序鎖定彙總列，避免死結
+    for table, totals in (('SalesBySession', by_session), ('SalesByTicketType', by_type)):
+        keys, counters = SUMMARY_TABLES[table]
+        db.executemany(cursor, db.upsert_add_sql(table, keys, counters),
+                       [key + value for key, value in sorted(totals.items())])
+    keys, counters = SUMMARY_TABLES['SalesByDay']
+    db.executemany(cursor, db.upsert_add_sql('SalesByDay', keys, counters),
+                   [key + (sign,) + value for key, value in sorted(by_day.items())])  # 每個展覽算一筆訂單
+
+
+def forget_exhibition(cursor, exhibition_id):
+    """展覽 (連同票券) 被刪除時清除它的彙總資料，與重新計算的結果一致"""
+    for table in SUMMARY_TABLES:
+        cursor.execute(f"DELETE FROM {table} WHERE exhibition_id = ?", (exhibition_id,))
+
+
+# ==========================================
+# 查詢 (後台報表，只讀彙總表)
+# ==========================================
+
+def exhibition_totals(db, cursor, limit=50):
+    """營收最高的展覽 (售出張數、營收)"""
+    cursor.execute(f"""
+        SELECT E.exhibition_id, E.title, E.status, S.tickets_sold, S.revenue
+        FROM (SELECT exhibition_id, SUM(tickets_sold) AS tickets_sold, SUM(revenue) AS revenue
+              FROM SalesByTicketType GROUP BY exhibition_id) S
+        JOIN Exhibitions E ON S.exhibition_id = E.exhibition_id
+        ORDER BY S.revenue DESC, E.exhibition_id DESC {db.limit(limit)}
+    """)
+    return fetch_all(cursor)
+
+
+def grand_total(cursor):
+    """全站累計 (售出張數, 營收)"""
+    cursor.execute("SELECT SUM(tickets_sold), SUM(revenue) FROM SalesByTicketType")
+    row = cursor.fetchone()
+    return (row[0] or 0, row[1] or 0) if row else (0, 0)
+
+
+def daily_sales(cursor, days=30, exhibition_id=None):
+    """最近 days 天的每日銷售 (新到舊)；訂單數依展覽計算，一筆訂單含多個展覽時各算一次"""
+    since = date.today() - timedelta(days=days - 1)
+    where, params = "sales_date >= ?", [since]
+    if exhibition_id is not None:
+        where, params = where + " AND exhibition_id = ?", params + [exhibition_id]
+    cursor.execute(f"""
+        SELECT sales_date, SUM(orders) AS orders, SUM(tickets_sold) AS tickets_sold, SUM(revenue) AS revenue
+        FROM SalesByDay WHERE {where}
+        GROUP BY sales_date ORDER BY sales_date DESC
+    """, params)
+    return fetch_all(cursor)
+
+
+def session_sales(cursor, exhibition_id):
+    """展覽各場次的售出張數、營收與目前可售座位 (已扣除保留中的座位)"""
+    cursor.execute("""
+        SELECT S.session_id, S.session_time, S.capacity AS remaining,
+               COALESCE(SS.tickets_sold, 0) AS tickets_sold, COALESCE(SS.revenue, 0) AS revenue
+        FROM Sessions S
+        LEFT JOIN SalesBySession SS ON SS.exhibition_id = S.exhibition_id AND SS.session_id = S.session_id
+        WHERE S.exhibition_id = ?
+        ORDER BY S.session_time
+    """, (exhibition_id,))
+    return fetch_all(cursor)
+
+
+def ticket_type_sales(cursor, exhibition_id):
+    """展覽各票種的售出張數與營收"""
+    cursor.execute("""
+        SELECT TT.ticket_type_id, TT.name, TT.price,
+               COALESCE(ST.tickets_sold, 0) AS tickets_sold, COALESCE(ST.revenue, 0) AS revenue
+        FROM TicketTypes TT
+        LEFT JOIN SalesByTicketType ST ON ST.exhibition_id = TT.exhibition_id AND ST.ticket_type_id = TT.ticket_type_id
+        WHERE TT.exhibition_id = ?
+        ORDER BY TT.ticket_type_id
+    """, (exhibition_id,))
+    return fetch_all(cursor)
+
+
+# ==========================================
+# 重新計算 / 檢查
+# ==========================================
+
+def rebuild(conn, db):
+    """在一個交易中重新計算所有彙總表，回傳 {資料表: 筆數}"""
+    cursor = conn.cursor()
+    try:
+        for statement in rebuild_statements(db):
+            cursor.execute(statement)
+        counts = {}
+        for table in SUMMARY_TABLES:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            counts[table] = cursor.fetchone()[0]
+        conn.commit()
+        return counts
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _key(row, count):
+    # SQLite 的 date() 回傳文字，資料表欄位則轉成 date；統一成文字再比對
+    return tuple(value.isoformat() if isinstance(value, date) else value for value in row[:count])
+
+
+def _same(a, b):
+    return all(abs(float(x) - float(y)) < 0.005 for x, y in zip(a, b))
+
+
+def check(conn, db):
+    """比對彙總表與明細重新計算的結果，回傳 {資料表: [(鍵, 彙總表的值, 重新計算的值), ...]}"""
+    cursor = conn.cursor()
+    differences = {}
+    for table, (keys, counters) in SUMMARY_TABLES.items():
+        cursor.execute(_aggregate_sql(db, table))
+        expected = {_key(row, len(keys)): tuple(row[len(keys):]) for row in cursor.fetchall()}
+        cursor.execute(f"SELECT {', '.join(keys + counters)} FROM {table}")
+        actual = {_key(row, len(keys)): tuple(row[len(keys):]) for row in cursor.fetchall()}
+        # 沒有資料列與全部為 0 視為相同 (退票扣回後會留下 0 的資料列)；營收比對到分
+        zero = (0,) * len(counters)
+        differences[table] = [(key, actual.get(key), expected.get(key)) for key in sorted(set(expected) | set(actual), key=str)
+                              if not _same(actual.get(key, zero), expected.get(key, zero))]
+    conn.commit()
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rebuild', action='store_true', help='由明細重新計算所有彙總表')
+    parser.add_argument('--check', action='store_true', help='比對彙總表與明細重新計算的結果')
+    parser.add_argument('--backend', choices=['mssql', 'sqlite'], help='資料庫後端 (預設讀取環境變數 DB_BACKEND)')
+    args = parser.parse_args()
+    if not (args.rebuild or args.check):
+        parser.error('請指定 --rebuild 或 --check')
+
+    db = get_dialect(args.backend)
+    conn = db.connect()
+    try:
+        if args.rebuild:
+            for table, count in rebuild(conn, db).items():
+                print(f"{table}: {count:,} 筆")
+        if args.check:
+            total = 0
+            for table, rows in check(conn, db).items():
+                total += len(rows)
+                print(f"{table}: {'一致' if not rows else f'{len(rows)} 筆不一致'}")
+                for key, actual, expected in rows[:10]:
+                    print(f"   {key}: 彙總表 {actual}，明細 {expected}")
+            if total:
+                raise SystemExit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import math
+import re
+import threading
+import time
+
+# 中日韓文字 (含擴充區與日文假名、韓文)
+_CJK_RUN = r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+'
+_TOKEN_RE = re.compile(rf'({_CJK_RUN})|([0-9A-Za-z]+)')
+
+# 欄位權重：標題 > 地點 > 介紹
+FIELD_WEIGHTS = {'title': 3.0, 'location': 2.0, 'description': 1.0}
+
+
+def tokenize(text, prefixes=False):
+    """
+    斷詞
+    - 中日韓文字：單字 + 相鄰二字 (bigram)，例如「寶可夢」-> 寶、可、夢、寶可、可夢
+    - 英數字：轉小寫的整個單字；prefixes=True 時另外加入長度 >= 2 的字首，讓「team」也能找到「teamLab」
+    """
+    tokens = []
+    if not text:
+        return tokens
+    for cjk, word in _TOKEN_RE.findall(text):
+        if cjk:
+            tokens.extend(cjk)
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        else:
+            word = word.lower()
+            tokens.append(word)
+            if prefixes:
+                tokens.extend(word[:i] for i in range(2, len(word)))
+    return tokens
+
+
+def query_terms(text):
+    """
+    查詢字串斷詞：中文有二字以上時只用 bigram (單字已被 bigram 涵蓋)，只有一個字時才用單字
+    """
+    terms = []
+    for cjk, word in _TOKEN_RE.findall(text or ''):
+        if cjk:
+            if len(cjk) == 1:
+                terms.append(cjk)
+            else:
+                terms.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        else:
+            terms.append(word.lower())
+    return list(dict.fromkeys(terms))
+
+
+class SearchIndex:
+    """
+    展覽全文檢索的記憶體反向索引
+    - 索引標題、地點、介紹三個欄位，依欄位權重與 IDF 排序
+    - 後台新增 / 修改 / 刪除展覽時以 upsert() / remove() 增量更新
+    - 超過 max_age 秒會整批重建，讓多個 worker 之間最終一致
+    """
+
+    def __init__(self, loader, sort_key=None, max_age=600):
+        self._loader = loader
+        self._sort_key = sort_key
+        self.max_age = max_age
+        self._docs = {}      # doc_id -> 原始資料 (dict)
+        self._postings = {}  # term -> {doc_id: 權重}
+        self._doc_terms = {}  # doc_id -> set(term)，刪除時用
+        self._built_at = None
+        self._lock = threading.RLock()
+
+    # --- 建立索引 ---
+    def _ensure_built(self):
+        if self._built_at is None or time.monotonic() - self._built_at > self.max_age:
+            self.rebuild()
+
+    def rebuild(self):
+        docs = self._loader()
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+            self._doc_terms.clear()
+            for doc in docs:
+                self._add(doc)
+            self._built_at = time.monotonic()
+
+    def _add(self, doc):
+        doc_id = doc['exhibition_id']
+        weights = {}
+        for field, field_weight in FIELD_WEIGHTS.items():
+            for term in tokenize(doc.get(field), prefixes=True):
+                weights[term] = weights.get(term, 0.0) + field_weight
+        for term, weight in weights.items():
+            self._postings.setdefault(term, {})[doc_id] = weight
+        self._docs[doc_id] = doc
+        self._doc_terms[doc_id] = set(weights)
+
+    def _remove(self, doc_id):
+        for term in self._doc_terms.pop(doc_id, ()):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._docs.pop(doc_id, None)
+
+    # --- 增量更新 ---
+    def upsert(self, doc, searchable=True):
+        """新增或更新一筆展覽；searchable=False (例如草稿) 則從索引移除"""
+        with self._lock:
+            if self._built_at is None:
+                return  # 尚未建立索引，第一次查詢時會整批載入
+            self._remove(doc['exhibition_id'])
+            if searchable:
+                self._add(doc)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    # --- 查詢 ---
+    def search(self, text, limit=None):
+        """回傳依相關度排序的展覽資料；所有查詢詞都必須出現 (AND)"""
+        terms = query_terms(text)
+        if not terms:
+            return []
+        self._ensure_built()
+        with self._lock:
+            total = len(self._docs) or 1
+            scores = None
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    return []
+                idf = math.log(1 + total / len(postings))
+                if scores is None:
+                    scores = {doc_id: weight * idf for doc_id, weight in postings.items()}
+                else:
+                    scores = {doc_id: score + postings[doc_id] * idf
+                              for doc_id, score in scores.items() if doc_id in postings}
+                    if not scores:
+                        return []
+            docs = [self._docs[doc_id] for doc_id in scores]
+
+        # 相關度相同時沿用目錄排序 (例如：上架中在前、開始日期新到舊)
+        if self._sort_key:
+            docs.sort(key=self._sort_key)
+        docs.sort(key=lambda doc: scores[doc['exhibition_id']], reverse=True)
+        return docs[:limit] if limit else docs
+
+    def stats(self):
+        with self._lock:
+            return {'documents': len(self._docs), 'terms': len(self._postings),
+                    'age': None if self._built_at is None else round(time.monotonic() - self._built_at, 1)}
@@ -0,0 +1,222 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """資料存在伺服器端的 Session，cookie 只帶一個不透明的 session id"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+# ==========================================
+# 儲存後端
+# 每個後端都提供 get / set / delete / purge_expired
+# ==========================================
+
+class MemoryStore:
+    """
+    行程內 LRU 快取 (含 TTL)
+    注意：資料只存在單一行程中，多個 worker 時請改用 SQLiteStore
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # sid -> (expires_at, payload)
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._data[sid]
+                return None
+            self._data.move_to_end(sid)
+            return entry[1]
+
+    def set(self, sid, payload, ttl):
+        with self._lock:
+            self._data[sid] = (time.time() + ttl, payload)
+            self._data.move_to_end(sid)
+            # 超過上限時淘汰最久沒用到的 session
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def purge_expired(self, batch_size=500):
+        """批次刪除過期資料，回傳刪除筆數"""
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, (expires_at, _) in self._data.items() if expires_at <= now][:batch_size]
+            for sid in expired:
+                del self._data[sid]
+        return len(expired)
+
+
+class SQLiteStore:
+    """本機磁碟 SQLite 後端，同一台機器上的多個 worker 可共用"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                expires_at REAL NOT NULL,
+                payload TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)")
+        conn.commit()
+
+    def _conn(self):
+        # sqlite3 連線不能跨執行緒共用，每個執行緒各自開一條
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._conn().execute(
+            "SELECT payload FROM sessions WHERE sid = ? AND expires_at > ?", (sid, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, sid, payload, ttl):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (sid, expires_at, payload) VALUES (?, ?, ?)",
+            (sid, time.time() + ttl, payload)
+        )
+        conn.commit()
+
+    def delete(self, sid):
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        conn.commit()
+
+    def purge_expired(self, batch_size=500):
+        """批次刪除過期資料，避免一次刪除太多筆鎖住整個資料庫"""
+        conn = self._conn()
+        cursor = conn.execute("""
+            DELETE FROM sessions WHERE sid IN (
+                SELECT sid FROM sessions WHERE expires_at <= ? LIMIT ?
+            )
+        """, (time.time(), batch_size))
+        conn.commit()
+        return cursor.rowcount
+
+
+# ==========================================
+# Flask Session Interface
+# ==========================================
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    以伺服器端儲存取代 Flask 預設的 cookie session
+    - 存活時間沿用 app.permanent_session_lifetime
+    - 每隔 purge_interval 秒，於請求結束時批次清除過期的 session
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, purge_interval=60, purge_batch_size=500):
+        self.store = store
+        self.purge_interval = purge_interval
+        self.purge_batch_size = purge_batch_size
+        self._next_purge = time.time() + purge_interval
+        self._purge_lock = threading.Lock()
+
+    def _new_sid(self):
+        return secrets.token_urlsafe(32)
+
+    def regenerate(self, session):
+        """
+        換發新的 session id 並刪除舊的伺服器端資料 (內容保留)，回傳舊的 session id
+        登入、登出等權限改變時呼叫，避免事先被植入的 session id 在登入後沿用 (session fixation)
+        """
+        old_sid = session.sid
+        self.store.delete(old_sid)
+        session.sid = self._new_sid()
+        session.modified = True
+        return old_sid
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            payload = self.store.get(sid)
+            if payload is not None:
+                try:
+                    return ServerSideSession(self.serializer.loads(payload), sid=sid)
+                except ValueError:
+                    pass
+        return ServerSideSession(sid=self._new_sid(), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        ttl = int(app.permanent_session_lifetime.total_seconds())
+
+        self._maybe_purge()
+
+        # Session 被清空：刪除伺服器端資料與 cookie
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        # 每次寫入都會重設 TTL，達成「閒置 30 分鐘才過期」
+        self.store.set(session.sid, self.serializer.dumps(dict(session)), ttl)
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now < self._next_purge or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_purge = now + self.purge_interval
+            self.store.purge_expired(self.purge_batch_size)
+        except Exception as e:
+            print(f"清除過期 Session 失敗: {e}")
+        finally:
+            self._purge_lock.release()
@@ -0,0 +1,59 @@
+"""
+票券編號 (ticket id)
+
+Tickets 的主鍵原本是 uuid4 字串 VARCHAR(36)：隨機值讓叢集索引每次都插在隨機位置 (頁面分裂)，
+36 bytes 的鍵又會重複存放在每個非叢集索引中。
+現在改存 16 bytes 的二進位值，格式同 UUIDv7：
+- 前 48 bits 為毫秒時間戳記，新票券一律接在索引尾端
+- 同一毫秒內以 12 bits 的序號遞增，同一行程產生的編號嚴格遞增
+- 其餘 62 bits 為隨機值 (核銷時仍需要展覽的核銷碼)
+QR code、網址與 API 仍使用標準的 UUID 文字格式 (8-4-4-4-12)；舊的 uuid4 票券轉成二進位後文字不變，已發出的 QR code 仍然有效。
+"""
+import random
+import threading
+import time
+import uuid
+
+_system_random = random.SystemRandom()
+_lock = threading.Lock()
+_last = [0, 0]  # 上一個編號的 (毫秒, 序號)
+
+
+def new_ticket_id(when=None, rng=None):
+    """
+    產生新的票券編號 (16 bytes)
+    when：指定時間 (datetime，產生模擬資料用)，預設為現在；rng：指定亂數產生器 (可重現)
+    """
+    rng = rng or _system_random
+    if when is None:
+        with _lock:
+            ms = time.time_ns() // 1_000_000
+            if ms <= _last[0]:
+                # 同一毫秒 (或時鐘倒退)：沿用上一個時間戳記，序號加一；用完就借用下一毫秒
+                ms, seq = _last[0], _last[1] + 1
+                if seq > 0xFFF:
+                    ms, seq = ms + 1, 0
+            else:
+                seq = rng.getrandbits(11)  # 只用一半的範圍當起點，留空間給同一毫秒內的後續編號
+            _last[0], _last[1] = ms, seq
+    else:
+        ms = int(when.timestamp() * 1000)
+        seq = rng.getrandbits(12)
+
+    value = ((ms & 0xFFFF_FFFF_FFFF) << 80) | (0x7 << 76) | (seq << 64) | (0b10 << 62) | rng.getrandbits(62)
+    return value.to_bytes(16, 'big')
+
+
+def ticket_id_text(value):
+    """二進位編號 -> 文字 (QR code、網址、API 使用)"""
+    return str(uuid.UUID(bytes=bytes(value)))
+
+
+def parse_ticket_id(text):
+    """文字 -> 二進位編號；格式不正確時回傳 None"""
+    if not isinstance(text, str) or len(text) > 64:
+        return None
+    try:
+        return uuid.UUID(text).bytes
+    except ValueError:
+        return None